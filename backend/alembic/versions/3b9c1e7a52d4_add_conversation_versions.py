@@ -0,0 +1,33 @@
+"""Add conversation_versions for message list ETags
+
+Revision ID: 3b9c1e7a52d4
+Revises: 047eaa01b4cb
+Create Date: 2026-10-19 09:12:44.201733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9c1e7a52d4'
+down_revision: Union[str, None] = '047eaa01b4cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'conversation_versions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('context', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'context'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('conversation_versions')
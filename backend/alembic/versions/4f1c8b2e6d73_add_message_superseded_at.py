@@ -0,0 +1,30 @@
+"""Add superseded_at to messages and messages_archive
+
+Revision ID: 4f1c8b2e6d73
+Revises: c0e84f6a2d95
+Create Date: 2026-10-19 18:42:10.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c8b2e6d73'
+down_revision: Union[str, None] = 'c0e84f6a2d95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('superseded_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('messages_archive', sa.Column('superseded_at', sa.DateTime(timezone=True), nullable=True))
+    # When existing rows were flagged is unknown; count their retention from now rather than purge early
+    op.execute("UPDATE messages SET superseded_at = now() WHERE is_edited OR is_deleted")
+
+
+def downgrade() -> None:
+    op.drop_column('messages_archive', 'superseded_at')
+    op.drop_column('messages', 'superseded_at')
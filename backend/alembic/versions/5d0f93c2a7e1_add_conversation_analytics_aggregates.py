@@ -0,0 +1,54 @@
+"""Add context_daily_stats and user_context_stats aggregates
+
+Revision ID: 5d0f93c2a7e1
+Revises: e2a6b4d81f37
+Create Date: 2026-10-19 14:31:09.640158
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0f93c2a7e1'
+down_revision: Union[str, None] = 'e2a6b4d81f37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _counter_columns():
+    return [
+        sa.Column('user_messages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('assistant_messages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('edits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('deletes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('fallbacks', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_ms_total', sa.Float(), nullable=False, server_default='0'),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'context_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('context', sa.String(), nullable=False),
+        *_counter_columns(),
+        sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('day', 'context'),
+    )
+    op.create_table(
+        'user_context_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('context', sa.String(), nullable=False),
+        *_counter_columns(),
+        sa.Column('last_active_day', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'context'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_context_stats')
+    op.drop_table('context_daily_stats')
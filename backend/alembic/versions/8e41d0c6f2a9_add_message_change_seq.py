@@ -0,0 +1,47 @@
+"""Add change_seq to messages and per-user change counters
+
+Revision ID: 8e41d0c6f2a9
+Revises: 3b9c1e7a52d4
+Create Date: 2026-10-19 10:03:17.554120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41d0c6f2a9'
+down_revision: Union[str, None] = '3b9c1e7a52d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('change_seq', sa.BigInteger(), nullable=True))
+    op.create_index('idx_user_change_seq', 'messages', ['user_id', 'change_seq'], unique=False)
+    op.create_table(
+        'message_change_counters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('last_seq', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+    # Existing rows get their id as sequence, which preserves insertion order
+    op.execute("UPDATE messages SET change_seq = id")
+    op.execute(
+        """
+        INSERT INTO message_change_counters (user_id, last_seq)
+        SELECT user_id, MAX(id) FROM messages
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('message_change_counters')
+    op.drop_index('idx_user_change_seq', table_name='messages')
+    op.drop_column('messages', 'change_seq')
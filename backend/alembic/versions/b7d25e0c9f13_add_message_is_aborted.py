@@ -0,0 +1,26 @@
+"""Add is_aborted to messages
+
+Revision ID: b7d25e0c9f13
+Revises: a93e7c1d4b62
+Create Date: 2026-10-19 15:40:22.913604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d25e0c9f13'
+down_revision: Union[str, None] = 'a93e7c1d4b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('is_aborted', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'is_aborted')
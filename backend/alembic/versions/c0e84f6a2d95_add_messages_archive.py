@@ -0,0 +1,43 @@
+"""Add messages_archive for the retention job
+
+Revision ID: c0e84f6a2d95
+Revises: b7d25e0c9f13
+Create Date: 2026-10-19 16:05:47.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0e84f6a2d95'
+down_revision: Union[str, None] = 'b7d25e0c9f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'messages_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.Column('content', sa.String(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('context', sa.String(), nullable=True),
+        sa.Column('is_edited', sa.Boolean(), nullable=True),
+        sa.Column('is_deleted', sa.Boolean(), nullable=True),
+        sa.Column('is_aborted', sa.Boolean(), nullable=True),
+        sa.Column('change_seq', sa.BigInteger(), nullable=True),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_archive_user_timestamp', 'messages_archive', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_archive_user_timestamp', table_name='messages_archive')
+    op.drop_table('messages_archive')
@@ -0,0 +1,47 @@
+"""Add message_usage and daily_usage
+
+Revision ID: c57a2f9e1b08
+Revises: 8e41d0c6f2a9
+Create Date: 2026-10-19 11:26:05.913402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c57a2f9e1b08'
+down_revision: Union[str, None] = '8e41d0c6f2a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'message_usage',
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id']),
+        sa.PrimaryKeyConstraint('message_id'),
+    )
+    op.create_table(
+        'daily_usage',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('prompt_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('latency_ms_total', sa.Float(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'day'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('daily_usage')
+    op.drop_table('message_usage')
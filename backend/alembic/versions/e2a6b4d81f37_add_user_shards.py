@@ -0,0 +1,35 @@
+"""Add user_shards directory table
+
+Revision ID: e2a6b4d81f37
+Revises: c57a2f9e1b08
+Create Date: 2026-10-19 13:48:52.377016
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a6b4d81f37'
+down_revision: Union[str, None] = 'c57a2f9e1b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_shards',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.String(), nullable=False),
+        sa.Column('moving', sa.Boolean(), nullable=False, server_default='false'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_index(op.f('ix_user_shards_shard'), 'user_shards', ['shard'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_shards_shard'), table_name='user_shards')
+    op.drop_table('user_shards')
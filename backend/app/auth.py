@@ -3,13 +3,14 @@ from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, APIRouter
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from .database import get_db
+from .database import get_db, get_replica_db
 from .models.user import User
 from .schemas.user import UserCreate, UserRead
 import os
 from passlib.context import CryptContext
 from typing import Optional
 from .schemas.token import Token
+from . import profiling
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
@@ -33,7 +34,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserRead:
+def authenticate_token(token: str, db: Session) -> UserRead:
+    """
+    Resolve a JWT access token to its user, raising 401 if the token or user is invalid.
+    Shared by the bearer dependency and the WebSocket endpoint, which cannot use OAuth2PasswordBearer.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -51,6 +56,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     return UserRead.from_orm(user)
 
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+    replica_db: Optional[Session] = Depends(get_replica_db)
+) -> UserRead:
+    with profiling.span("auth"):
+        if replica_db is not None:
+            try:
+                return authenticate_token(token, replica_db)
+            except HTTPException:
+                # A just-registered user may not have reached the replica yet
+                pass
+        return authenticate_token(token, db)
+
 @router.get("/users/me", response_model=UserRead)
 def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
@@ -0,0 +1,171 @@
+# app/batch.py
+"""
+Batch generation: many user inputs for one context, answered concurrently.
+
+Each input goes through generate_response on its own session, on a dedicated thread pool, so a
+batch takes about as long as its slowest calls rather than the sum of them. A batch runs at most
+BATCH_CONCURRENCY calls at a time, and at most BATCH_MAX_RUNNING batches run at once per process;
+later ones wait for a slot, so one user's batch never holds up everyone else's. Every input sees
+the conversation as it was before the batch; the variants don't see each other.
+Results are yielded as they complete. Once all are in, the user/assistant pairs are written with
+one multi-row insert (plus one for their usage rows), in input order.
+
+An input whose call runs past LLM_REQUEST_TIMEOUT is stored as an aborted user message with no
+reply, like a single request that times out. If the client goes away, calls in flight are cancelled
+and nothing is stored. The user's shard placement is checked again when the batch is saved, since
+that can be minutes after the request arrived.
+"""
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Union
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import events, history, llm, models
+from .crud.analytics import record_stats
+from .crud.message import generate_response
+from .crud.usage import record_usage_batch
+from .crud.version import bump_version, next_change_seq
+from .dependencies import LLM_REQUEST_TIMEOUT
+from .importer import reserve_message_ids
+from .llm.cancellation import DISCONNECTED
+
+BATCH_MAX_INPUTS = int(os.getenv("BATCH_MAX_INPUTS", 50))
+# Calls in flight per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+# Batches generating at once in this process; the next one waits for a slot
+BATCH_MAX_RUNNING = int(os.getenv("BATCH_MAX_RUNNING", 4))
+# Calls run on their own threads, so batches never take the shared threadpool from sync endpoints;
+# each holds a DB connection while its prompt is assembled
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", BATCH_CONCURRENCY * BATCH_MAX_RUNNING))
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+# asyncio primitives belong to one event loop; there is one per worker, but tests start several
+_running: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _running_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _running.get(loop)
+    if slots is None:
+        slots = _running[loop] = asyncio.Semaphore(BATCH_MAX_RUNNING)
+    return slots
+
+
+@dataclass
+class BatchResult:
+    index: int
+    content: str
+    completion: Optional[llm.Completion] = None
+    error: Optional[str] = None  # cancellation reason when there is no completion
+
+
+class _Calls:
+    """Cancel tokens of one batch's running calls, so a disconnect can stop them all."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.running: set[llm.CancelToken] = set()
+        self.stopped = False
+
+    def start(self) -> llm.CancelToken:
+        # The deadline starts when the call does, not while it waits for a thread
+        cancel = llm.CancelToken(self.timeout)
+        self.running.add(cancel)
+        if self.stopped:
+            cancel.cancel(DISCONNECTED)
+        return cancel
+
+    def stop(self) -> None:
+        self.stopped = True
+        for cancel in list(self.running):
+            cancel.cancel(DISCONNECTED)
+
+
+def _generate_one(bind: Union[Engine, Connection], user_input: str, context: Optional[str], user_id: int,
+                  calls: _Calls) -> llm.Completion:
+    cancel = calls.start()
+    db = Session(bind=bind, autoflush=False)
+    try:
+        cancel.raise_if_cancelled()
+        return generate_response(user_input, context, db, user_id, cancel=cancel)
+    finally:
+        db.close()
+        calls.running.discard(cancel)
+
+
+async def generate(bind: Union[Engine, Connection], user_id: int, context: Optional[str], inputs: list[str],
+                   timeout: float = LLM_REQUEST_TIMEOUT) -> AsyncIterator[BatchResult]:
+    """Yield one BatchResult per input, in completion order."""
+    loop = asyncio.get_running_loop()
+    calls = _Calls(timeout)
+    concurrency = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index: int, user_input: str) -> BatchResult:
+        # Carry the request's context (profiling spans) into the batch thread
+        call = functools.partial(contextvars.copy_context().run, _generate_one, bind, user_input, context, user_id, calls)
+        try:
+            async with concurrency:
+                completion = await loop.run_in_executor(_executor, call)
+            return BatchResult(index, user_input, completion=completion)
+        except llm.Cancelled as e:
+            return BatchResult(index, user_input, error=e.reason)
+
+    async with _running_slots():
+        tasks = [asyncio.ensure_future(run(index, user_input)) for index, user_input in enumerate(inputs)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # Only does anything when the consumer stopped early (client disconnected)
+            calls.stop()
+            for task in tasks:
+                task.cancel()
+
+
+def save(db: Session, user_id: int, context: Optional[str], results: list[BatchResult],
+         started: datetime) -> list[dict]:
+    """Store the batch's messages in input order and return them as Message rows."""
+    results = sorted(results, key=lambda result: result.index)
+    count = sum(2 if result.completion is not None else 1 for result in results)
+    ids = iter(reserve_message_ids(db, count))
+    seqs = itertools.count(next_change_seq(db, user_id, count))
+    # Lists and prompt history order by timestamp, so every row gets its own, in input order,
+    # keeping each reply right after its user turn
+    timestamps = (started + timedelta(microseconds=offset) for offset in itertools.count())
+
+    rows, usages = [], []
+    for result in results:
+        user_row = {
+            "id": next(ids), "role": "user", "content": result.content, "timestamp": next(timestamps),
+            "user_id": user_id, "context": context, "is_edited": False, "is_deleted": False,
+            "is_aborted": result.completion is None, "parent_id": None, "change_seq": next(seqs),
+        }
+        rows.append(user_row)
+        if result.completion is not None:
+            rows.append({
+                **user_row, "id": next(ids), "role": "assistant", "content": result.completion.content,
+                "timestamp": next(timestamps), "is_aborted": False, "parent_id": user_row["id"], "change_seq": next(seqs),
+            })
+            usages.append((rows[-1]["id"], result.completion))
+
+    # Parents come before their replies, so the foreign key holds row by row
+    db.execute(insert(models.Message.__table__), rows)
+    record_usage_batch(db, user_id, usages)
+    bump_version(db, user_id, context)
+    record_stats(db, user_id, context, user_messages=len(results),
+                 completions=[completion for _, completion in usages])
+    db.commit()
+
+    history.conversation_changed(user_id, context)
+    events.publish_messages(user_id, events.MESSAGE_CREATED, *rows)
+    return rows
@@ -0,0 +1,60 @@
+# app/crud/analytics.py
+
+from datetime import date
+from typing import Optional, Sequence
+from sqlalchemy.orm import Session
+from .. import models
+from ..llm import Completion
+from .counters import increment, upsert_increment
+from .usage import today, FALLBACK_MODEL
+
+STAT_COLUMNS = ("user_messages", "assistant_messages", "edits", "deletes", "fallbacks", "latency_ms_total")
+
+
+def record_stats(db: Session, user_id: int, context: Optional[str], completion: Optional[Completion] = None,
+                 user_messages: int = 0, edits: int = 0, deletes: int = 0,
+                 completions: Sequence[Completion] = ()) -> None:
+    """
+    Add one write to the (day, context) and (user, context) aggregates.
+    Pass `completion` for an assistant reply, or `completions` for several written together.
+    Does not commit; call it before the write's commit.
+    """
+    context = context or ""
+    deltas = {"user_messages": user_messages, "edits": edits, "deletes": deletes}
+    completions = [completion] if completion is not None else list(completions)
+    if completions:
+        deltas["assistant_messages"] = len(completions)
+        deltas["fallbacks"] = sum(c.model == FALLBACK_MODEL for c in completions)
+        deltas["latency_ms_total"] = sum(c.latency_ms for c in completions)
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+
+    day = today()
+    key = {"user_id": user_id, "context": context}
+    daily_deltas = dict(deltas)
+    increment(db, models.UserContextStats, key, **deltas)
+    if user_messages:
+        # The row exists now. Only the writer whose update moves last_active_day to today counts the
+        # user as active; a concurrent first message waits on the row lock, then matches nothing
+        moved = db.query(models.UserContextStats).filter_by(**key).filter(
+            models.UserContextStats.last_active_day.is_distinct_from(day)
+        ).update({"last_active_day": day}, synchronize_session=False)
+        if moved:
+            daily_deltas["active_users"] = 1
+    # Every writer in the context shares this row: no read-then-lock, one upsert right before the commit
+    upsert_increment(db, models.ContextDailyStats, {"day": day, "context": context}, **daily_deltas)
+
+
+def get_context_stats(db: Session, start: date, end: date, context: Optional[str] = None) -> list[models.ContextDailyStats]:
+    query = db.query(models.ContextDailyStats).filter(
+        models.ContextDailyStats.day >= start,
+        models.ContextDailyStats.day <= end
+    )
+    if context is not None:
+        query = query.filter(models.ContextDailyStats.context == context)
+    return query.order_by(models.ContextDailyStats.day, models.ContextDailyStats.context).all()
+
+
+def get_user_stats(db: Session, user_id: int) -> list[models.UserContextStats]:
+    return db.query(models.UserContextStats).filter(
+        models.UserContextStats.user_id == user_id
+    ).order_by(models.UserContextStats.context).all()
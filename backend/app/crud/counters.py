@@ -0,0 +1,50 @@
+# app/crud/counters.py
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+
+def increment(db: Session, model, key: dict, **deltas) -> None:
+    """
+    Add `deltas` to the counter columns of the `model` row identified by `key`, creating it if needed.
+    Increments are issued as `col = col + n`, so concurrent writers never lose updates.
+    Does not commit.
+    """
+    row = db.query(model).filter_by(**key).with_for_update().first()
+    if row is None:
+        try:
+            # Savepoint: another request may create the row first
+            with db.begin_nested():
+                db.add(model(**key, **deltas))
+            return
+        except IntegrityError:
+            row = db.query(model).filter_by(**key).first()
+    for column, delta in deltas.items():
+        setattr(row, column, getattr(model, column) + delta)
+
+
+def upsert_increment(db: Session, model, key: dict, **deltas) -> None:
+    """
+    Same effect as increment, as a single INSERT ... ON CONFLICT DO UPDATE SET col = col + n and
+    without reading or locking the row first. Meant for rows shared by all users, such as per-day
+    aggregates: issue it last before the commit, so the row lock the update takes is held only briefly.
+    Does not commit.
+    """
+    dialect = db.get_bind(model).dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        increment(db, model, key, **deltas)
+        return
+    table = model.__table__
+    statement = insert(table).values(**key, **deltas)
+    if deltas:
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + statement.excluded[column] for column in deltas}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=list(key))
+    db.execute(statement)
@@ -1,45 +1,67 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from openai import OpenAI
-import os
+from sqlalchemy import and_, select
 from .. import models, schemas
-from typing import Optional
-from dotenv import load_dotenv
+from .version import record_change
+from .usage import record_usage, select_route, FALLBACK_MODEL
+from .analytics import record_stats
+from .. import events
+from .. import history
+from .. import intents
+from .. import knowledge
+from .. import llm
+from .. import profiling
+from typing import Iterator, Optional
+from datetime import datetime, timezone
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Always in the system prompt, so the persona stays grounded when retrieval finds nothing
+PRODUCT_SUMMARY = (
+    "Artisan creates AI Employees, called Artisans, and consolidates essential sales tools into a single platform; "
+    "Ava, the AI BDR, automates over 80% of the B2B outbound demand generation process.\n"
+)
 
 MessageModel = models.Message
-# Load environment variables from .env file
-load_dotenv()
 
-# Load key from .env
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def create_message(db: Session, message: schemas.MessageCreate, user_id: int, parent_id: Optional[int] = None) :
+def create_message(db: Session, message: schemas.MessageCreate, user_id: int, parent_id: Optional[int] = None,
+                   cancel: Optional[llm.CancelToken] = None) :
     # Create and store the user message
     db_message = models.Message(**message.dict(), user_id=user_id)
     db.add(db_message)
+    record_change(db, user_id, db_message.context, db_message)
+    record_stats(db, user_id, db_message.context, user_messages=1)
     db.commit()
     db.refresh(db_message)
+    history.message_written(user_id, db_message.context, db_message)
+    events.publish_messages(user_id, events.MESSAGE_CREATED, db_message)
 
     # Generate assistant response based on context and user history
     context = db_message.context
-    assistant_response = generate_response(db_message.content, context, db, user_id)
+    try:
+        completion = generate_response(db_message.content, context, db, user_id, cancel=cancel)
+    except llm.Cancelled:
+        abort_turn(db, user_id, db_message)
+        raise
 
     # Create and store the assistant's message
     db_assistant_message = models.Message(
         role="assistant",
-        content=assistant_response,
+        content=completion.content,
         user_id=user_id,
         context=context,
         parent_id=db_message.id
     )
     db.add(db_assistant_message)
+    record_change(db, user_id, context, db_assistant_message)
+    record_usage(db, db_assistant_message, completion)
+    record_stats(db, user_id, context, completion=completion)
     db.commit()
     db.refresh(db_assistant_message)
 
+    history.message_written(user_id, context, db_assistant_message)
+    events.publish_messages(user_id, events.MESSAGE_CREATED, db_assistant_message)
     # invalidate_cache(user_id, message.context)
     return db_message
 
@@ -54,78 +76,125 @@ def create_message(db: Session, message: schemas.MessageCreate, user_id: int, pa
 # Only messages with is_edited = False and is_deleted = False are included.
 # The LLM receives the system_prompt and the latest user_input.
 
-def generate_response(user_input: str, context: str, db: Session, user_id: int, history_limit: int = 5) -> str:
+def generate_response(user_input: str, context: str, db: Session, user_id: int, history_limit: int = 5,
+                      cancel: Optional[llm.CancelToken] = None) -> llm.Completion:
     """
-    Generate a response based on the user input, context, and recent user history using OpenAI's ChatCompletion.
+    Generate a response based on the user input, context, and recent user history using the routed LLM backend.
+    The returned Completion carries the model, token usage and latency alongside the text.
+    Raises llm.Cancelled when `cancel` fires (client gone or deadline passed) before the reply is complete.
     """
+    start = time.perf_counter()
     try:
-        # Fetch recent chat history specific to the context (e.g., Onboarding, Support, Marketing)
-        recent_messages = get_recent_messages_by_context(db, user_id, context=context, limit=history_limit)
-        # Reversing the list to have messages in chronological order (oldest first)
-        recent_messages = list(reversed(recent_messages))
-        user_history = " ".join([msg.content for msg in recent_messages if not msg.is_edited and not msg.is_deleted])
-
-        # Define enhanced system prompts based on context with rich company and product details
-        system_prompts = {
-            "Onboarding": (
-                f"Welcome to Artisan! We are pioneering the next Industrial Revolution by creating AI Employees called Artisans and consolidating essential sales tools into a single, exceptional platform. "
-                f"Ava, our AI Business Development Representative (BDR), is designed to automate over 80% of the B2B outbound demand generation process. "
-                f"She excels in lead discovery with access to over 300M B2B contacts, lead research from dozens of data sources, crafting and sending hyper-personalized emails, and managing deliverability with advanced tools like email warmup and placement tests. "
-                f"Previous interactions: {user_history}. "
-                f"You are Ava, an AI BDR within the Artisan platform. Guide the user through setting up the platform, demonstrate how to leverage Ava's capabilities for lead discovery, email personalization, and sales automation to enhance their outbound sales efforts."
-            ),
-            "Support": (
-                f"Hello! At Artisan, we aim to streamline your sales workflows with our AI Employees and comprehensive automation tools. "
-                f"Elijah, our AI Support Expert, specializes in troubleshooting and optimizing AI-powered sales workflows, ensuring seamless email deliverability, and integrating diverse data sources. "
-                f"Previous interactions: {user_history}. "
-                f"You are Elijah, an AI Support Expert at Artisan. Assist the user with any technical issues they encounter, provide step-by-step guidance on using Artisan's tools, and ensure their sales automation processes run smoothly."
-            ),
-            "Marketing": (
-                f"Welcome to Artisan's Marketing Suite! We offer a unified platform that integrates AI-driven email sequences, extensive lead research, and the latest sales promotions to elevate your marketing strategies. "
-                f"Lucas, our AI Marketing Strategist, provides insightful analytics, optimizes email campaigns, and offers strategic guidance to maximize your marketing ROI. "
-                f"Previous interactions: {user_history}. "
-                f"You are Lucas, an AI Marketing Strategist at Artisan. Provide the user with detailed insights into Artisan’s marketing solutions, demonstrate how to utilize AI-driven tools for email campaigns and lead research, and inform them about current promotions to enhance their marketing effectiveness."
+        # Curated FAQ answers are served locally, before any history lookup or LLM call
+        match = intents.fast_path(user_input, context)
+        if match is not None:
+            return llm.Completion(
+                content=match.intent.answer,
+                model=intents.INTENT_MODEL_PREFIX + match.intent.name,
+                latency_ms=(time.perf_counter() - start) * 1000
             )
-        }
-  
-        system_prompt = system_prompts.get(context, "You are an assistant. How can I assist you today?")
-
-        # Build the messages list
-        messages = [{"role": "system", "content": system_prompt}]
 
-        # Include conversation history
-        for msg in recent_messages:
-            if not msg.is_edited and not msg.is_deleted:
+        # Everything up to the LLM call counts as prompt assembly in request profiles
+        with profiling.span("prompt"):
+            # Fetch recent chat history specific to the context (e.g., Onboarding, Support, Marketing),
+            # from the in-process history cache when the conversation is warm
+            recent_messages = get_recent_history(db, user_id, context=context, limit=history_limit)
+            # Reversing the list to have messages in chronological order (oldest first)
+            recent_messages = list(reversed(recent_messages))
+            user_history = " ".join([msg.content for msg in recent_messages])
+
+            # Persona prompts stay short; product facts come from the knowledge index, only the chunks
+            # relevant to this message (app/knowledge/products.md). A follow-up such as "how much is it?"
+            # shares no words with the file, so the user's previous messages are searched along with it
+            earlier_inputs = [msg.content for msg in recent_messages if msg.role == "user"]
+            knowledge_query = " ".join([*earlier_inputs[-knowledge.KNOWLEDGE_HISTORY_MESSAGES:], user_input])
+            knowledge_chunks = knowledge.retrieve(knowledge_query)
+            product_info = PRODUCT_SUMMARY + (
+                f"Relevant product information:\n{knowledge.format_chunks(knowledge_chunks)}\n"
+                if knowledge_chunks else ""
+            )
+            system_prompts = {
+                "Onboarding": (
+                    f"{product_info}"
+                    f"Previous interactions: {user_history}. "
+                    f"You are Ava, an AI BDR within the Artisan platform. Guide the user through setting up the platform, demonstrate how to leverage Ava's capabilities for lead discovery, email personalization, and sales automation to enhance their outbound sales efforts."
+                ),
+                "Support": (
+                    f"{product_info}"
+                    f"Previous interactions: {user_history}. "
+                    f"You are Elijah, an AI Support Expert at Artisan. Assist the user with any technical issues they encounter, provide step-by-step guidance on using Artisan's tools, and ensure their sales automation processes run smoothly."
+                ),
+                "Marketing": (
+                    f"{product_info}"
+                    f"Previous interactions: {user_history}. "
+                    f"You are Lucas, an AI Marketing Strategist at Artisan. Provide the user with detailed insights into Artisan’s marketing solutions, demonstrate how to utilize AI-driven tools for email campaigns and lead research, and inform them about current promotions to enhance their marketing effectiveness."
+                )
+            }
+
+            system_prompt = system_prompts.get(context, "You are an assistant. How can I assist you today?")
+
+            # Build the messages list
+            messages = [{"role": "system", "content": system_prompt}]
+
+            # Include conversation history (edited and deleted messages are already left out)
+            for msg in recent_messages:
                 messages.append({"role": msg.role, "content": msg.content})
 
-        # Add the latest user input
-        messages.append({"role": "user", "content": user_input})
+            # Add the latest user input
+            messages.append({"role": "user", "content": user_input})
 
-        # Debug: Print messages sent to the LLM
-        print("Messages sent to LLM:")
-        for message in messages:
-            print(f"{message['role']}: {message['content']}")
+            # Prompts hold user content; they are only logged with DEBUG enabled for this module
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Messages sent to LLM:\n%s",
+                             "\n".join(f"{message['role']}: {message['content']}" for message in messages))
 
         # messages = [
         #     {"role": "system", "content": system_prompt},
         #     {"role": "user", "content": user_input}
         # ]
 
-        response = client.chat.completions.create(
-            model="gpt-4",  
-            messages=messages,
-            max_tokens=500,  
-            temperature=0.5
-        )
-        return response.choices[0].message.content.strip()
+        # Model, max_tokens and temperature come from the routing table (app/llm/routing.py),
+        # downgraded once the user's daily token budget is spent
+        route = select_route(db, user_id, context, messages)
+        if route is None:
+            return fallback_completion(user_input, context, start)
+        # Nothing is pending; end the transaction so the connection goes back to the pool during the LLM call
+        db.commit()
+        return llm.complete(messages, context=context, route=route, cancel=cancel)
 
-    except Exception as e:
-        print(f"Error generating response from OpenAI: {e}")
+    except llm.Cancelled:
+        raise
+    except Exception:
+        logger.exception("Error generating response from LLM")
         # Fallback response in case of an error
-        return fallback_response(user_input, context)
+        return fallback_completion(user_input, context, start)
 
 
-def handle_click_action(db: Session, user_id: int, action_type: str, context: str) -> models.Message:
+def fallback_completion(user_input: str, context: str, start: float) -> llm.Completion:
+    """
+    Wrap fallback_response as a Completion so fallback replies are recorded like generated ones.
+    """
+    return llm.Completion(
+        content=fallback_response(user_input, context),
+        model=FALLBACK_MODEL,
+        latency_ms=(time.perf_counter() - start) * 1000
+    )
+
+
+def abort_turn(db: Session, user_id: int, message: models.Message) -> None:
+    """
+    Mark a user message whose reply was cancelled, so clients can offer a retry.
+    No assistant row is written; committing returns the session's connection to the pool.
+    """
+    message.is_aborted = True
+    record_change(db, user_id, message.context, message)
+    db.commit()
+    events.publish_messages(user_id, events.MESSAGE_UPDATED, message)
+
+
+def handle_click_action(db: Session, user_id: int, action_type: str, context: str,
+                        cancel: Optional[llm.CancelToken] = None) -> models.Message:
+    start = time.perf_counter()
     try:
         system_prompts = {
             "Onboarding": "You are Ava, an AI BDR specializing in B2B sales automation.",
@@ -144,44 +213,56 @@ def handle_click_action(db: Session, user_id: int, action_type: str, context: st
 
         full_prompt = f"{system_prompt} {action_prompt}"
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": full_prompt},
-                {"role": "user", "content": ""}
-            ],
-            max_tokens=200,
-            temperature=0.7 if context == "Marketing" else 0.5
-        )
-
-        assistant_response = response.choices[0].message.content.strip()
+        messages = [
+            {"role": "system", "content": full_prompt},
+            {"role": "user", "content": ""}
+        ]
+        route = select_route(db, user_id, context, messages, action_type=action_type)
+        if route is None:
+            completion = fallback_completion("", context, start)
+        else:
+            db.commit()
+            completion = llm.complete(messages, context=context, route=route, cancel=cancel)
 
         # Create and store the assistant's message
         db_assistant_message = models.Message(
             role="assistant",
-            content=assistant_response,
+            content=completion.content,
             user_id=user_id,
             context=context
         )
         db.add(db_assistant_message)
+        record_change(db, user_id, context, db_assistant_message)
+        record_usage(db, db_assistant_message, completion)
+        record_stats(db, user_id, context, completion=completion)
         db.commit()
         db.refresh(db_assistant_message)
 
+        history.message_written(user_id, context, db_assistant_message)
+        events.publish_messages(user_id, events.MESSAGE_CREATED, db_assistant_message)
         return db_assistant_message
 
-    except Exception as e:
-        print(f"Error handling click action: {e}")
+    except llm.Cancelled:
+        raise
+    except Exception:
+        logger.exception("Error handling click action")
         # Fallback response in case of an error
-        fallback = fallback_response("", context)
+        db.rollback()
+        completion = fallback_completion("", context, start)
         db_assistant_message = models.Message(
             role="assistant",
-            content=fallback,
+            content=completion.content,
             user_id=user_id,
             context=context
         )
         db.add(db_assistant_message)
+        record_change(db, user_id, context, db_assistant_message)
+        record_usage(db, db_assistant_message, completion)
+        record_stats(db, user_id, context, completion=completion)
         db.commit()
         db.refresh(db_assistant_message)
+        history.message_written(user_id, context, db_assistant_message)
+        events.publish_messages(user_id, events.MESSAGE_CREATED, db_assistant_message)
         return db_assistant_message
 
 
@@ -198,7 +279,19 @@ def get_recent_messages_by_context(db: Session, user_id: int, context: str, limi
         models.Message.context == context,
         models.Message.is_deleted == False,
         models.Message.is_edited == False
-    ).order_by(models.Message.timestamp.desc()).limit(limit).all()
+    ).order_by(models.Message.timestamp.desc(), models.Message.id.desc()).limit(limit).all()
+
+def get_recent_history(db: Session, user_id: int, context: str, limit: int = 5) -> list:
+    """
+    Same messages as get_recent_messages_by_context, as history.HistoryRecord values (role, content,
+    timestamp) served from the history cache; the database is only queried on a miss.
+    """
+    if not history.enabled():
+        return get_recent_messages_by_context(db, user_id, context=context, limit=limit)
+    return history.cache.recent(
+        user_id, context, limit,
+        load=lambda depth: get_recent_messages_by_context(db, user_id, context=context, limit=depth)
+    )
 
 def get_messages(db: Session, user_id: int, skip: int = 0, limit: int = 10, context: Optional[str] = None) -> list[models.Message]:
     """
@@ -233,12 +326,76 @@ def get_messages(db: Session, user_id: int, skip: int = 0, limit: int = 10, cont
         )
     if context:
         query = query.filter(models.Message.context == context)
-    return query.order_by(models.Message.timestamp.asc()).offset(skip).limit(limit).all()
+    return query.order_by(models.Message.timestamp.asc(), models.Message.id.asc()).offset(skip).limit(limit).all()
+
+# Columns of the Message response schema, selected directly for the lean list path
+MESSAGE_COLUMNS = [MessageModel.__table__.c[name] for name in schemas.Message.model_fields]
+
+def get_message_rows(db: Session, user_id: int, skip: int = 0, limit: int = 10, context: Optional[str] = None) -> list[dict]:
+    """
+    Same result as get_messages, but as plain dicts of the response columns.
+    Skips ORM hydration and identity-map tracking; used by the list endpoint.
+    """
+    query = select(*MESSAGE_COLUMNS).where(
+        MessageModel.user_id == user_id,
+        MessageModel.is_edited == False,
+        MessageModel.is_deleted == False
+    )
+    if context:
+        query = query.where(MessageModel.context == context)
+    query = query.order_by(MessageModel.timestamp.asc(), MessageModel.id.asc()).offset(skip).limit(limit)
+    return [dict(row) for row in db.execute(query).mappings()]
+
+def iter_message_rows(db: Session, user_id: int, context: Optional[str] = None,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      batch_size: int = 1000) -> Iterator[list[dict]]:
+    """
+    Yield every message of a user (including edited and deleted ones) in id order, one batch at a time.
+    Each batch is a short keyset query streamed through a server-side cursor, and the transaction
+    is ended between batches so a long export never holds a snapshot open.
+    """
+    last_id = 0
+    while True:
+        query = select(*MESSAGE_COLUMNS).where(
+            MessageModel.user_id == user_id,
+            MessageModel.id > last_id
+        )
+        if context:
+            query = query.where(MessageModel.context == context)
+        if start:
+            query = query.where(MessageModel.timestamp >= start)
+        if end:
+            query = query.where(MessageModel.timestamp < end)
+        query = query.order_by(MessageModel.id.asc()).limit(batch_size)
+
+        result = db.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+        rows = [dict(row) for row in result.mappings()]
+        db.commit()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]["id"]
+
+def get_changes(db: Session, user_id: int, since: int = 0, limit: int = 100) -> list[models.Message]:
+    """
+    Fetch messages created, edited or deleted after the `since` change sequence, oldest change first.
+    Edited and deleted rows are included so clients can drop them (tombstones).
+    """
+    return db.query(models.Message).filter(
+        models.Message.user_id == user_id,
+        models.Message.change_seq > since
+    ).order_by(models.Message.change_seq.asc()).limit(limit).all()
 
 def fallback_response(user_input: str, context: str) -> str:
     """
-    Provide a simple, predefined fallback response.
+    Provide a predefined fallback response: the closest FAQ answer when one is related enough,
+    otherwise a generic reply for the context.
     """
+    match = intents.fallback(user_input, context)
+    if match is not None:
+        return match.intent.answer
     user_input_lower = user_input.lower()
     if context == "Onboarding":
         if "help" in user_input_lower:
@@ -269,7 +426,9 @@ def delete_message(db: Session, message_id: int, user_id: int) -> Optional[model
         return None
 
     # Mark the user message as deleted
+    now = datetime.now(timezone.utc)
     message.is_deleted = True
+    message.superseded_at = now
 
     # Fetch and mark the assistant's response as deleted
     assistant_response = db.query(models.Message).filter(
@@ -280,24 +439,32 @@ def delete_message(db: Session, message_id: int, user_id: int) -> Optional[model
 
     if assistant_response:
         assistant_response.is_deleted = True
+        assistant_response.superseded_at = now
 
+    record_change(db, user_id, message.context, *filter(None, [message, assistant_response]))
+    record_stats(db, user_id, message.context, deletes=1)
     db.commit()
+    history.conversation_changed(user_id, message.context)
+    events.publish_messages(user_id, events.MESSAGE_DELETED, message, assistant_response)
     return message
 
-def update_message(db: Session, message_id: int, new_content: str, user_id: int) -> Optional[MessageModel]:
+def update_message(db: Session, message_id: int, new_content: str, user_id: int,
+                   cancel: Optional[llm.CancelToken] = None) -> Optional[MessageModel]:
     # Fetch the original message
     message = db.query(MessageModel).filter(
         MessageModel.user_id == user_id,
         MessageModel.role == "user",
         MessageModel.is_deleted == False,
         MessageModel.is_edited == False
-    ).order_by(MessageModel.timestamp.desc()).first()
+    ).order_by(MessageModel.timestamp.desc(), MessageModel.id.desc()).first()
 
     if not message or message.id != message_id:
         return None
 
     # Mark original message and its assistant response as edited
+    now = datetime.now(timezone.utc)
     message.is_edited = True
+    message.superseded_at = now
     assistant_response = db.query(MessageModel).filter(
         and_(
             MessageModel.parent_id == message.id,
@@ -306,8 +473,13 @@ def update_message(db: Session, message_id: int, new_content: str, user_id: int)
     ).first()
     if assistant_response:
         assistant_response.is_edited = True
+        assistant_response.superseded_at = now
 
+    record_change(db, user_id, message.context, *filter(None, [message, assistant_response]))
+    record_stats(db, user_id, message.context, edits=1)
     db.commit()
+    history.conversation_changed(user_id, message.context)
+    events.publish_messages(user_id, events.MESSAGE_UPDATED, message, assistant_response)
 
     # Create a new edited message
     edited_message = MessageModel(
@@ -318,20 +490,33 @@ def update_message(db: Session, message_id: int, new_content: str, user_id: int)
         parent_id=None,  # This will be linked to the new assistant response
     )
     db.add(edited_message)
+    record_change(db, user_id, message.context, edited_message)
+    record_stats(db, user_id, message.context, user_messages=1)
     db.commit()
     db.refresh(edited_message)
+    history.message_written(user_id, message.context, edited_message)
+    events.publish_messages(user_id, events.MESSAGE_CREATED, edited_message)
 
     # Generate new assistant response
-    assistant_content = generate_response(new_content, message.context, db, user_id)
+    try:
+        completion = generate_response(new_content, message.context, db, user_id, cancel=cancel)
+    except llm.Cancelled:
+        abort_turn(db, user_id, edited_message)
+        raise
     assistant_response_new = MessageModel(
         role="assistant",
-        content=assistant_content,
+        content=completion.content,
         user_id=user_id,
         context=message.context,
         parent_id=edited_message.id
     )
     db.add(assistant_response_new)
+    record_change(db, user_id, message.context, assistant_response_new)
+    record_usage(db, assistant_response_new, completion)
+    record_stats(db, user_id, message.context, completion=completion)
     db.commit()
     db.refresh(assistant_response_new)
 
+    history.message_written(user_id, message.context, assistant_response_new)
+    events.publish_messages(user_id, events.MESSAGE_CREATED, assistant_response_new)
     return edited_message
\ No newline at end of file
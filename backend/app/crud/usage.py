@@ -0,0 +1,103 @@
+# app/crud/usage.py
+
+from dataclasses import replace
+from datetime import date, datetime, timezone
+import os
+from typing import Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from .. import models, llm
+from ..llm import Completion
+from .counters import increment
+
+# Prompt + completion tokens a user may spend per UTC day; 0 disables the budget
+USER_DAILY_TOKEN_BUDGET = int(os.getenv("USER_DAILY_TOKEN_BUDGET", 0))
+# What to do once the budget is spent: "degrade" to LLM_BUDGET_MODEL, or "fallback" to canned replies
+LLM_BUDGET_MODE = os.getenv("LLM_BUDGET_MODE", "degrade")
+LLM_BUDGET_MODEL = os.getenv("LLM_BUDGET_MODEL", os.getenv("LLM_FAST_MODEL", "gpt-4o-mini"))
+
+FALLBACK_MODEL = "fallback"
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def get_daily_usage(db: Session, user_id: int, day: Optional[date] = None) -> Optional[models.DailyUsage]:
+    return db.query(models.DailyUsage).filter(
+        models.DailyUsage.user_id == user_id,
+        models.DailyUsage.day == (day or today())
+    ).first()
+
+
+def is_over_budget(db: Session, user_id: int) -> bool:
+    if USER_DAILY_TOKEN_BUDGET <= 0:
+        return False
+    usage = get_daily_usage(db, user_id)
+    if usage is None:
+        return False
+    return usage.prompt_tokens + usage.completion_tokens >= USER_DAILY_TOKEN_BUDGET
+
+
+def record_usage(db: Session, message: models.Message, completion: Completion) -> None:
+    """
+    Store the usage of an assistant message and add it to the user's daily totals.
+    Does not commit; call it before the commit that stores the message.
+    """
+    if message.id is None:
+        db.flush()
+    db.add(models.MessageUsage(
+        message_id=message.id,
+        model=completion.model,
+        prompt_tokens=completion.prompt_tokens,
+        completion_tokens=completion.completion_tokens,
+        latency_ms=completion.latency_ms
+    ))
+    increment(
+        db, models.DailyUsage, {"user_id": message.user_id, "day": today()},
+        requests=1,
+        prompt_tokens=completion.prompt_tokens,
+        completion_tokens=completion.completion_tokens,
+        latency_ms_total=completion.latency_ms
+    )
+
+
+def record_usage_batch(db: Session, user_id: int, usages: list[tuple[int, Completion]]) -> None:
+    """
+    record_usage for many assistant messages at once: one multi-row insert and one update of the
+    daily totals. `usages` pairs message ids with their completions. Does not commit.
+    """
+    if not usages:
+        return
+    db.execute(insert(models.MessageUsage.__table__), [
+        {
+            "message_id": message_id,
+            "model": completion.model,
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "latency_ms": completion.latency_ms,
+        }
+        for message_id, completion in usages
+    ])
+    increment(
+        db, models.DailyUsage, {"user_id": user_id, "day": today()},
+        requests=len(usages),
+        prompt_tokens=sum(completion.prompt_tokens for _, completion in usages),
+        completion_tokens=sum(completion.completion_tokens for _, completion in usages),
+        latency_ms_total=sum(completion.latency_ms for _, completion in usages)
+    )
+
+
+def select_route(db: Session, user_id: int, context: Optional[str], messages: list[dict],
+                 action_type: Optional[str] = None) -> Optional[llm.Route]:
+    """
+    Pick the LLM route for a request, applying the user's daily budget.
+    Returns None when the budget is spent and LLM_BUDGET_MODE is "fallback".
+    """
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    route = llm.router.select(context, action_type, prompt_chars)
+    if not is_over_budget(db, user_id):
+        return route
+    if LLM_BUDGET_MODE == "fallback":
+        return None
+    return replace(route, model=LLM_BUDGET_MODEL)
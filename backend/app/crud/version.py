@@ -0,0 +1,71 @@
+# app/crud/version.py
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from .. import models
+from ..database import mark_write
+from .counters import increment
+from typing import Optional
+
+
+def get_version(db: Session, user_id: int, context: Optional[str] = None) -> int:
+    """
+    Return the current version of a user's conversation in one context.
+    Without a context, the sum over all contexts is returned; it grows with every bump,
+    so it still changes whenever any of the user's messages change.
+    """
+    query = db.query(func.coalesce(func.sum(models.ConversationVersion.version), 0)).filter(
+        models.ConversationVersion.user_id == user_id
+    )
+    if context is not None:
+        query = query.filter(models.ConversationVersion.context == context)
+    return query.scalar()
+
+
+def bump_version(db: Session, user_id: int, context: str) -> None:
+    """
+    Increment the version of a (user, context) conversation.
+    Does not commit; call it before the commit of the write it describes so both land together.
+    """
+    # Every message write passes through here, so it also opens the user's read-your-writes window
+    mark_write(user_id)
+    # Messages created with an explicit null context are tracked under the empty string
+    context = context or ""
+    # Creates the row at version 1 inside a savepoint, so concurrent first writes don't collide
+    increment(db, models.ConversationVersion, {"user_id": user_id, "context": context}, version=1)
+
+
+def next_change_seq(db: Session, user_id: int, count: int = 1) -> int:
+    """
+    Reserve `count` consecutive change sequence numbers for a user and return the first one.
+    The counter row stays locked until the caller commits.
+    """
+    counter = db.query(models.ChangeCounter).filter(
+        models.ChangeCounter.user_id == user_id
+    ).with_for_update().first()
+    if counter is None:
+        try:
+            # Savepoint: a concurrent first write for the same user may create the counter first
+            with db.begin_nested():
+                db.add(models.ChangeCounter(user_id=user_id, last_seq=count))
+            return 1
+        except IntegrityError:
+            counter = db.query(models.ChangeCounter).filter(
+                models.ChangeCounter.user_id == user_id
+            ).with_for_update().first()
+    first = counter.last_seq + 1
+    counter.last_seq = counter.last_seq + count
+    return first
+
+
+def record_change(db: Session, user_id: int, context: str, *messages: models.Message) -> None:
+    """
+    Mark messages as changed: stamp each with a fresh change_seq and bump the conversation version.
+    Does not commit.
+    """
+    if messages:
+        seq = next_change_seq(db, user_id, len(messages))
+        for offset, message in enumerate(messages):
+            message.change_seq = seq + offset
+    bump_version(db, user_id, context)
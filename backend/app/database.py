@@ -2,19 +2,101 @@
 from dotenv import load_dotenv
 import redis
 import os
-from sqlalchemy import create_engine
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Use the DATABASE_URL provided by Railway
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
+# Optional read replicas (comma-separated URLs). Reads fall back to the primary when a replica lags
+# more than REPLICA_MAX_LAG_SECONDS, and a user's reads stay on the primary for
+# REPLICA_STICKY_SECONDS after they write, so they always see their own new messages.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 2))
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 10))
+REPLICA_STICKY_BACKEND = os.getenv("REPLICA_STICKY_BACKEND", "local")  # "local" or "redis"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Nothing connects at import time: the engine is created on first use (or by the app lifespan)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not SQLALCHEMY_DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL is not set.")
+                _engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def _create_engine(url: str) -> Engine:
+    pool_options = {}
+    if not url.startswith("sqlite"):
+        pool_options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True}
+    return create_engine(url, **pool_options)
+
+
+def warm_up_pool(connections: int) -> int:
+    """
+    Open up to `connections` pooled connections and return them to the pool,
+    so the first requests don't pay for connection setup. Returns how many were opened.
+    """
+    engine = get_engine()
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def check_schema(create: bool = False) -> list[str]:
+    """
+    Return the model tables missing from the database. With create=True they are created first
+    (the old import-time create_all behaviour); otherwise only the check runs.
+    """
+    engine = get_engine()
+    if create:
+        Base.metadata.create_all(bind=engine)
+    existing = set(inspect(engine).get_table_names())
+    return sorted(set(Base.metadata.tables) - existing)
+
+
+def dispose_engine() -> None:
+    global _engine, _replica_engines
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        for replica in _replica_engines or []:
+            replica.engine.dispose()
+        _replica_engines = None
+
+
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -22,8 +104,127 @@ def get_db():
         db.close()
 
 
+class Replica:
+    """A read replica engine plus its last measured replication lag."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.lag: float = 0.0
+        self.checked_at: float = 0.0
+        self._lock = threading.Lock()
+
+    def current_lag(self) -> float:
+        now = time.monotonic()
+        if now - self.checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+            with self._lock:
+                if now - self.checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+                    self.lag = self._measure_lag()
+                    self.checked_at = now
+        return self.lag
+
+    def _measure_lag(self) -> float:
+        if self.engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            with self.engine.connect() as connection:
+                # A replica that has replayed everything it received is current, however old its last transaction
+                return float(connection.execute(text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )).scalar())
+        except Exception as e:
+            logger.error("Replica lag check failed for %s: %s", self.engine.url.host, e)
+            return float("inf")
+
+
+_replica_engines: Optional[list[Replica]] = None
+_replica_cycle = None
+
+
+def get_replicas() -> list[Replica]:
+    global _replica_engines, _replica_cycle
+    if _replica_engines is None:
+        with _engine_lock:
+            if _replica_engines is None:
+                replicas = [Replica(_create_engine(url)) for url in DATABASE_REPLICA_URLS]
+                _replica_cycle = itertools.cycle(replicas)
+                _replica_engines = replicas
+    return _replica_engines
+
+
+def choose_replica() -> Optional[Engine]:
+    """Round-robin over replicas whose lag is within bounds; None means use the primary."""
+    replicas = get_replicas()
+    for _ in range(len(replicas)):
+        replica = next(_replica_cycle)
+        if replica.current_lag() <= REPLICA_MAX_LAG_SECONDS:
+            return replica.engine
+    return None
+
+
+def get_replica_db():
+    """
+    Yield a session on a healthy read replica, or None when no replica is configured or all lag.
+    Callers decide whether the read may go to a replica at all (see dependencies.get_read_db).
+    """
+    engine = choose_replica() if DATABASE_REPLICA_URLS else None
+    if engine is None:
+        yield None
+        return
+    db = SessionLocal(bind=engine)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_recent_writes: dict[int, float] = {}
+
+
+def mark_write(user_id: int) -> None:
+    """Start the user's read-your-writes window: their reads go to the primary until it expires."""
+    if not DATABASE_REPLICA_URLS:
+        return
+    if REPLICA_STICKY_BACKEND == "redis":
+        try:
+            get_redis().set(f"sticky:user:{user_id}", 1, px=int(REPLICA_STICKY_SECONDS * 1000))
+            return
+        except redis.RedisError as e:
+            logger.error("Failed to record write in Redis, using local stickiness: %s", e)
+    now = time.monotonic()
+    if len(_recent_writes) > 10000:
+        for expired in [uid for uid, expires in _recent_writes.items() if expires < now]:
+            _recent_writes.pop(expired, None)
+    _recent_writes[user_id] = now + REPLICA_STICKY_SECONDS
+
+
+def is_sticky(user_id: int) -> bool:
+    if REPLICA_STICKY_BACKEND == "redis":
+        try:
+            if get_redis().exists(f"sticky:user:{user_id}"):
+                return True
+        except redis.RedisError as e:
+            # Can't tell whether the user just wrote; the primary is always safe
+            logger.error("Failed to read write stickiness from Redis: %s", e)
+            return True
+    expires = _recent_writes.get(user_id)
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        _recent_writes.pop(user_id, None)
+        return False
+    return True
+
+
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+_redis_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+    return _redis_client
@@ -1 +1,80 @@
-from .database import get_db
\ No newline at end of file
+import asyncio
+import os
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from .database import get_db, get_replica_db, is_sticky
+from .auth import get_current_user
+from .schemas.user import UserRead
+from .llm import CancelToken
+from .llm.cancellation import DISCONNECTED
+from . import sharding
+
+# Longest a request may wait for the LLM; clients may ask for less with an X-Request-Timeout header (seconds)
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+def get_user_db(
+    current_user: UserRead = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Session for the current user's message data. With sharding on, it is bound to the user's shard
+    (directory tables still resolve to the directory database); otherwise it is the primary session.
+    """
+    router = sharding.get_router()
+    if router is None:
+        yield db
+        return
+    # Raises ShardMovingError (503, see main.shard_moving_handler) while the user is being moved
+    shard = router.shard_for_user(db, current_user.id)
+    shard_db = router.session(shard, user_id=current_user.id)
+    try:
+        yield shard_db
+    finally:
+        shard_db.close()
+
+
+def get_read_db(
+    current_user: UserRead = Depends(get_current_user),
+    db: Session = Depends(get_user_db),
+    replica_db: Optional[Session] = Depends(get_replica_db)
+) -> Session:
+    """
+    Session for read-only endpoints: a read replica when one is healthy, unless the user wrote
+    within the stickiness window, in which case the primary serves their own new messages.
+    Replicas apply to the unsharded primary only; with sharding on, reads go to the user's shard.
+    """
+    if replica_db is None or is_sticky(current_user.id) or sharding.get_router() is not None:
+        return db
+    return replica_db
+
+
+async def get_cancel_token(request: Request):
+    """
+    Cancel token for the request's LLM call. It fires when the deadline passes or the client
+    disconnects, which a watcher task checks for while the (threadpool) endpoint runs.
+    """
+    timeout = LLM_REQUEST_TIMEOUT
+    requested = request.headers.get("x-request-timeout")
+    if requested is not None:
+        try:
+            timeout = min(timeout, max(float(requested), 0.0))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid X-Request-Timeout header.")
+    token = CancelToken(timeout)
+
+    async def watch():
+        # `cancelled` also fires the deadline, closing a stalled upstream stream on time
+        while not token.cancelled:
+            if await request.is_disconnected():
+                token.cancel(DISCONNECTED)
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield token
+    finally:
+        watcher.cancel()
@@ -0,0 +1,187 @@
+# app/events.py
+"""
+Message events pushed to connected clients.
+
+The crud layer publishes create/edit/delete events after each commit. A broker delivers them to
+the WebSocket subscriptions of the affected user:
+
+- LocalBroker keeps subscriptions in process memory, which is enough for a single worker.
+- RedisBroker publishes through Redis pub/sub so every worker receives every event, then hands
+  them to its own local subscriptions.
+
+Each subscription has a bounded queue. A consumer that falls behind by more than the queue size
+is evicted instead of letting the backlog grow without limit.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from .database import REDIS_HOST, REDIS_PORT, REDIS_DB, get_redis
+from . import schemas
+
+logger = logging.getLogger(__name__)
+
+EVENT_BROKER = os.getenv("EVENT_BROKER", "local")  # "local" or "redis"
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 100))
+EVENT_CHANNEL_PREFIX = "events:user:"
+
+MESSAGE_CREATED = "message.created"
+MESSAGE_UPDATED = "message.updated"
+MESSAGE_DELETED = "message.deleted"
+
+# Queued in place of the backlog when a subscriber is evicted
+EVICTED = object()
+
+
+class Subscription:
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.evicted = False
+
+    async def get(self):
+        """Wait for the next event dict, or EVICTED if this consumer was dropped."""
+        return await self.queue.get()
+
+
+class LocalBroker:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions: dict[int, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a subscription; must be called from the event loop that will consume it."""
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.dispatch(user_id, event)
+
+    def dispatch(self, user_id: int, event: dict) -> None:
+        """Hand an event to this process's subscriptions. Safe to call from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, event)
+            except RuntimeError:
+                # The subscriber's loop is already closed
+                self.unsubscribe(subscription)
+
+    def _deliver(self, subscription: Subscription, event: dict) -> None:
+        if subscription.evicted:
+            return
+        try:
+            subscription.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.evict(subscription)
+
+    def evict(self, subscription: Subscription) -> None:
+        """Drop a slow consumer: discard its backlog and wake it up with EVICTED."""
+        logger.warning("Evicting slow event consumer for user %s", subscription.user_id)
+        subscription.evicted = True
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(EVICTED)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Fans events out across workers through Redis pub/sub.
+    The listener task is started by the first subscriber and relays every user's channel
+    into the local subscriptions of this process.
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def publish(self, user_id: int, event: dict) -> None:
+        try:
+            get_redis().publish(f"{EVENT_CHANNEL_PREFIX}{user_id}", json.dumps(event))
+        except redis.RedisError as e:
+            # Other workers miss this event, but this worker's clients still get it
+            logger.error("Failed to publish event to Redis: %s", e)
+            self.dispatch(user_id, event)
+
+    async def _listen(self) -> None:
+        backoff = 0.5
+        while True:
+            client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{EVENT_CHANNEL_PREFIX}*")
+                    backoff = 0.5
+                    async for item in pubsub.listen():
+                        if item["type"] != "pmessage":
+                            continue
+                        user_id = int(item["channel"][len(EVENT_CHANNEL_PREFIX):])
+                        self.dispatch(user_id, json.loads(item["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Redis event listener failed, reconnecting in %.1fs: %s", backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                await client.aclose()
+
+
+_broker: Optional[LocalBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> LocalBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = RedisBroker() if EVENT_BROKER == "redis" else LocalBroker()
+    return _broker
+
+
+def publish_messages(user_id: int, event_type: str, *messages) -> None:
+    """
+    Publish one event per message. Call after the write is committed so subscribers never see
+    a change that could still roll back.
+    """
+    broker = get_broker()
+    for message in messages:
+        if message is None:
+            continue
+        payload = schemas.Message.model_validate(message).model_dump(mode="json")
+        broker.publish(user_id, {"type": event_type, "message": payload})
@@ -0,0 +1,244 @@
+# app/history.py
+"""
+In-process cache of each conversation's most recent messages, so building a prompt does not
+have to query the history that was just written.
+
+The cache is an LRU of per-(user, context) ring buffers holding the last HISTORY_CACHE_DEPTH
+live (not edited, not deleted) messages as compact slotted records. It is capped by entry count
+and by the approximate memory of the records. A miss loads the buffer from the database.
+
+Keeping it current:
+- a new message is appended to this process's buffer;
+- edits and deletes drop the buffer, because older messages move back into the window;
+- with HISTORY_CACHE_BACKEND=redis, every write also drops the buffer in the other workers
+  through Redis pub/sub. Use it whenever more than one worker serves the same users.
+Entries also expire after HISTORY_CACHE_TTL seconds, which bounds staleness if an invalidation is lost.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from .database import REDIS_HOST, REDIS_PORT, REDIS_DB, get_redis
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CACHE_BACKEND = os.getenv("HISTORY_CACHE_BACKEND", "local")  # "off", "local" or "redis"
+HISTORY_CACHE_DEPTH = int(os.getenv("HISTORY_CACHE_DEPTH", 10))
+HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("HISTORY_CACHE_MAX_ENTRIES", 50000))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 600))
+HISTORY_CHANNEL = "history:invalidate"
+
+# Rough per-record overhead on top of the content string (object, slots, deque slot)
+RECORD_OVERHEAD_BYTES = 200
+
+
+class HistoryRecord:
+    __slots__ = ("id", "role", "content", "timestamp")
+
+    def __init__(self, id: int, role: str, content: str, timestamp: Optional[datetime]):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_message(cls, message) -> "HistoryRecord":
+        return cls(message.id, message.role, message.content, message.timestamp)
+
+    def size(self) -> int:
+        return RECORD_OVERHEAD_BYTES + len(self.content)
+
+
+class _Entry:
+    __slots__ = ("records", "size", "expires_at", "loading")
+
+    def __init__(self, depth: int, loading: bool = False):
+        self.records: deque = deque(maxlen=depth)
+        self.size = 0
+        self.expires_at = time.monotonic() + HISTORY_CACHE_TTL
+        self.loading = loading
+
+
+class HistoryCache:
+    def __init__(self, depth: int = HISTORY_CACHE_DEPTH, max_entries: int = HISTORY_CACHE_MAX_ENTRIES,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.depth = depth
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def recent(self, user_id: int, context: Optional[str], limit: int,
+               load: Callable[[int], Iterable]) -> list[HistoryRecord]:
+        """
+        The `limit` most recent live messages, newest first (like get_recent_messages_by_context).
+        On a miss, `load(depth)` fetches them from the database and fills the buffer.
+        """
+        key = (user_id, context or "")
+        if limit > self.depth:
+            return [HistoryRecord.from_message(m) for m in load(limit)]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.loading and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(reversed(entry.records))[:limit]
+            self.misses += 1
+            placeholder = None
+            if entry is None or not entry.loading:
+                self._drop(key)
+                # A write that lands while we query removes the placeholder, so a stale load is never kept
+                placeholder = self._entries[key] = _Entry(self.depth, loading=True)
+
+        records = [HistoryRecord.from_message(m) for m in load(self.depth)]
+        if placeholder is not None:
+            with self._lock:
+                if self._entries.get(key) is placeholder:
+                    placeholder.loading = False
+                    for record in reversed(records):
+                        self._push(placeholder, record)
+                    self._evict()
+        return records[:limit]
+
+    def append(self, user_id: int, context: Optional[str], message) -> None:
+        """Add a newly written live message to the buffer, if the conversation is cached."""
+        key = (user_id, context or "")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry.loading:
+                self._drop(key)
+                return
+            self._push(entry, HistoryRecord.from_message(message))
+            self._evict()
+
+    def invalidate(self, user_id: int, context: Optional[str]) -> None:
+        with self._lock:
+            self._drop((user_id, context or ""))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _push(self, entry: _Entry, record: HistoryRecord) -> None:
+        if len(entry.records) == entry.records.maxlen:
+            dropped = entry.records[0].size()
+            entry.size -= dropped
+            self.size -= dropped
+        entry.records.append(record)
+        entry.size += record.size()
+        self.size += record.size()
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+
+class HistoryInvalidator:
+    """
+    Relays history invalidations between workers through Redis pub/sub.
+    Messages carry the sender's id so a worker does not drop the buffer it just updated itself.
+    """
+
+    def __init__(self, cache: HistoryCache):
+        self.cache = cache
+        self.origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def publish(self, user_id: int, context: Optional[str]) -> None:
+        try:
+            get_redis().publish(HISTORY_CHANNEL, f"{self.origin}:{user_id}:{context or ''}")
+        except redis.RedisError as e:
+            # Other workers keep their buffers until the TTL runs out
+            logger.error("Failed to publish history invalidation to Redis: %s", e)
+
+    async def _listen(self) -> None:
+        backoff = 0.5
+        while True:
+            client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(HISTORY_CHANNEL)
+                    backoff = 0.5
+                    async for item in pubsub.listen():
+                        if item["type"] != "message":
+                            continue
+                        origin, user_id, context = item["data"].split(":", 2)
+                        if origin != self.origin:
+                            self.cache.invalidate(int(user_id), context)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Redis history listener failed, reconnecting in %.1fs: %s", backoff, e)
+                # Invalidations may have been missed while disconnected
+                self.cache.clear()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                await client.aclose()
+
+
+cache = HistoryCache()
+invalidator = HistoryInvalidator(cache) if HISTORY_CACHE_BACKEND == "redis" else None
+
+
+def enabled() -> bool:
+    return HISTORY_CACHE_BACKEND != "off"
+
+
+def message_written(user_id: int, context: Optional[str], message) -> None:
+    """A new live message was committed."""
+    if not enabled():
+        return
+    cache.append(user_id, context, message)
+    if invalidator is not None:
+        invalidator.publish(user_id, context)
+
+
+def conversation_changed(user_id: int, context: Optional[str]) -> None:
+    """Messages were edited, deleted or bulk inserted; the buffer must be reloaded."""
+    if not enabled():
+        return
+    cache.invalidate(user_id, context)
+    if invalidator is not None:
+        invalidator.publish(user_id, context)
+
+
+async def start() -> None:
+    if invalidator is not None:
+        await invalidator.start()
+
+
+async def stop() -> None:
+    if invalidator is not None:
+        await invalidator.stop()
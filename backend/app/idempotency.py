@@ -0,0 +1,151 @@
+# app/idempotency.py
+"""
+Idempotency-Key support for write endpoints that call the LLM.
+
+The first request with a key claims it by inserting a row, runs, and stores its response.
+A retry with the same key and the same request gets the stored response (marked with an
+Idempotent-Replayed header) instead of a second message and a second LLM call. A retry that
+arrives while the first request is still running gets 409 with Retry-After right away; waiting
+for it would hold a threadpool thread that every sync endpoint shares.
+
+Reusing a key for a different request is rejected with 422. A claim whose request died without
+finishing is taken over after IDEMPOTENCY_LOCK_SECONDS. Keys expire after IDEMPOTENCY_TTL_SECONDS.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .serialization import dumps, json_response
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_RETRY_AFTER_SECONDS = int(os.getenv("IDEMPOTENCY_RETRY_AFTER_SECONDS", 5))
+# Longer than any request can run; a claim older than this belongs to a request that died
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 300))
+MAX_KEY_LENGTH = 255
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def fingerprint(method: str, path: str, body: BaseModel) -> str:
+    return hashlib.sha256(f"{method} {path}\n{body.model_dump_json()}".encode()).hexdigest()
+
+
+def _replay(record: models.IdempotencyKey) -> Response:
+    return Response(
+        content=record.response,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={REPLAYED_HEADER: "true"}
+    )
+
+
+def _claim(db: Session, user_id: int, key: str, request_fingerprint: str) -> Optional[models.IdempotencyKey]:
+    """Insert an in-progress claim. Returns None when another request already holds the key."""
+    now = _now()
+    # Expired keys of this user are dropped here, so a reused key starts fresh; the retention job
+    # (app/retention.py) deletes everyone else's
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.expires_at < now
+    ).delete(synchronize_session=False)
+    record = models.IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        fingerprint=request_fingerprint,
+        locked_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    )
+    try:
+        with db.begin_nested():
+            db.add(record)
+    except IntegrityError:
+        db.commit()
+        return None
+    db.commit()
+    return record
+
+
+def _finished(db: Session, user_id: int, key: str, request_fingerprint: str) -> Optional[models.IdempotencyKey]:
+    """
+    The record of the request holding the key, once it has finished; 409 while it is still running.
+    Returns None when the key is free again (the holder failed, or its claim went stale and was removed).
+    """
+    # End the transaction so the read sees the holder's latest commit
+    db.commit()
+    record = db.get(models.IdempotencyKey, (user_id, key), populate_existing=True)
+    if record is None:
+        return None
+    if record.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request."
+        )
+    if record.status_code is not None:
+        return record
+    if record.locked_at < _now() - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+        # Only the exact stale claim is removed; another retry may already have replaced it
+        db.query(models.IdempotencyKey).filter_by(
+            user_id=user_id, key=key, locked_at=record.locked_at, status_code=None
+        ).delete(synchronize_session=False)
+        db.commit()
+        return None
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress.",
+        headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER_SECONDS)},
+    )
+
+
+def run_idempotent(db: Session, user_id: int, key: Optional[str], request_fingerprint: str,
+                   handler: Callable[[], object], response_model: type[BaseModel]):
+    """
+    Run `handler` at most once per (user, key). Without a key it simply runs.
+    The handler's result is validated into `response_model` and stored for replays.
+    """
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Idempotency-Key.")
+
+    while True:
+        record = _claim(db, user_id, key, request_fingerprint)
+        if record is not None:
+            break
+        finished = _finished(db, user_id, key, request_fingerprint)
+        if finished is not None:
+            return _replay(finished)
+
+    try:
+        result = handler()
+    except Exception:
+        # Free the key so the client's retry runs the request again. A separate session, because
+        # the request's own transaction may have failed
+        release_db = Session(bind=db.get_bind(models.IdempotencyKey))
+        try:
+            release_db.query(models.IdempotencyKey).filter_by(user_id=user_id, key=key).delete(synchronize_session=False)
+            release_db.commit()
+        finally:
+            release_db.close()
+        raise
+
+    body = response_model.model_validate(result, from_attributes=True).model_dump()
+    content = dumps(body)
+    db.query(models.IdempotencyKey).filter_by(user_id=user_id, key=key).update({
+        "status_code": status.HTTP_200_OK,
+        "response": content.decode(),
+        "message_id": body.get("id"),
+    }, synchronize_session=False)
+    db.commit()
+    return json_response(body)
@@ -0,0 +1,223 @@
+# app/importer.py
+"""
+Bulk import of conversation history from NDJSON, one MessageImport per line:
+
+    {"role": "user", "content": "Hi", "context": "Support", "timestamp": "2024-01-02T10:00:00Z", "id": "a1"}
+    {"role": "assistant", "content": "Hello!", "context": "Support", "timestamp": "2024-01-02T10:00:05Z", "parent_id": "a1"}
+
+Timestamps are kept as given. An assistant line without parent_id is paired with the user line
+right before it in the same context, which is how the chat itself stores turns.
+The LLM is never called.
+
+Lines are validated and inserted in batches: Postgres uses COPY, other databases a batched
+executemany. Message ids are reserved up front so parent_id can be filled in before inserting.
+
+    python -m app.importer --username alice history.ndjson
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional, Union
+
+from pydantic import ValidationError
+from sqlalchemy import false, func, insert, text, update
+from sqlalchemy.orm import Session
+
+from . import history, models
+from .crud.version import bump_version, next_change_seq
+from .schemas.message import MessageImport, ImportResult
+
+IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+COLUMNS = ["id", "role", "content", "timestamp", "user_id", "context", "is_edited", "is_deleted", "is_aborted", "parent_id", "change_seq"]
+
+
+class MessageImporter:
+    def __init__(self, db: Session, user_id: int, batch_size: int = IMPORT_BATCH_SIZE,
+                 progress: Optional[Callable[[int, float], None]] = None):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.progress = progress
+        self.rows = 0
+        self.skipped = 0
+        self.errors: list[str] = []
+        self._pending: list[tuple[int, MessageImport]] = []
+        self._line_number = 0
+        self._source_ids: dict[Union[int, str], int] = {}
+        self._last_user_turn: dict[Optional[str], int] = {}
+        self._started = time.perf_counter()
+
+    def feed(self, lines: Iterable[Union[str, bytes]]) -> None:
+        for line in lines:
+            self._line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = MessageImport.model_validate_json(line)
+            except ValidationError as e:
+                self._skip(f"line {self._line_number}: {e.errors()[0]['msg']}")
+                continue
+            self._pending.append((self._line_number, record))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        ids = self._reserve_ids(len(batch))
+        first_seq = next_change_seq(self.db, self.user_id, len(batch))
+        now = datetime.now(timezone.utc)
+
+        rows = []
+        for offset, (line_number, record) in enumerate(batch):
+            row_id = ids[offset]
+            parent_id = None
+            if record.role == "assistant":
+                if record.parent_id is not None:
+                    parent_id = self._source_ids.get(record.parent_id)
+                    if parent_id is None:
+                        self._error(f"line {line_number}: unknown parent_id {record.parent_id!r}, imported unpaired")
+                else:
+                    parent_id = self._last_user_turn.pop(record.context, None)
+            else:
+                self._last_user_turn[record.context] = row_id
+            if record.id is not None:
+                self._source_ids[record.id] = row_id
+            rows.append({
+                "id": row_id,
+                "role": record.role,
+                "content": record.content,
+                "timestamp": record.timestamp or now,
+                "user_id": self.user_id,
+                "context": record.context,
+                "is_edited": False,
+                "is_deleted": False,
+                "is_aborted": False,
+                "parent_id": parent_id,
+                "change_seq": first_seq + offset,
+            })
+
+        self._insert(rows)
+        contexts = {row["context"] for row in rows}
+        for context in contexts:
+            bump_version(self.db, self.user_id, context)
+        self.db.commit()
+        for context in contexts:
+            history.conversation_changed(self.user_id, context)
+
+        self.rows += len(rows)
+        if self.progress:
+            self.progress(self.rows, time.perf_counter() - self._started)
+
+    def result(self) -> ImportResult:
+        seconds = time.perf_counter() - self._started
+        return ImportResult(
+            rows=self.rows,
+            skipped=self.skipped,
+            errors=self.errors,
+            seconds=round(seconds, 3),
+            rows_per_sec=round(self.rows / seconds, 1) if seconds > 0 else 0.0
+        )
+
+    def _skip(self, error: str) -> None:
+        self.skipped += 1
+        self._error(error)
+
+    def _error(self, error: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+    def _is_postgres(self) -> bool:
+        return self.db.get_bind(models.Message).dialect.name == "postgresql"
+
+    def _reserve_ids(self, count: int) -> list[int]:
+        return reserve_message_ids(self.db, count)
+
+    def _insert(self, rows: list[dict]) -> None:
+        if not self._is_postgres():
+            self.db.execute(insert(models.Message.__table__), rows)
+            return
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(",".join(_csv_field(row[column]) for column in COLUMNS) + "\n")
+        buffer.seek(0)
+        cursor = self.db.connection(bind_arguments={"mapper": models.Message}).connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY messages ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+
+def reserve_message_ids(db: Session, count: int) -> list[int]:
+    """
+    Reserve `count` message ids, so rows can reference each other (parent_id) before they are inserted.
+    Insert the rows in the same transaction.
+    """
+    if db.get_bind(models.Message).dialect.name == "postgresql":
+        result = db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :n)"),
+            {"n": count},
+            bind_arguments={"mapper": models.Message}
+        )
+        return [row[0] for row in result]
+    # Without sequences, continue after the current maximum. A no-op write first takes SQLite's write
+    # lock, so no other writer can insert between this read and the caller's commit
+    messages = models.Message.__table__
+    db.execute(update(messages).where(false()).values(id=messages.c.id))
+    start = (db.query(func.max(models.Message.id)).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+def _csv_field(value) -> str:
+    # In COPY's csv format only an unquoted empty field is NULL; every value is quoted, so no content
+    # (an empty string, or "\N") can be read back as NULL
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    from .database import SessionLocal, get_engine
+    from .sharding import get_router
+
+    parser = argparse.ArgumentParser(description="Bulk import NDJSON conversation history for one user.")
+    parser.add_argument("path", help="NDJSON file, or - for stdin")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    get_engine()
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == args.username).first()
+        if user is None:
+            sys.exit(f"No such user: {args.username}")
+
+        def report(rows: int, elapsed: float) -> None:
+            print(f"{rows} rows imported, {rows / elapsed:.0f} rows/sec", file=sys.stderr)
+
+        router = get_router()
+        target_db = router.session(router.shard_for_user(db, user.id)) if router else db
+        importer = MessageImporter(target_db, user.id, batch_size=args.batch_size, progress=report)
+        source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+        with source:
+            importer.feed(source)
+        importer.flush()
+        print(json.dumps(importer.result().model_dump()))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
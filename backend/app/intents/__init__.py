@@ -0,0 +1,90 @@
+# app/intents/__init__.py
+"""
+Local FAQ/intent matching, per context, over curated question/answer pairs (faq.json by default,
+or the file named by INTENT_FILE).
+
+Each context gets an index made of a keyword automaton (curated phrases such as "reset password",
+found in one pass over the message) and a TF-IDF similarity matcher over example questions.
+generate_response answers from the index without calling the LLM when the match is confident
+(INTENT_MIN_SCORE), and fallback replies use it with the lower INTENT_FALLBACK_MIN_SCORE.
+
+Fast-path replies are stored with model "intent:<name>", so message_usage keeps a durable record
+of them; stats() reports this process's lookup and hit counts.
+"""
+import os
+import threading
+from typing import Optional
+
+from .index import Intent, IntentIndex, IntentMatch, IntentStats, load_intents
+
+INTENT_FILE = os.getenv("INTENT_FILE", os.path.join(os.path.dirname(__file__), "faq.json"))
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "on") == "on"
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", 0.6))
+INTENT_FALLBACK_MIN_SCORE = float(os.getenv("INTENT_FALLBACK_MIN_SCORE", 0.3))
+# Longer messages usually carry details a canned answer would ignore; they go to the LLM
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", 25))
+
+INTENT_MODEL_PREFIX = "intent:"
+
+stats = IntentStats()
+
+_intents: Optional[list[Intent]] = None
+_indexes: dict[str, IntentIndex] = {}
+_lock = threading.Lock()
+
+
+def get_index(context: Optional[str]) -> IntentIndex:
+    global _intents
+    context = context or ""
+    index = _indexes.get(context)
+    if index is None:
+        with _lock:
+            if _intents is None:
+                _intents = load_intents(INTENT_FILE)
+            index = _indexes.get(context)
+            if index is None:
+                index = IntentIndex([i for i in _intents if not i.contexts or context in i.contexts])
+                _indexes[context] = index
+    return index
+
+
+def set_intents(intents: list[Intent]) -> None:
+    """Replace the loaded intents (e.g. after editing the FAQ file); indexes are rebuilt on next use."""
+    global _intents
+    with _lock:
+        _intents = list(intents)
+        _indexes.clear()
+
+
+def warm_up() -> None:
+    """Load the FAQ file and build the indexes of the known contexts ahead of the first message."""
+    for context in ("Onboarding", "Support", "Marketing", ""):
+        get_index(context)
+
+
+def match(text: str, context: Optional[str], min_score: float, kind: str) -> Optional[IntentMatch]:
+    """The intent answering `text` in `context` with at least `min_score` confidence, or None."""
+    found = None
+    if len(text.split()) <= INTENT_MAX_WORDS:
+        found = get_index(context).match(text)
+        if found is not None and found.score < min_score:
+            found = None
+    stats.record(context or "", kind, found)
+    return found
+
+
+def fast_path(text: str, context: Optional[str]) -> Optional[IntentMatch]:
+    """A confident local answer that can replace the LLM call, or None (also when disabled)."""
+    if not INTENT_FAST_PATH:
+        return None
+    return match(text, context, INTENT_MIN_SCORE, "fast_path")
+
+
+def fallback(text: str, context: Optional[str]) -> Optional[IntentMatch]:
+    return match(text, context, INTENT_FALLBACK_MIN_SCORE, "fallback")
+
+
+__all__ = [
+    "Intent", "IntentIndex", "IntentMatch", "IntentStats", "load_intents",
+    "INTENT_MODEL_PREFIX", "stats", "get_index", "set_intents", "warm_up", "match", "fast_path", "fallback",
+]
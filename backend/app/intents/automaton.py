@@ -0,0 +1,57 @@
+# app/intents/automaton.py
+
+from collections import deque
+from typing import Hashable, Iterable
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over word tokens. Finds every keyword phrase in a token sequence
+    in a single pass, however many phrases are loaded, and only on whole-word boundaries.
+    """
+
+    def __init__(self, phrases: Iterable[tuple[tuple[str, ...], Hashable]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[Hashable, int]]] = [[]]
+        for phrase, value in phrases:
+            self._add(phrase, value)
+        self._link()
+
+    def _add(self, phrase: tuple[str, ...], value: Hashable) -> None:
+        if not phrase:
+            return
+        state = 0
+        for token in phrase:
+            following = self._goto[state].get(token)
+            if following is None:
+                following = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][token] = following
+            state = following
+        self._out[state].append((value, len(phrase)))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(token, 0)
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+
+    def find(self, tokens: list[str]) -> list[tuple[Hashable, int]]:
+        """Every (value, phrase length) whose phrase occurs in `tokens`, in order of occurrence."""
+        found = []
+        state = 0
+        for token in tokens:
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            found.extend(self._out[state])
+        return found
@@ -0,0 +1,149 @@
+# app/intents/index.py
+
+import json
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .automaton import KeywordAutomaton
+from .text import terms, tokenize
+from .tfidf import TfidfMatcher
+
+# Confidence given to a curated keyword phrase hit; similarity can only raise it
+KEYWORD_SCORE = 0.9
+# A phrase hit only counts when the message is mostly about that intent: at least this similarity,
+# and at least this share of the message's terms found in the intent's keywords and questions.
+# Otherwise "change password" inside a detailed question would get the canned answer.
+KEYWORD_MIN_SIMILARITY = 0.5
+KEYWORD_MIN_COVERAGE = 0.5
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    answer: str
+    keywords: tuple[str, ...] = ()
+    questions: tuple[str, ...] = ()
+    contexts: tuple[str, ...] = ()  # empty: every context
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    intent: Intent
+    score: float
+    method: str  # "keyword" or "similarity"
+
+
+class IntentIndex:
+    """Keyword automaton plus TF-IDF matcher over the intents of one context."""
+
+    def __init__(self, intents: list[Intent]):
+        self.intents = {intent.name: intent for intent in intents}
+        self._keywords = KeywordAutomaton(
+            (tuple(tokenize(keyword)), intent.name) for intent in intents for keyword in intent.keywords
+        )
+        self._similarity = TfidfMatcher([
+            (terms(tokenize(text)), intent.name)
+            for intent in intents for text in (*intent.questions, *intent.keywords)
+        ])
+        self._vocabulary = {
+            intent.name: {term for text in (*intent.questions, *intent.keywords) for term in terms(tokenize(text))}
+            for intent in intents
+        }
+
+    def _coverage(self, name: str, message_terms: list[str]) -> float:
+        """Share of the message's terms that the intent's keywords and questions use."""
+        if not message_terms:
+            return 1.0
+        vocabulary = self._vocabulary[name]
+        return sum(term in vocabulary for term in message_terms) / len(message_terms)
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        """The best matching intent with its confidence in [0, 1], or None when nothing is related."""
+        tokens = tokenize(text)
+        message_terms = terms(tokens)
+        similarity = self._similarity.scores(message_terms)
+        # Longest matched phrase per intent; longer phrases are more specific
+        phrases: dict[str, int] = {}
+        for name, length in self._keywords.find(tokens):
+            phrases[name] = max(phrases.get(name, 0), length)
+
+        phrases = {
+            name: length for name, length in phrases.items()
+            if similarity.get(name, 0.0) >= KEYWORD_MIN_SIMILARITY
+            and self._coverage(name, message_terms) >= KEYWORD_MIN_COVERAGE
+        }
+        if phrases:
+            name = max(phrases, key=lambda n: (phrases[n], similarity.get(n, 0.0)))
+            return IntentMatch(self.intents[name], max(KEYWORD_SCORE, min(similarity[name], 1.0)), "keyword")
+        # Terms the intent doesn't know about (details, other products) lower the confidence
+        scores = {name: min(score, 1.0) * self._coverage(name, message_terms) for name, score in similarity.items()}
+        if scores:
+            name = max(scores, key=scores.get)
+            return IntentMatch(self.intents[name], scores[name], "similarity")
+        return None
+
+
+@dataclass
+class IntentStats:
+    """Process-local lookup and hit counters, per context and lookup kind ("fast_path" or "fallback")."""
+    lookups: dict = field(default_factory=lambda: defaultdict(int))
+    hits: dict = field(default_factory=lambda: defaultdict(int))
+    intents: dict = field(default_factory=lambda: defaultdict(int))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, context: str, kind: str, match: Optional[IntentMatch]) -> None:
+        with self._lock:
+            self.lookups[(context, kind)] += 1
+            if match is not None:
+                self.hits[(context, kind)] += 1
+                self.intents[match.intent.name] += 1
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "context": context,
+                    "kind": kind,
+                    "lookups": lookups,
+                    "hits": self.hits[(context, kind)],
+                    "hit_rate": self.hits[(context, kind)] / lookups,
+                }
+                for (context, kind), lookups in sorted(self.lookups.items())
+            ]
+
+    def intent_hits(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.intents)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.lookups.clear()
+            self.hits.clear()
+            self.intents.clear()
+
+
+def load_intents(path: str) -> list[Intent]:
+    """
+    Read intents from a JSON file:
+
+        {"intents": [
+            {"name": "reset_password", "contexts": ["Support"],
+             "keywords": ["reset password", "forgot password"],
+             "questions": ["How do I change my password?"],
+             "answer": "..."}
+        ]}
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["intents"]
+    return [
+        Intent(
+            name=entry["name"],
+            answer=entry["answer"],
+            keywords=tuple(entry.get("keywords", ())),
+            questions=tuple(entry.get("questions", ())),
+            contexts=tuple(entry.get("contexts", ())),
+        )
+        for entry in entries
+    ]
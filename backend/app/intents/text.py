@@ -0,0 +1,29 @@
+# app/intents/text.py
+
+import re
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words that carry no intent; they would make every "how do I ..." question look alike
+STOPWORDS = frozenset(
+    "a an and are as at be can could do does for from get got have how i i'm is it me my of on or our "
+    "please should so that the there this to up us want we what when where which who why will with "
+    "would you your".split()
+)
+
+
+def _stem(word: str) -> str:
+    # Plural folding only; enough for "passwords" / "password" without a stemming dependency
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, plural-folded word tokens, stopwords included (keyword phrases may use them)."""
+    return [_stem(word) for word in _WORD.findall(text.lower())]
+
+
+def terms(tokens: list[str]) -> list[str]:
+    """Tokens that count for similarity scoring."""
+    return [token for token in tokens if token not in STOPWORDS]
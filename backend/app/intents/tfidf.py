@@ -0,0 +1,45 @@
+# app/intents/tfidf.py
+
+import math
+from collections import Counter
+from typing import Hashable
+
+
+class TfidfMatcher:
+    """
+    Cosine similarity between a query and a small set of example questions, using sublinear
+    TF-IDF weights and sparse vectors. Built once per index; a lookup touches only the
+    documents that share a term with the query.
+    """
+
+    def __init__(self, documents: list[tuple[list[str], Hashable]]):
+        frequencies = Counter(term for terms, _ in documents for term in set(terms))
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in frequencies.items()}
+        self._postings: dict[str, list[tuple[int, float]]] = {}
+        self._values: list[Hashable] = []
+        for terms, value in documents:
+            vector = self._vector(terms)
+            if not vector:
+                continue
+            for term, weight in vector.items():
+                self._postings.setdefault(term, []).append((len(self._values), weight))
+            self._values.append(value)
+
+    def _vector(self, terms: list[str]) -> dict[str, float]:
+        counts = Counter(term for term in terms if term in self.idf)
+        vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def scores(self, terms: list[str]) -> dict[Hashable, float]:
+        """Best cosine similarity per document value, for values that share at least one term."""
+        scores = [0.0] * len(self._values)
+        for term, weight in self._vector(terms).items():
+            for document, document_weight in self._postings.get(term, ()):
+                scores[document] += weight * document_weight
+        best: dict[Hashable, float] = {}
+        for document, score in enumerate(scores):
+            if score > best.get(self._values[document], 0.0):
+                best[self._values[document]] = score
+        return best
@@ -0,0 +1,76 @@
+# app/knowledge/__init__.py
+"""
+Local retrieval over the product knowledge file (products.md by default, or KNOWLEDGE_FILE).
+
+The file is split into chunks per section and paragraph and indexed with BM25 weights in a NumPy
+matrix under KNOWLEDGE_INDEX_DIR. The index is rebuilt when the file changes and opened
+memory-mapped. generate_response adds only the KNOWLEDGE_TOP_K chunks most relevant to the
+conversation (the new message plus the user's last KNOWLEDGE_HISTORY_MESSAGES) to the system
+prompt, after a one-line product summary, instead of a fixed product description.
+
+    python -m app.knowledge build
+    python -m app.knowledge search "how does email warmup work"
+"""
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from .index import Chunk, KnowledgeIndex, build_index, chunk_markdown, open_index
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_FILE = os.getenv("KNOWLEDGE_FILE", os.path.join(os.path.dirname(__file__), "products.md"))
+KNOWLEDGE_INDEX_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "artisan-knowledge"))
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", 2))
+# Chunks scoring at or below this are left out even when fewer than top-k remain
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", 0.5))
+# The user's previous messages searched along with the new one, so follow-ups keep their topic
+KNOWLEDGE_HISTORY_MESSAGES = int(os.getenv("KNOWLEDGE_HISTORY_MESSAGES", 2))
+
+_index: Optional[KnowledgeIndex] = None
+_lock = threading.Lock()
+
+
+def get_index() -> KnowledgeIndex:
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = open_index(KNOWLEDGE_FILE, KNOWLEDGE_INDEX_DIR)
+    return _index
+
+
+def reset() -> None:
+    """Forget the open index; the next search reopens (and if needed rebuilds) it."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def warm_up() -> None:
+    # A broken index must not stop the worker from booting; replies then go without product facts
+    try:
+        get_index()
+    except Exception as e:
+        logger.error("Knowledge index unavailable: %s", e)
+
+
+def retrieve(query: str, k: int = KNOWLEDGE_TOP_K) -> list[Chunk]:
+    """The chunks most relevant to `query`; empty when nothing relates or the index is unavailable."""
+    try:
+        return get_index().search(query, k, KNOWLEDGE_MIN_SCORE)
+    except Exception as e:
+        logger.error("Knowledge retrieval failed: %s", e)
+        return []
+
+
+def format_chunks(chunks: list[Chunk]) -> str:
+    return "\n".join(f"- {chunk.section}: {chunk.text}" for chunk in chunks)
+
+
+__all__ = [
+    "Chunk", "KnowledgeIndex", "build_index", "chunk_markdown", "open_index",
+    "get_index", "reset", "warm_up", "retrieve", "format_chunks",
+]
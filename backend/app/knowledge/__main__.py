@@ -0,0 +1,31 @@
+# app/knowledge/__main__.py
+
+import argparse
+from typing import Optional
+
+from . import KNOWLEDGE_FILE, KNOWLEDGE_INDEX_DIR, KNOWLEDGE_TOP_K, build_index, get_index, reset
+from .index import build_lock
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the product knowledge index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="Rebuild the index from the knowledge file")
+    search = commands.add_parser("search", help="Show the chunks retrieved for a query")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=KNOWLEDGE_TOP_K)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with build_lock(KNOWLEDGE_INDEX_DIR):
+            build_index(KNOWLEDGE_FILE, KNOWLEDGE_INDEX_DIR)
+        reset()
+        index = get_index()
+        print(f"{len(index.chunks)} chunks, {len(index.columns)} terms -> {KNOWLEDGE_INDEX_DIR}")
+        return
+    for chunk in get_index().search(args.query, args.k):
+        print(f"{chunk.score:6.2f}  [{chunk.section}] {chunk.text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# app/knowledge/index.py
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds aren't locked across processes
+    fcntl = None
+
+from ..intents.text import terms, tokenize
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Sentences are packed into chunks of up to this many words; small chunks keep prompts small
+CHUNK_WORDS = 30
+
+FORMAT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Chunk:
+    section: str
+    text: str
+    score: float = 0.0
+
+
+def chunk_markdown(source: str) -> list[tuple[str, str]]:
+    """Split markdown into (section heading, text) chunks of whole sentences, at most CHUNK_WORDS words each."""
+    chunks = []
+    section = ""
+    for block in re.split(r"\n\s*\n", source):
+        block = block.strip()
+        if block.startswith("#"):
+            heading, _, block = block.partition("\n")
+            section = heading.lstrip("#").strip()
+            block = block.strip()
+        current: list[str] = []
+        for sentence in re.split(r"(?<=[.!?])\s+", " ".join(block.split())):
+            words = sentence.split()
+            if current and len(current) + len(words) > CHUNK_WORDS:
+                chunks.append((section, " ".join(current)))
+                current = []
+            current.extend(words)
+        if current:
+            chunks.append((section, " ".join(current)))
+    return chunks
+
+
+def build_index(source_path: str, index_dir: str) -> None:
+    """
+    Chunk `source_path` and write its BM25 index to `index_dir`:
+    weights.npy (chunks x terms, float32), vocabulary.json, chunks.json and meta.json.
+    The files are written to a new directory next to the target and a symlink is swapped to it,
+    so readers never see a partial index. Use build_lock when several processes may build at once.
+    """
+    with open(source_path, encoding="utf-8") as f:
+        source = f.read()
+    chunks = chunk_markdown(source)
+    documents = [terms(tokenize(f"{section} {text}")) for section, text in chunks]
+    vocabulary = sorted({term for document in documents for term in document})
+    columns = {term: column for column, term in enumerate(vocabulary)}
+
+    counts = np.zeros((len(chunks), len(vocabulary)), dtype=np.float32)
+    for row, document in enumerate(documents):
+        for term in document:
+            counts[row, columns[term]] += 1
+    lengths = counts.sum(axis=1, keepdims=True)
+    average = float(lengths.mean()) if len(chunks) else 0.0
+    frequencies = (counts > 0).sum(axis=0)
+    idf = np.log(1 + (len(chunks) - frequencies + 0.5) / (frequencies + 0.5)).astype(np.float32)
+    # Document side of BM25, precomputed: a query's score is the sum of its terms' columns
+    norm = K1 * (1 - B + B * lengths / average) if average else K1
+    weights = idf * counts * (K1 + 1) / (counts + norm)
+
+    # Each build goes to a new version directory; `index_dir` is a symlink swapped to it atomically
+    index_dir = os.path.abspath(index_dir)
+    parent, name = os.path.split(index_dir)
+    os.makedirs(parent, exist_ok=True)
+    version = tempfile.mkdtemp(dir=parent, prefix=f".{name}-")
+    try:
+        np.save(os.path.join(version, "weights.npy"), weights.astype(np.float32))
+        with open(os.path.join(version, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulary, f)
+        with open(os.path.join(version, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        with open(os.path.join(version, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": FORMAT_VERSION, "source_sha256": _digest(source)}, f)
+        previous = os.readlink(index_dir) if os.path.islink(index_dir) else None
+        if os.path.isdir(index_dir) and previous is None:
+            shutil.rmtree(index_dir)  # index from before versioned builds
+        link = f"{version}.link"
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, index_dir)
+    except Exception:
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+    # Older versions go; the one just replaced stays for readers that resolved it a moment ago
+    keep = {os.path.basename(version), previous}
+    for entry in os.listdir(parent):
+        if entry.startswith(f".{name}-") and not entry.endswith(".link") and entry not in keep:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+@contextmanager
+def build_lock(index_dir: str):
+    """Serialize builds of `index_dir` across processes (every worker opens the index at startup)."""
+    index_dir = os.path.abspath(index_dir)
+    os.makedirs(os.path.dirname(index_dir), exist_ok=True)
+    with open(f"{index_dir}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_current(source_path: str, index_dir: str) -> bool:
+    try:
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(source_path, encoding="utf-8") as f:
+            source = f.read()
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == FORMAT_VERSION and meta.get("source_sha256") == _digest(source)
+
+
+def _digest(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class KnowledgeIndex:
+    """
+    A built index opened read-only. The weight matrix is memory-mapped, so every worker process
+    shares the same pages and opening it costs nothing until it is searched.
+    """
+
+    def __init__(self, index_dir: str):
+        # Resolve the symlink once, so all files come from the same build
+        index_dir = os.path.realpath(index_dir)
+        self.weights = np.load(os.path.join(index_dir, "weights.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "vocabulary.json"), encoding="utf-8") as f:
+            self.columns = {term: column for column, term in enumerate(json.load(f))}
+        with open(os.path.join(index_dir, "chunks.json"), encoding="utf-8") as f:
+            self.chunks = [tuple(chunk) for chunk in json.load(f)]
+
+    def search(self, query: str, k: int, min_score: float = 0.0) -> list[Chunk]:
+        """The `k` chunks with the highest BM25 score for `query`, best first; only scores above `min_score`."""
+        query_columns = sorted({self.columns[term] for term in terms(tokenize(query)) if term in self.columns})
+        if not query_columns or k <= 0 or not self.chunks:
+            return []
+        scores = np.asarray(self.weights[:, query_columns]).sum(axis=1)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            Chunk(self.chunks[row][0], self.chunks[row][1], float(scores[row]))
+            for row in top if scores[row] > min_score
+        ]
+
+
+def open_index(source_path: str, index_dir: str) -> KnowledgeIndex:
+    """Open the index for `source_path`, building it first when missing or stale."""
+    if not is_current(source_path, index_dir):
+        with build_lock(index_dir):
+            # Another process may have built it while this one waited for the lock
+            if not is_current(source_path, index_dir):
+                build_index(source_path, index_dir)
+    return KnowledgeIndex(index_dir)
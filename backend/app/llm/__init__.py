@@ -0,0 +1,82 @@
+# app/llm/__init__.py
+"""
+Pluggable LLM backends with per-context and per-action routing.
+
+Backends:
+- "openai": OpenAI's API (OPENAI_API_KEY)
+- "local": any OpenAI-compatible endpoint (LLM_LOCAL_BASE_URL, LLM_LOCAL_API_KEY)
+- "fake": deterministic in-process replies, no network
+"""
+import os
+from dotenv import load_dotenv
+from typing import Optional
+
+from .. import profiling
+
+from .base import Completion, LLMBackend
+from .cancellation import CancelToken, Cancelled
+from .fake import FakeBackend
+from .inflight import InFlight
+from .openai_backend import OpenAIBackend
+from .routing import Route, RouteRule, Router, DEFAULT_RULES, LLM_ROUTES_FILE, load_rules
+
+load_dotenv()
+
+_backends: dict[str, LLMBackend] = {
+    "openai": OpenAIBackend("openai", api_key=os.getenv("OPENAI_API_KEY")),
+    "fake": FakeBackend(),
+}
+if os.getenv("LLM_LOCAL_BASE_URL"):
+    # Local servers usually ignore the key, but the client requires one
+    _backends["local"] = OpenAIBackend(
+        "local",
+        api_key=os.getenv("LLM_LOCAL_API_KEY", "local"),
+        base_url=os.getenv("LLM_LOCAL_BASE_URL")
+    )
+
+router = Router(load_rules(LLM_ROUTES_FILE) if LLM_ROUTES_FILE else DEFAULT_RULES)
+# Generations in progress in this process; shutdown waits for them (see app/serve.py)
+generations = InFlight()
+
+
+def get_backend(name: str) -> LLMBackend:
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend '{name}'.")
+
+
+def register_backend(backend: LLMBackend) -> None:
+    _backends[backend.name] = backend
+
+
+def warm_up() -> None:
+    """Build the clients of every backend the routing table can reach."""
+    for name in {rule.route.backend for rule in router.rules}:
+        get_backend(name).warm_up()
+
+
+def complete(messages: list[dict], context: Optional[str], action_type: Optional[str] = None,
+             route: Optional[Route] = None, cancel: Optional[CancelToken] = None) -> Completion:
+    """
+    Route a chat completion by context, click action and prompt size, then run it.
+    Pass `route` to skip the routing table, and `cancel` to make the call abortable.
+    """
+    if route is None:
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        route = router.select(context, action_type, prompt_chars)
+    with generations.track(), profiling.span("llm", f"{route.backend}:{route.model}"):
+        return get_backend(route.backend).complete(
+            messages,
+            model=route.model,
+            max_tokens=route.max_tokens,
+            temperature=route.temperature,
+            cancel=cancel
+        )
+
+
+__all__ = [
+    "Completion", "LLMBackend", "OpenAIBackend", "FakeBackend", "CancelToken", "Cancelled", "InFlight",
+    "Route", "RouteRule", "Router", "router",
+    "generations", "get_backend", "register_backend", "warm_up", "complete",
+]
@@ -0,0 +1,34 @@
+# app/llm/base.py
+
+from dataclasses import dataclass
+from typing import Optional
+
+from .cancellation import CancelToken
+
+
+@dataclass
+class Completion:
+    content: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+
+
+class LLMBackend:
+    """
+    A chat-completion provider. Backends take OpenAI-style message dicts and return a Completion;
+    which model and sampling settings to use is decided by the router, not the backend.
+    """
+    name = "base"
+
+    def complete(self, messages: list[dict], model: str, max_tokens: int, temperature: float,
+                 cancel: Optional[CancelToken] = None) -> Completion:
+        """
+        Run one chat completion. When `cancel` is given, the backend stops the upstream call as soon
+        as the token is cancelled and raises Cancelled instead of returning.
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Build clients ahead of the first request. Optional."""
@@ -0,0 +1,63 @@
+# app/llm/cancellation.py
+
+import threading
+import time
+from typing import Callable, Optional
+
+DEADLINE = "deadline"
+DISCONNECTED = "disconnected"
+
+
+class Cancelled(Exception):
+    """The request that wanted this completion is gone (client disconnected) or out of time."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM call cancelled: {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cancellation signal shared between a request and the LLM call it started.
+    The request side calls cancel(); the backend polls `cancelled` while streaming and registers
+    callbacks (such as closing the HTTP stream) that run the moment the token is cancelled.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE)
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def cancel(self, reason: str) -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run `callback` when the token is cancelled (right away if it already is)."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason)
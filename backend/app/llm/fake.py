@@ -0,0 +1,30 @@
+# app/llm/fake.py
+
+import hashlib
+from typing import Optional
+from .base import Completion, LLMBackend
+from .cancellation import CancelToken
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process backend for tests, local development and load testing.
+    The same conversation always produces the same reply, with no network involved.
+    """
+    name = "fake"
+
+    def complete(self, messages: list[dict], model: str, max_tokens: int, temperature: float,
+                 cancel: Optional[CancelToken] = None) -> Completion:
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        digest = hashlib.sha1(repr(messages).encode()).hexdigest()[:8]
+        content = f"[{model}:{digest}] You said: {last_user}" if last_user else f"[{model}:{digest}] How can I help?"
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return Completion(
+            content=content,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(content.split()),
+            latency_ms=0.0
+        )
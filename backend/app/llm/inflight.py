@@ -0,0 +1,37 @@
+# app/llm/inflight.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class InFlight:
+    """Counts LLM calls in progress so shutdown can wait for them to finish."""
+
+    def __init__(self):
+        self.count = 0
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def track(self):
+        with self._idle:
+            self.count += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self.count -= 1
+                if self.count == 0:
+                    self._idle.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until no call is in progress; False if `timeout` passed first."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._idle:
+            while self.count:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
@@ -0,0 +1,103 @@
+# app/llm/openai_backend.py
+
+import threading
+import time
+from typing import Optional
+from openai import OpenAI
+from .base import Completion, LLMBackend
+from .cancellation import CancelToken, Cancelled
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI's API, or any server speaking the same chat-completions protocol
+    (vLLM, llama.cpp, Ollama, ...) when `base_url` is given.
+    """
+
+    def __init__(self, name: str, api_key: Optional[str], base_url: Optional[str] = None):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client: Optional[OpenAI] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> OpenAI:
+        # Built on first use, so importing and configuring backends needs no secrets
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if not self.api_key:
+                        raise ValueError(f"No API key configured for LLM backend '{self.name}'.")
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def warm_up(self) -> None:
+        if self.api_key:
+            self.client
+
+    def complete(self, messages: list[dict], model: str, max_tokens: int, temperature: float,
+                 cancel: Optional[CancelToken] = None) -> Completion:
+        if cancel is not None:
+            return self._complete_cancellable(messages, model, max_tokens, temperature, cancel)
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        latency_ms = (time.perf_counter() - start) * 1000
+        usage = response.usage
+        return Completion(
+            content=response.choices[0].message.content.strip(),
+            model=response.model or model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency_ms=latency_ms
+        )
+
+    def _complete_cancellable(self, messages: list[dict], model: str, max_tokens: int, temperature: float,
+                              cancel: CancelToken) -> Completion:
+        """
+        Stream the completion so it can be abandoned part way: closing the stream drops the
+        connection, which stops generation upstream. The token closes it from the request's side
+        (disconnect or deadline), and the deadline also bounds each network read.
+        """
+        cancel.raise_if_cancelled()
+        start = time.perf_counter()
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=cancel.remaining()
+            )
+            cancel.on_cancel(stream.close)
+            parts = []
+            response_model, usage = None, None
+            with stream:
+                for chunk in stream:
+                    cancel.raise_if_cancelled()
+                    response_model = chunk.model or response_model
+                    usage = chunk.usage or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+        except Cancelled:
+            raise
+        except Exception:
+            # Timeouts, and reads failing because the token closed the stream under them
+            if cancel.cancelled:
+                raise Cancelled(cancel.reason)
+            raise
+        cancel.raise_if_cancelled()
+        return Completion(
+            content="".join(parts).strip(),
+            model=response_model or model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
@@ -0,0 +1,88 @@
+# app/llm/routing.py
+"""
+Routing table that picks backend, model and sampling settings per request.
+
+Rules are checked in order and the first match wins. A rule matches on:
+- context: exact context name, or omitted for any context
+- action_type: exact click action, "*" for any click action, or omitted for any request
+  (chat messages have no action_type)
+- max_prompt_chars: only prompts up to this many characters, or omitted for any size
+
+A JSON file named by LLM_ROUTES_FILE replaces the default table:
+
+    {"routes": [
+        {"action_type": "*", "model": "gpt-4o-mini", "max_tokens": 200},
+        {"context": "Support", "backend": "local", "model": "llama3", "max_prompt_chars": 2000},
+        {"model": "gpt-4"}
+    ]}
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+LLM_DEFAULT_MODEL = os.getenv("LLM_DEFAULT_MODEL", "gpt-4")
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+LLM_DEFAULT_BACKEND = os.getenv("LLM_DEFAULT_BACKEND", "openai")
+LLM_ROUTES_FILE = os.getenv("LLM_ROUTES_FILE")
+
+
+@dataclass(frozen=True)
+class Route:
+    backend: str = LLM_DEFAULT_BACKEND
+    model: str = LLM_DEFAULT_MODEL
+    max_tokens: int = 500
+    temperature: float = 0.5
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    route: Route
+    context: Optional[str] = None
+    action_type: Optional[str] = None
+    max_prompt_chars: Optional[int] = None
+
+    def matches(self, context: Optional[str], action_type: Optional[str], prompt_chars: int) -> bool:
+        if self.context is not None and self.context != context:
+            return False
+        if self.action_type == "*" and action_type is None:
+            return False
+        if self.action_type not in (None, "*") and self.action_type != action_type:
+            return False
+        if self.max_prompt_chars is not None and prompt_chars > self.max_prompt_chars:
+            return False
+        return True
+
+
+# Click actions only ask a short follow-up question, so they go to the fast model.
+DEFAULT_RULES = [
+    RouteRule(Route(model=LLM_FAST_MODEL, max_tokens=200, temperature=0.7), context="Marketing", action_type="*"),
+    RouteRule(Route(model=LLM_FAST_MODEL, max_tokens=200, temperature=0.5), action_type="*"),
+    RouteRule(Route(model=LLM_DEFAULT_MODEL, max_tokens=500, temperature=0.5)),
+]
+
+
+def load_rules(path: str) -> list[RouteRule]:
+    with open(path) as f:
+        config = json.load(f)
+    rules = []
+    for entry in config["routes"]:
+        route = Route(**{key: entry[key] for key in ("backend", "model", "max_tokens", "temperature") if key in entry})
+        rules.append(RouteRule(
+            route=route,
+            context=entry.get("context"),
+            action_type=entry.get("action_type"),
+            max_prompt_chars=entry.get("max_prompt_chars")
+        ))
+    return rules
+
+
+class Router:
+    def __init__(self, rules: list[RouteRule]):
+        self.rules = rules
+
+    def select(self, context: Optional[str], action_type: Optional[str] = None, prompt_chars: int = 0) -> Route:
+        for rule in self.rules:
+            if rule.matches(context, action_type, prompt_chars):
+                return rule.route
+        return Route()
@@ -1,14 +1,30 @@
 # app/main.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, contextmanager
+import logging
+import os
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .routers import messages
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from . import database
+from .routers import messages, events, analytics, profiles
 from .auth import router as auth_router
+from . import history, intents, knowledge, llm, profiling, retention, serve, sharding
+from .events import get_broker
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional; gzip alone still covers every client
+    BrotliMiddleware = None
 
-# Initialize the database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Startup is lazy by default; each step below is opt-in
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "off")  # "off", "verify" or "create"
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", 0))  # connections to open before serving
 
 # Define allowed origins
 origins = [
@@ -18,19 +34,124 @@ origins = [
     "https://artisanbot-production.up.railway.app"  # Backend URL
 ]
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,  # or ["*"] to allow all origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Compress responses above the threshold (brotli when the client accepts it, gzip otherwise)
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+
+
+@contextmanager
+def _phase(timings: dict, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _start_database(timings: dict) -> None:
+    if not database.SQLALCHEMY_DATABASE_URL:
+        logger.warning("DATABASE_URL is not set; skipping database startup")
+        return
+    with _phase(timings, "db_engine"):
+        database.get_engine()
+    if DB_SCHEMA_CHECK in ("verify", "create"):
+        with _phase(timings, "db_schema_check"):
+            missing = database.check_schema(create=DB_SCHEMA_CHECK == "create")
+        if missing:
+            logger.error("Database is missing tables: %s", ", ".join(missing))
+    if DB_POOL_WARMUP > 0:
+        with _phase(timings, "db_pool_warmup"):
+            database.warm_up_pool(DB_POOL_WARMUP)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {}
+    with _phase(timings, "total"):
+        serve.size_threadpool()
+        await run_in_threadpool(_start_database, timings)
+        with _phase(timings, "llm_clients"):
+            llm.warm_up()
+        with _phase(timings, "intent_index"):
+            intents.warm_up()
+        with _phase(timings, "knowledge_index"):
+            await run_in_threadpool(knowledge.warm_up)
+        with _phase(timings, "event_broker"):
+            await get_broker().start()
+        with _phase(timings, "history_cache"):
+            await history.start()
+    await retention.task.start()
+    app.state.startup_timings = timings
+    logger.info("Startup phases (ms): %s", timings)
+
+    yield
+
+    # The server has stopped accepting requests; let generations it stopped waiting for write their replies
+    await serve.drain_generations()
+    await retention.task.stop()
+    await history.stop()
+    await get_broker().stop()
+    database.dispose_engine()
+
+
+async def llm_cancelled_handler(request: Request, exc: llm.Cancelled) -> JSONResponse:
+    # 499 is nginx's "client closed request"; nobody reads it, but it keeps logs honest
+    if exc.reason == llm.cancellation.DISCONNECTED:
+        return JSONResponse(status_code=499, content={"detail": "Client closed request"})
+    return JSONResponse(status_code=504, content={"detail": "The reply took too long and was cancelled. Please retry."})
+
+
+async def shard_moving_handler(request: Request, exc: sharding.ShardMovingError) -> JSONResponse:
+    # Raised when a request starts during a move, or its commit finds the user has moved since
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Your conversation history is being migrated. Please retry shortly."},
+        headers={"Retry-After": str(int(sharding.SHARD_MOVE_GRACE_SECONDS) + 1)},
+    )
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.state.startup_timings = {}
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,  # or ["*"] to allow all origins
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "Idempotent-Replayed", "X-Profile-Id"],
+    )
+
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+    app.add_exception_handler(llm.Cancelled, llm_cancelled_handler)
+    app.add_exception_handler(sharding.ShardMovingError, shard_moving_handler)
+
+    app.include_router(auth_router)
+    app.include_router(messages.router)
+    app.include_router(events.router)
+    app.include_router(analytics.router)
+    if profiling.PROFILING:
+        app.include_router(profiles.router)
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Welcome to the Chatbot API"}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "startup_ms": app.state.startup_timings}
+
+    # Installed last so it wraps the compression and CORS middleware and sees whole requests;
+    # with profiling off nothing is installed at all
+    if profiling.PROFILING:
+        profiling.install(app)
 
-app.include_router(auth_router)
-app.include_router(messages.router)
+    return app
 
 
-@app.get("/")
-def read_root():
-    return {"message": "Welcome to the Chatbot API"}
+app = create_app()
@@ -1,4 +1,14 @@
 from .message import Message
 from .user import User
+from .conversation_version import ConversationVersion
+from .change_counter import ChangeCounter
+from .usage import MessageUsage, DailyUsage
+from .user_shard import UserShard
+from .analytics import ContextDailyStats, UserContextStats
+from .idempotency import IdempotencyKey
+from .archive import MessageArchive
 
-__all__ = ["User", "Message"]
\ No newline at end of file
+__all__ = [
+    "User", "Message", "ConversationVersion", "ChangeCounter", "MessageUsage", "DailyUsage", "UserShard",
+    "ContextDailyStats", "UserContextStats", "IdempotencyKey", "MessageArchive",
+]
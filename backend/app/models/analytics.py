@@ -0,0 +1,40 @@
+# app/models/analytics.py
+
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from app.database import Base
+
+
+class ContextDailyStats(Base):
+    """
+    Per-day, per-context conversation counters, maintained by the message write paths.
+    The analytics endpoint reads only these rows, never `messages`.
+    """
+    __tablename__ = "context_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    context = Column(String, primary_key=True)
+    user_messages = Column(Integer, nullable=False, default=0)
+    assistant_messages = Column(Integer, nullable=False, default=0)
+    edits = Column(Integer, nullable=False, default=0)
+    deletes = Column(Integer, nullable=False, default=0)
+    fallbacks = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0.0)
+    active_users = Column(Integer, nullable=False, default=0)
+
+
+class UserContextStats(Base):
+    """
+    Lifetime per-user, per-context counters. `last_active_day` lets the write path count each user
+    once per day in ContextDailyStats.active_users.
+    """
+    __tablename__ = "user_context_stats"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    context = Column(String, primary_key=True)
+    user_messages = Column(Integer, nullable=False, default=0)
+    assistant_messages = Column(Integer, nullable=False, default=0)
+    edits = Column(Integer, nullable=False, default=0)
+    deletes = Column(Integer, nullable=False, default=0)
+    fallbacks = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0.0)
+    last_active_day = Column(Date, nullable=True)
@@ -0,0 +1,31 @@
+# app/models/archive.py
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class MessageArchive(Base):
+    """
+    Edited and deleted messages moved out of `messages` by the retention job (RETENTION_MODE=archive).
+    Same columns as Message, without foreign keys, so archived rows never block anything.
+    """
+    __tablename__ = "messages_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    role = Column(String)
+    content = Column(String)
+    timestamp = Column(DateTime(timezone=True))
+    user_id = Column(Integer, nullable=False)
+    context = Column(String)
+    is_edited = Column(Boolean)
+    is_deleted = Column(Boolean)
+    is_aborted = Column(Boolean)
+    change_seq = Column(BigInteger)
+    parent_id = Column(Integer)
+    superseded_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_archive_user_timestamp', 'user_id', 'timestamp'),
+    )
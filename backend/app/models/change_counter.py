@@ -0,0 +1,16 @@
+# app/models/change_counter.py
+
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey
+from app.database import Base
+
+
+class ChangeCounter(Base):
+    """
+    Last change sequence handed out for a user's messages.
+    The row lock taken while incrementing it orders concurrent writers, so a user's
+    change_seq values become visible in increasing order.
+    """
+    __tablename__ = "message_change_counters"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
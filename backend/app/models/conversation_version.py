@@ -0,0 +1,16 @@
+# app/models/conversation_version.py
+
+from sqlalchemy import Column, Integer, String, ForeignKey
+from app.database import Base
+
+
+class ConversationVersion(Base):
+    """
+    Per-(user, context) counter bumped by every write to that conversation.
+    Used to build ETags for the message list without running the list query.
+    """
+    __tablename__ = "conversation_versions"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    context = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,25 @@
+# app/models/idempotency.py
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    """
+    A client-supplied Idempotency-Key and the outcome of the request that first used it.
+    `status_code` is NULL while that request is still running. Times are naive UTC.
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path and body
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)
+    message_id = Column(Integer, nullable=True)
+    locked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_idempotency_expires_at', 'expires_at'),
+    )
@@ -1,7 +1,7 @@
 # app/models/message.py
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy.sql import func, false
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -17,6 +17,9 @@ class Message(Base):
     context = Column(String, default="Onboarding")  # New field
     is_edited = Column(Boolean, default=False)  # New field
     is_deleted = Column(Boolean, default=False)  # For delete functionality
+    is_aborted = Column(Boolean, nullable=False, default=False, server_default=false())  # Reply cancelled (client left or deadline)
+    change_seq = Column(BigInteger, nullable=True)  # Per-user sequence, bumped on insert, edit and delete
+    superseded_at = Column(DateTime(timezone=True), nullable=True)  # When it was edited or deleted; retention counts from here
 
     parent_id = Column(Integer, ForeignKey('messages.id'), nullable=True)  # New field
     parent_message = relationship('Message', remote_side=[id], backref='responses')
@@ -25,4 +28,5 @@ class Message(Base):
 # index optimizes queries filtering by both user_id and context
     __table_args__ = (
         Index('idx_user_context', 'user_id', 'context'),
+        Index('idx_user_change_seq', 'user_id', 'change_seq'),
     )
@@ -0,0 +1,33 @@
+# app/models/usage.py
+
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, ForeignKey
+from app.database import Base
+
+
+class MessageUsage(Base):
+    """
+    LLM cost of one assistant message: which model answered, tokens used and generation latency.
+    Fallback replies are recorded with model "fallback" and zero tokens.
+    """
+    __tablename__ = "message_usage"
+
+    message_id = Column(Integer, ForeignKey('messages.id'), primary_key=True)
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=False, default=0.0)
+
+
+class DailyUsage(Base):
+    """
+    Per-user, per-day totals of MessageUsage, maintained incrementally on every write.
+    Budget checks read a single row instead of summing message_usage.
+    """
+    __tablename__ = "daily_usage"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0.0)
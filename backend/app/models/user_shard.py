@@ -0,0 +1,16 @@
+# app/models/user_shard.py
+
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from app.database import Base
+
+
+class UserShard(Base):
+    """
+    Directory entry pinning a user's message data to a shard.
+    Lives in the directory database next to `users`; `moving` is set while the rebalancer copies the user.
+    """
+    __tablename__ = "user_shards"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    shard = Column(String, nullable=False, index=True)
+    moving = Column(Boolean, nullable=False, default=False)
@@ -0,0 +1,367 @@
+# app/profiling.py
+"""
+Opt-in per-request profiling.
+
+With PROFILING=on, a request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is picked
+by PROFILE_SAMPLE_RATE. A profiled request records:
+- spans: auth, every DB statement, prompt assembly in generate_response, the LLM call, the
+  endpoint body and JSON serialization, with start offsets and durations;
+- samples: a statistical profiler reads the stacks of the threads currently inside one of the
+  request's spans every PROFILE_INTERVAL_MS, collapsed into "outer;...;inner" -> count
+  (the format flamegraph.pl and speedscope read).
+
+Profiles are written as JSON to PROFILE_DIR, which keeps the newest PROFILE_MAX_FILES, and the
+response gets an X-Profile-Id header. GET /profiles lists them and GET /profiles/{id} downloads one.
+
+With PROFILING=off (the default) neither the middleware, the routes nor the SQLAlchemy hooks are
+installed; span() is then a single context variable read returning a shared no-op.
+"""
+import contextvars
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+PROFILING = os.getenv("PROFILING", "off") == "on"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "artisan-profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+PROFILE_HEADER = "x-profile"
+MAX_STACK_DEPTH = 64
+MAX_DETAIL_CHARS = 200
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, method: str, path: str):
+        self.started_at = datetime.now(timezone.utc)
+        # Ids sort by start time, which is what the ring's pruning relies on
+        self.id = f"{self.started_at:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.start = time.perf_counter()
+        self.duration_ms = 0.0
+        self.spans: list[dict] = []
+        self.samples: Counter = Counter()
+        self._active: dict[int, int] = {}  # thread id -> open span depth
+        self._lock = threading.Lock()
+
+    def enter(self, thread: int) -> None:
+        with self._lock:
+            self._active[thread] = self._active.get(thread, 0) + 1
+
+    def exit(self, thread: int, name: str, start: float, detail: Optional[str]) -> None:
+        end = time.perf_counter()
+        with self._lock:
+            depth = self._active.get(thread, 1) - 1
+            if depth:
+                self._active[thread] = depth
+            else:
+                self._active.pop(thread, None)
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                "thread": thread,
+                "detail": detail,
+            })
+
+    def active_threads(self) -> list[int]:
+        with self._lock:
+            return list(self._active)
+
+    def add_sample(self, stack: str) -> None:
+        with self._lock:
+            self.samples[stack] += 1
+
+    def to_dict(self) -> dict:
+        totals: dict[str, dict] = {}
+        for span in self.spans:
+            total = totals.setdefault(span["name"], {"count": 0, "duration_ms": 0.0})
+            total["count"] += 1
+            total["duration_ms"] = round(total["duration_ms"] + span["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "span_totals": totals,
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+            "samples": dict(self.samples.most_common()),
+        }
+
+
+class _Span:
+    __slots__ = ("profile", "name", "detail", "thread", "start")
+
+    def __init__(self, profile: Profile, name: str, detail: Optional[str]):
+        self.profile = profile
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.thread = threading.get_ident()
+        self.profile.enter(self.thread)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.exit(self.thread, self.name, self.start, self.detail)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, detail: Optional[str] = None):
+    """Time a block as part of the current request's profile; a no-op when it isn't profiled."""
+    profile = _current.get()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name, detail[:MAX_DETAIL_CHARS] if detail else None)
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """One background thread sampling the active threads of every profile in flight."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._profiles:
+                    self._wake.wait()
+                profiles = list(self._profiles)
+            frames = sys._current_frames()
+            for profile in profiles:
+                for thread in profile.active_threads():
+                    frame = frames.get(thread)
+                    if frame is not None and thread != me:
+                        profile.add_sample(_collapse(frame))
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring of profile files; the oldest are deleted past `max_files`. Each profile
+    has a small `<id>.summary.json` next to it, so listing doesn't parse the samples.
+    """
+
+    SUMMARY_KEYS = ("id", "method", "path", "status", "started_at", "duration_ms", "span_totals")
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, profile: Profile) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        data = profile.to_dict()
+        # Summary first: an id is listed once its full file exists
+        self._write(self._summary_path(profile.id), {key: data[key] for key in self.SUMMARY_KEYS})
+        self._write(self.path(profile.id), data)
+        with self._lock:
+            for stale in self.list_ids()[self.max_files:]:
+                for path in (self.path(stale), self._summary_path(stale)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    @staticmethod
+    def _write(path: str, data: dict) -> None:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def list_ids(self) -> list[str]:
+        """Profile ids, newest first (ids start with their UTC timestamp)."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            (name[:-5] for name in names if name.endswith(".json") and not name.endswith(".summary.json")),
+            reverse=True,
+        )
+
+    def path(self, profile_id: str, suffix: str = ".json") -> str:
+        # Ids come from URLs; only plain ids map to files in the ring
+        if not profile_id.replace("-", "").replace("T", "").isalnum():
+            raise ValueError(f"Invalid profile id '{profile_id}'.")
+        return os.path.join(self.directory, f"{profile_id}{suffix}")
+
+    def _summary_path(self, profile_id: str) -> str:
+        return self.path(profile_id, ".summary.json")
+
+    def _read(self, profile_id: str, suffix: str) -> Optional[dict]:
+        try:
+            with open(self.path(profile_id, suffix), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        return self._read(profile_id, ".json")
+
+    def summary(self, profile_id: str) -> Optional[dict]:
+        """The profile without its spans and samples."""
+        return self._read(profile_id, ".summary.json")
+
+
+store = ProfileStore()
+sampler = Sampler()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware deciding per request whether to profile it."""
+
+    def __init__(self, app, token: str = PROFILE_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 profile_store: Optional[ProfileStore] = None):
+        self.app = app
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.store = profile_store or store
+
+    def _wanted(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        reset = _current.set(profile)
+        sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.remove(profile)
+            _current.reset(reset)
+            profile.duration_ms = (time.perf_counter() - profile.start) * 1000
+            try:
+                await run_in_threadpool(self.store.save, profile)
+            except OSError as e:
+                logger.error("Failed to save profile %s: %s", profile.id, e)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None:
+        db_span = _Span(profile, "db", statement[:MAX_DETAIL_CHARS])
+        db_span.__enter__()
+        conn.info.setdefault("profile_spans", []).append(db_span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("profile_spans")
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+
+def _handle_error(context):
+    spans = context.connection.info.get("profile_spans") if context.connection is not None else None
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+
+def instrument_endpoints(app) -> None:
+    """Wrap every route's endpoint in an "endpoint" span, so its thread is sampled for the whole body."""
+    import asyncio
+    import functools
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        call = route.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            async def wrapped(*args, __call=call, __name=route.path, **kwargs):
+                with span("endpoint", __name):
+                    return await __call(*args, **kwargs)
+        else:
+            def wrapped(*args, __call=call, __name=route.path, **kwargs):
+                with span("endpoint", __name):
+                    return __call(*args, **kwargs)
+        route.dependant.call = functools.wraps(call)(wrapped)
+
+
+def install(app, **options) -> None:
+    """Enable profiling on `app`: middleware, endpoint spans and DB statement hooks. `options` go to the middleware."""
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    instrument_endpoints(app)
+    app.add_middleware(ProfilingMiddleware, **options)
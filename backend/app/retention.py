@@ -0,0 +1,318 @@
+# app/retention.py
+"""
+Retention for superseded messages.
+
+Editing or deleting a message only flags it (is_edited / is_deleted), so dead rows accumulate in
+`messages` and its indexes. This job removes rows flagged more than RETENTION_DAYS ago (superseded_at), either for
+good (RETENTION_MODE=delete) or by moving them to `messages_archive` (RETENTION_MODE=archive).
+Their message_usage rows are removed with them; daily_usage keeps the totals.
+
+Work is done in short keyset-ordered batches, one transaction each, so no lock is held for long.
+The batch size adapts to observed latency: a batch slower than RETENTION_TARGET_BATCH_MS halves
+it, fast batches grow it back, and after every batch the job pauses RETENTION_SLEEP_RATIO times
+the batch's duration, which caps its share of database time.
+
+A flagged row that a message staying behind still points to via parent_id is kept; dead replies
+of a purged row are purged with it even when they fall outside the current batch.
+
+Edited and deleted rows are the tombstones of the change feed (GET /messages/changes), so keep
+RETENTION_DAYS longer than any client is expected to stay offline between syncs.
+
+    python -m app.retention [--days 30] [--mode delete|archive] [--dry-run]
+
+Each run also deletes expired Idempotency-Key records (see app/idempotency.py) in the same throttled
+batches, oldest expiry first.
+
+Set RETENTION_INTERVAL_HOURS to also run it from the app; on Postgres an advisory lock makes sure
+only one worker runs it at a time.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 30))
+RETENTION_MODE = os.getenv("RETENTION_MODE", "delete")  # "delete" or "archive"
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+RETENTION_MIN_BATCH_SIZE = int(os.getenv("RETENTION_MIN_BATCH_SIZE", 20))
+RETENTION_TARGET_BATCH_MS = float(os.getenv("RETENTION_TARGET_BATCH_MS", 250))
+RETENTION_SLEEP_RATIO = float(os.getenv("RETENTION_SLEEP_RATIO", 1.0))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", 0))  # 0: no background runs
+RETENTION_LOCK_ID = 0x52455445  # pg advisory lock key
+
+Message = models.Message
+ARCHIVE_COLUMNS = [column.name for column in models.MessageArchive.__table__.columns if column.name != "archived_at"]
+
+
+@dataclass
+class RetentionStats:
+    shard: str
+    cutoff: datetime
+    mode: str
+    scanned: int = 0
+    purged: int = 0
+    kept_referenced: int = 0
+    batches: int = 0
+    batch_size: int = 0
+    last_id: int = 0
+    seconds: float = 0.0
+    paused_seconds: float = 0.0
+    finished: bool = False
+    expired_keys: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Throttle:
+    """Adapts the batch size to batch latency and spaces batches out in proportion to it."""
+    batch_size: int = RETENTION_BATCH_SIZE
+    max_batch_size: int = RETENTION_BATCH_SIZE
+    min_batch_size: int = RETENTION_MIN_BATCH_SIZE
+    target_ms: float = RETENTION_TARGET_BATCH_MS
+    sleep_ratio: float = RETENTION_SLEEP_RATIO
+    sleep: Callable[[float], None] = field(default=time.sleep, repr=False)
+
+    def after_batch(self, elapsed: float) -> float:
+        """Record a batch's duration, pause, and return the pause in seconds."""
+        if elapsed * 1000 > self.target_ms:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif elapsed * 1000 < self.target_ms / 2:
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(self.batch_size // 4, 1))
+        pause = elapsed * self.sleep_ratio
+        if pause > 0:
+            self.sleep(pause)
+        return pause
+
+
+def _superseded(cutoff: datetime):
+    # Counted from the edit or delete, not from creation: a tombstone stays in the change feed for RETENTION_DAYS
+    return and_(or_(Message.is_deleted == True, Message.is_edited == True), Message.superseded_at < cutoff)
+
+
+def _purgeable(db: Session, ids: list[int], cutoff: datetime) -> tuple[list[int], int]:
+    """
+    The rows to purge for a batch of superseded ids: the batch plus its superseded replies,
+    minus rows a remaining message still references. Returns (ids, number kept).
+    """
+    candidates = set(ids)
+    candidates.update(db.execute(
+        select(Message.id).where(_superseded(cutoff), Message.parent_id.in_(ids))
+    ).scalars())
+    kept = 0
+    while True:
+        # Repeat until stable: keeping a row can make the row it points to referenced as well
+        referenced = set(db.execute(
+            select(Message.parent_id).where(Message.parent_id.in_(sorted(candidates)), Message.id.notin_(sorted(candidates)))
+        ).scalars())
+        if not referenced:
+            return sorted(candidates), kept
+        candidates -= referenced
+        kept += len(referenced)
+
+
+def purge(db: Session, cutoff: Optional[datetime] = None, mode: str = RETENTION_MODE,
+          throttle: Optional[Throttle] = None, shard: str = "primary",
+          progress: Optional[Callable[[RetentionStats], None]] = None,
+          stop: Optional[threading.Event] = None) -> RetentionStats:
+    """Purge or archive messages superseded before `cutoff`, batch by batch."""
+    if mode not in ("delete", "archive"):
+        raise ValueError(f"Unknown retention mode '{mode}'.")
+    cutoff = cutoff or datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+    throttle = throttle or Throttle()
+    stats = RetentionStats(shard=shard, cutoff=cutoff, mode=mode, batch_size=throttle.batch_size)
+    started = time.perf_counter()
+
+    while stop is None or not stop.is_set():
+        batch_started = time.perf_counter()
+        ids = list(db.execute(
+            select(Message.id).where(_superseded(cutoff), Message.id > stats.last_id)
+            .order_by(Message.id).limit(throttle.batch_size)
+        ).scalars())
+        if not ids:
+            stats.finished = True
+            db.commit()
+            break
+        purgeable, kept = _purgeable(db, ids, cutoff)
+        if purgeable:
+            if mode == "archive":
+                db.execute(insert(models.MessageArchive).from_select(
+                    ARCHIVE_COLUMNS,
+                    select(*(Message.__table__.c[name] for name in ARCHIVE_COLUMNS)).where(Message.id.in_(purgeable))
+                ))
+            db.execute(delete(models.MessageUsage).where(models.MessageUsage.message_id.in_(purgeable)))
+            db.execute(delete(Message).where(Message.id.in_(purgeable)))
+        db.commit()
+
+        stats.scanned += len(ids)
+        stats.purged += len(purgeable)
+        stats.kept_referenced += kept
+        stats.batches += 1
+        stats.last_id = ids[-1]
+        stats.paused_seconds += throttle.after_batch(time.perf_counter() - batch_started)
+        stats.batch_size = throttle.batch_size
+        stats.seconds = time.perf_counter() - started
+        if progress:
+            progress(stats)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def purge_idempotency_keys(db: Session, throttle: Optional[Throttle] = None,
+                           stop: Optional[threading.Event] = None) -> int:
+    """Delete expired Idempotency-Key records in batches along their expires_at index. Returns the count."""
+    Key = models.IdempotencyKey
+    throttle = throttle or Throttle()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # stored as naive UTC
+    deleted = 0
+    while stop is None or not stop.is_set():
+        batch_started = time.perf_counter()
+        keys = db.execute(
+            select(Key.user_id, Key.key).where(Key.expires_at < now).order_by(Key.expires_at).limit(throttle.batch_size)
+        ).all()
+        if not keys:
+            db.commit()
+            break
+        db.execute(delete(Key).where(tuple_(Key.user_id, Key.key).in_([tuple(key) for key in keys])))
+        db.commit()
+        deleted += len(keys)
+        throttle.after_batch(time.perf_counter() - batch_started)
+    return deleted
+
+
+def count_superseded(db: Session, cutoff: datetime) -> int:
+    return db.execute(select(func.count()).select_from(Message).where(_superseded(cutoff))).scalar()
+
+
+def _targets() -> list[tuple[str, Engine]]:
+    from .database import get_engine
+    from .sharding import get_router
+
+    router = get_router()
+    if router is not None:
+        return list(router.engines.items())
+    return [("primary", get_engine())]
+
+
+def _log_progress(stats: RetentionStats) -> None:
+    logger.info(
+        "Retention %s: %s scanned, %s purged, %s kept (referenced), batch size %s, %.1fs",
+        stats.shard, stats.scanned, stats.purged, stats.kept_referenced, stats.batch_size, stats.seconds
+    )
+
+
+last_run: list[dict] = []
+
+
+def run(cutoff: Optional[datetime] = None, mode: str = RETENTION_MODE,
+        progress: Callable[[RetentionStats], None] = _log_progress,
+        stop: Optional[threading.Event] = None) -> list[RetentionStats]:
+    """Run the purge on the primary, or on every shard, skipping databases another worker is purging."""
+    global last_run
+    results = []
+    for name, engine in _targets():
+        with engine.connect() as lock:
+            if engine.dialect.name == "postgresql":
+                if not lock.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RETENTION_LOCK_ID}).scalar():
+                    logger.info("Retention already running on %s; skipping", name)
+                    continue
+            try:
+                db = Session(bind=engine, autoflush=False)
+                try:
+                    stats = purge(db, cutoff=cutoff, mode=mode, shard=name, progress=progress, stop=stop)
+                    stats.expired_keys = purge_idempotency_keys(db, stop=stop)
+                    results.append(stats)
+                finally:
+                    db.close()
+            finally:
+                if engine.dialect.name == "postgresql":
+                    lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RETENTION_LOCK_ID})
+    last_run = [stats.as_dict() for stats in results]
+    return results
+
+
+class RetentionTask:
+    """Runs the purge every RETENTION_INTERVAL_HOURS in the app's event loop (the work itself in a thread)."""
+
+    def __init__(self, interval_hours: float = RETENTION_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Stop the loop; a run in progress finishes its current batch first, so the engine can be disposed after."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._stop.set()
+        if not self._running:
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            await asyncio.sleep(self.interval)
+            self._running = True
+            try:
+                await run_in_threadpool(run, stop=self._stop)
+            except Exception as e:
+                logger.error("Retention run failed: %s", e)
+            finally:
+                self._running = False
+
+
+task = RetentionTask()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Purge or archive edited and deleted messages.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Keep superseded messages this many days")
+    parser.add_argument("--mode", choices=("delete", "archive"), default=RETENTION_MODE)
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be purged")
+    args = parser.parse_args(argv)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=args.days)
+    if args.dry_run:
+        for name, engine in _targets():
+            with Session(bind=engine) as db:
+                print(f"{name}: {count_superseded(db, cutoff)} messages superseded before {cutoff:%Y-%m-%d}")
+        return
+
+    def report(stats: RetentionStats) -> None:
+        print(
+            f"{stats.shard}: {stats.scanned} scanned, {stats.purged} {'archived' if stats.mode == 'archive' else 'deleted'}, "
+            f"{stats.kept_referenced} kept, batch {stats.batch_size}, {stats.scanned / max(stats.seconds, 1e-9):.0f} rows/sec"
+        )
+
+    for stats in run(cutoff=cutoff, mode=args.mode, progress=report):
+        print(f"{stats.shard}: done, {stats.purged} rows in {stats.seconds:.1f}s ({stats.paused_seconds:.1f}s throttled), "
+              f"{stats.expired_keys} expired idempotency keys deleted")
+
+
+if __name__ == "__main__":
+    main()
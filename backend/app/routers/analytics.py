@@ -0,0 +1,96 @@
+# backend/app/routers/analytics.py
+
+from datetime import date, timedelta
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import intents, retention, sharding
+from ..auth import get_current_user
+from ..crud import analytics as crud
+from ..crud.usage import today
+from ..database import get_db
+from ..dependencies import get_user_db
+from ..schemas.analytics import ContextDailyStats, ConversationStats, IntentStats
+from ..schemas.user import UserRead
+
+# Usernames allowed to read product-wide analytics
+ANALYTICS_ADMINS = {name.strip() for name in os.getenv("ANALYTICS_ADMINS", "").split(",") if name.strip()}
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+    dependencies=[Depends(get_current_user)],
+)
+
+
+def _require_admin(current_user: UserRead) -> None:
+    if current_user.username not in ANALYTICS_ADMINS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read analytics")
+
+
+def _rates(row: dict) -> dict:
+    user_messages, replies = row["user_messages"], row["assistant_messages"]
+    return {
+        **row,
+        "edit_rate": row["edits"] / user_messages if user_messages else 0.0,
+        "delete_rate": row["deletes"] / user_messages if user_messages else 0.0,
+        "fallback_rate": row["fallbacks"] / replies if replies else 0.0,
+        "avg_reply_latency_ms": row["latency_ms_total"] / replies if replies else None,
+    }
+
+
+@router.get("/", response_model=list[ContextDailyStats])
+def read_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    context: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: UserRead = Depends(get_current_user)
+):
+    _require_admin(current_user)
+    end = end or today()
+    start = start or end - timedelta(days=29)
+
+    # Each shard holds partial aggregates for its users; a user lives on one shard, so sums are exact
+    shard_router = sharding.get_router()
+    sessions = [shard_router.session(name) for name in shard_router.names] if shard_router else [db]
+    totals: dict[tuple, dict] = {}
+    try:
+        for session in sessions:
+            for stats in crud.get_context_stats(session, start, end, context):
+                row = totals.setdefault((stats.day, stats.context), {
+                    "day": stats.day, "context": stats.context, "active_users": 0,
+                    **{column: 0 for column in crud.STAT_COLUMNS},
+                })
+                for column in (*crud.STAT_COLUMNS, "active_users"):
+                    row[column] += getattr(stats, column)
+    finally:
+        if shard_router:
+            for session in sessions:
+                session.close()
+    return [_rates(totals[key]) for key in sorted(totals)]
+
+
+@router.get("/me", response_model=list[ConversationStats])
+def read_my_analytics(db: Session = Depends(get_user_db), current_user: UserRead = Depends(get_current_user)):
+    return [
+        _rates({"context": stats.context, **{column: getattr(stats, column) for column in crud.STAT_COLUMNS}})
+        for stats in crud.get_user_stats(db, current_user.id)
+    ]
+
+
+@router.get("/intents", response_model=IntentStats)
+def read_intent_stats(current_user: UserRead = Depends(get_current_user)):
+    """FAQ fast-path and fallback hit rates since this process started."""
+    _require_admin(current_user)
+    return {"hit_rates": intents.stats.snapshot(), "intents": intents.stats.intent_hits()}
+
+
+@router.get("/retention")
+def read_retention_stats(current_user: UserRead = Depends(get_current_user)):
+    """Per-database results of this process's last retention run (see app/retention.py)."""
+    _require_admin(current_user)
+    return {"interval_hours": retention.RETENTION_INTERVAL_HOURS, "last_run": retention.last_run}
@@ -0,0 +1,80 @@
+# backend/app/routers/events.py
+
+import asyncio
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.orm import Session
+
+from ..auth import authenticate_token
+from ..database import get_db
+from ..events import EVICTED, get_broker
+
+# A send that takes longer than this means the client is not reading; treat it as a slow consumer
+EVENT_SEND_TIMEOUT = float(os.getenv("EVENT_SEND_TIMEOUT", 10))
+
+router = APIRouter(tags=["events"])
+
+
+def _bearer_token(websocket: WebSocket, token: Optional[str]) -> Optional[str]:
+    # Browsers cannot set headers on a WebSocket handshake, so the token may come as a query parameter
+    if token:
+        return token
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, credentials = authorization.partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    return None
+
+
+@router.websocket("/ws")
+async def message_events(websocket: WebSocket, token: Optional[str] = None, db: Session = Depends(get_db)):
+    access_token = _bearer_token(websocket, token)
+    try:
+        if access_token is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        current_user = authenticate_token(access_token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        # The session is only needed for the handshake; don't pin a connection for the socket's lifetime
+        db.close()
+
+    await websocket.accept()
+    broker = get_broker()
+    await broker.start()
+    subscription = broker.subscribe(current_user.id)
+
+    async def watch_disconnect():
+        # Clients don't send anything; receiving only detects the close frame
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    disconnect = asyncio.create_task(watch_disconnect())
+    try:
+        while True:
+            next_event = asyncio.create_task(subscription.get())
+            done, _ = await asyncio.wait({next_event, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                next_event.cancel()
+                return
+            event = next_event.result()
+            if event is EVICTED:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            try:
+                await asyncio.wait_for(websocket.send_text(json.dumps(event)), EVENT_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                broker.evict(subscription)
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnect.cancel()
+        broker.unsubscribe(subscription)
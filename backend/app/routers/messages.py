@@ -1,15 +1,28 @@
 # backend/app/routers/messages.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from ..crud import message as crud
-from ..schemas.message import Message, MessageCreate, MessageUpdate, ClickActionRequest
-from ..database import get_db
+from ..crud.version import get_version
+from ..schemas.message import Message, MessageBatchCreate, MessageCreate, MessageUpdate, MessageChanges, ClickActionRequest, ImportResult
+from ..dependencies import get_cancel_token, get_read_db, get_user_db
+from ..llm import CancelToken
 from ..auth import get_current_user
+from ..serialization import json_response, dumps, dumps_ndjson, dumps_csv
+from .. import batch as batches, models
+from ..importer import MessageImporter
+from ..idempotency import fingerprint, run_idempotent
 from ..schemas.user import UserRead
-from typing import Optional
+from ..sharding import ShardMovingError
+from typing import Literal, Optional
+from datetime import datetime, timezone
+import hashlib
+import logging
 
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/messages",
@@ -20,55 +33,224 @@ router = APIRouter(
 
 
 @router.post("/", response_model=Message)
-def create_message(message: MessageCreate, db: Session = Depends(get_db), current_user: UserRead = Depends(get_current_user)):
+def create_message(
+    request: Request,
+    message: MessageCreate,
+    db: Session = Depends(get_user_db),
+    current_user: UserRead = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+    cancel: CancelToken = Depends(get_cancel_token)
+):
     if message.role != "user":
         raise HTTPException(status_code=400, detail="Only user can create messages.")
-    return crud.create_message(db=db, message=message, user_id=current_user.id)
+    # Retried requests with the same Idempotency-Key get the first response instead of a second LLM call
+    return run_idempotent(
+        db, current_user.id, idempotency_key, fingerprint("POST", request.url.path, message),
+        lambda: crud.create_message(db=db, message=message, user_id=current_user.id, cancel=cancel),
+        response_model=Message
+    )
+
+@router.post("/batch")
+async def create_message_batch(
+    batch: MessageBatchCreate,
+    db: Session = Depends(get_user_db),
+    current_user: UserRead = Depends(get_current_user)
+):
+    """
+    Answer several inputs for one context concurrently (see app/batch.py). The response is NDJSON:
+    one {"type": "result"} line per input as soon as its reply is ready (in completion order, with
+    the input's `index`), then one {"type": "saved"} line with the stored messages, or one
+    {"type": "error"} line if they could not be stored.
+    """
+    if len(batch.inputs) > batches.BATCH_MAX_INPUTS:
+        raise HTTPException(status_code=422, detail=f"A batch takes at most {batches.BATCH_MAX_INPUTS} inputs.")
+    # The stream outlives the request's dependencies, so it gets its own session on the same database
+    bind = db.get_bind(models.Message)
+    user_id, context = current_user.id, batch.context
+    started = datetime.now(timezone.utc)
+
+    async def body():
+        results = []
+        async for result in batches.generate(bind, user_id, context, batch.inputs):
+            results.append(result)
+            line = {"type": "result", "index": result.index, "input": result.content}
+            if result.completion is not None:
+                line.update(reply=result.completion.content, model=result.completion.model,
+                            latency_ms=round(result.completion.latency_ms, 1))
+            else:
+                line["error"] = result.error
+            yield dumps(line) + b"\n"
+
+        # Keep the shard pin: the commit re-checks that the user hasn't moved while the calls ran
+        pin = {"shard_pin": db.info["shard_pin"]} if "shard_pin" in db.info else {}
+        save_db = Session(bind=bind, autoflush=False, info=pin)
+        try:
+            rows = await run_in_threadpool(batches.save, save_db, user_id, context, results, started)
+        except ShardMovingError:
+            yield dumps({"type": "error", "detail": "Your conversation history was migrated during the batch; nothing was saved. Please retry."}) + b"\n"
+            return
+        except Exception:
+            logger.exception("Failed to save batch for user %s", user_id)
+            yield dumps({"type": "error", "detail": "The replies could not be saved. Please retry."}) + b"\n"
+            return
+        finally:
+            save_db.close()
+        yield dumps({"type": "saved", "messages": rows}) + b"\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
 # @router.get("/{message_id}", response_model=Message)
-# def read_message(message_id: int, db: Session = Depends(get_db), current_user: UserRead = Depends(get_current_user)):
+# def read_message(message_id: int, db: Session = Depends(get_user_db), current_user: UserRead = Depends(get_current_user)):
 #     db_message = crud.get_message(db=db, message_id=message_id, user_id=current_user.id)
 #     if db_message is None:
 #         raise HTTPException(status_code=404, detail="Message not found")
 #     return db_message
 
+def _list_etag(user_id: int, context: Optional[str], version: int, skip: int, limit: int) -> str:
+    # Weak validator: the same (user, context, version, page) means the same messages, but the bytes
+    # differ between brotli, gzip and identity encodings
+    raw = f"{user_id}:{context}:{version}:{skip}:{limit}".encode()
+    return 'W/"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 @router.get("/", response_model=list[Message])
 def read_messages(
+    request: Request,
     skip: int = 0, 
     limit: int = 10, 
     context: Optional[str] = None,  # Context parameter
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
+    current_user: UserRead = Depends(get_current_user)
+):
+    # An empty context lists every context (get_message_rows); the version must cover them all too
+    context = context or None
+    # Only the version lookup runs when the client already has the current page
+    version = get_version(db, current_user.id, context)
+    etag = _list_etag(current_user.id, context, version, skip, limit)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    # Rows already match the Message schema; serialize them directly instead of through response_model
+    rows = crud.get_message_rows(db=db, user_id=current_user.id, skip=skip, limit=limit, context=context)
+    return json_response(rows, headers=cache_headers)
+
+
+@router.get("/changes", response_model=MessageChanges)
+def read_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+    current_user: UserRead = Depends(get_current_user)
+):
+    # Fetch one extra row to know whether another batch is waiting
+    changes = crud.get_changes(db=db, user_id=current_user.id, since=since, limit=limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    cursor = changes[-1].change_seq if changes else since
+    return {"changes": changes, "cursor": cursor, "has_more": has_more}
+
+
+@router.get("/export")
+def export_messages(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    context: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
     current_user: UserRead = Depends(get_current_user)
 ):
-    return crud.get_messages(db=db, user_id=current_user.id, skip=skip, limit=limit, context=context)
+    # The stream outlives the request's dependencies, so it gets its own session on the same database
+    stream_db = Session(bind=db.get_bind(models.Message), autoflush=False)
+    user_id = current_user.id
+
+    def body():
+        try:
+            first = True
+            for rows in crud.iter_message_rows(stream_db, user_id, context=context, start=start, end=end):
+                yield dumps_ndjson(rows) if format == "ndjson" else dumps_csv(rows, header=first)
+                first = False
+        finally:
+            stream_db.close()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="messages.{format}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+@router.post("/import", response_model=ImportResult)
+async def import_messages(
+    request: Request,
+    db: Session = Depends(get_user_db),
+    current_user: UserRead = Depends(get_current_user)
+):
+    """
+    Bulk import NDJSON history for the current user (see app/importer.py for the line format).
+    The body is consumed as a stream and inserted batch by batch; no LLM calls are made.
+    """
+    importer = MessageImporter(db, current_user.id)
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        if lines:
+            await run_in_threadpool(importer.feed, lines)
+    await run_in_threadpool(importer.feed, [pending])
+    await run_in_threadpool(importer.flush)
+    return importer.result()
 
 
 @router.delete("/{message_id}", response_model=Message)
-def delete_message_endpoint(message_id: int, db: Session = Depends(get_db), current_user: UserRead = Depends(get_current_user)):
+def delete_message_endpoint(message_id: int, db: Session = Depends(get_user_db), current_user: UserRead = Depends(get_current_user)):
     deleted_message = crud.delete_message(db=db, message_id=message_id, user_id=current_user.id)
     if not deleted_message:
         raise HTTPException(status_code=404, detail="Message not found or not authorized")
     return deleted_message
 
 @router.put("/{message_id}", response_model=Message)
-def update_message(message_id: int, update_data: MessageUpdate, db: Session = Depends(get_db), current_user: UserRead = Depends(get_current_user)):
-    updated_message = crud.update_message(db=db, message_id=message_id, new_content=update_data.content, user_id=current_user.id)
-    if not updated_message:
-        raise HTTPException(status_code=404, detail="Message not found or not authorized")
-    return updated_message
+def update_message(
+    request: Request,
+    message_id: int,
+    update_data: MessageUpdate,
+    db: Session = Depends(get_user_db),
+    current_user: UserRead = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+    cancel: CancelToken = Depends(get_cancel_token)
+):
+    def update():
+        updated_message = crud.update_message(
+            db=db, message_id=message_id, new_content=update_data.content, user_id=current_user.id, cancel=cancel
+        )
+        if not updated_message:
+            raise HTTPException(status_code=404, detail="Message not found or not authorized")
+        return updated_message
+
+    return run_idempotent(
+        db, current_user.id, idempotency_key, fingerprint("PUT", request.url.path, update_data),
+        update, response_model=Message
+    )
 
 
 @router.post("/click_action", response_model=Message)
 def click_action_endpoint(
     request: ClickActionRequest,
-    db: Session = Depends(get_db),
-    current_user: UserRead = Depends(get_current_user)
+    db: Session = Depends(get_user_db),
+    current_user: UserRead = Depends(get_current_user),
+    cancel: CancelToken = Depends(get_cancel_token)
 ):
-    print(f"Received action: {request.action_type}, context: {request.context}")
-    response_message = crud.handle_click_action(db, current_user.id, request.action_type, request.context)
+    logger.debug("Received action: %s, context: %s", request.action_type, request.context)
+    response_message = crud.handle_click_action(db, current_user.id, request.action_type, request.context, cancel=cancel)
 
     if response_message is None:
         raise HTTPException(status_code=500, detail="Error handling click action")
 
-    print(f"Generated response: {response_message.content}")
+    logger.debug("Generated response: %s", response_message.content)
     return response_message
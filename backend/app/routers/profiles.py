@@ -0,0 +1,47 @@
+# backend/app/routers/profiles.py
+
+import os
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from .. import profiling
+from ..auth import get_current_user
+from ..schemas.user import UserRead
+from .analytics import ANALYTICS_ADMINS
+
+# Usernames allowed to read request profiles (they include SQL and stack frames); defaults to ANALYTICS_ADMINS
+PROFILE_ADMINS = {name.strip() for name in os.getenv("PROFILE_ADMINS", "").split(",") if name.strip()} or ANALYTICS_ADMINS
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"],
+)
+
+
+def _require_admin(current_user: UserRead = Depends(get_current_user)) -> None:
+    if current_user.username not in PROFILE_ADMINS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read profiles")
+
+
+@router.get("/", dependencies=[Depends(_require_admin)])
+def list_profiles(limit: int = 50):
+    """The newest profiles in the on-disk ring, without their spans and samples."""
+    summaries = (profiling.store.summary(profile_id) for profile_id in profiling.store.list_ids()[:limit])
+    return [summary for summary in summaries if summary is not None]
+
+
+@router.get("/{profile_id}", dependencies=[Depends(_require_admin)])
+def download_profile(profile_id: str, format: Literal["json", "collapsed"] = "json"):
+    """
+    Download one profile: the full JSON, or with format=collapsed just the samples in
+    flamegraph.pl / speedscope collapsed-stack format.
+    """
+    profile = profiling.store.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    if format == "collapsed":
+        lines = "".join(f"{stack} {count}\n" for stack, count in profile["samples"].items())
+        return PlainTextResponse(lines, headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+    return FileResponse(profiling.store.path(profile_id), media_type="application/json", filename=f"{profile_id}.json")
@@ -0,0 +1,36 @@
+# app/schemas/analytics.py
+
+from pydantic import BaseModel
+from datetime import date
+from typing import Optional
+
+
+class ConversationStats(BaseModel):
+    context: str
+    user_messages: int
+    assistant_messages: int
+    edits: int
+    deletes: int
+    fallbacks: int
+    edit_rate: float
+    delete_rate: float
+    fallback_rate: float
+    avg_reply_latency_ms: Optional[float] = None
+
+
+class ContextDailyStats(ConversationStats):
+    day: date
+    active_users: int
+
+
+class IntentHitRate(BaseModel):
+    context: str
+    kind: str
+    lookups: int
+    hits: int
+    hit_rate: float
+
+
+class IntentStats(BaseModel):
+    hit_rates: list[IntentHitRate]
+    intents: dict[str, int]
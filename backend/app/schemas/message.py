@@ -1,8 +1,8 @@
 # app/schemas/message.py
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional, Union
 
 class MessageBase(BaseModel):
     role: str
@@ -25,9 +25,40 @@ class Message(MessageBase):
     parent_id: Optional[int] = None
     is_edited: bool
     is_deleted: bool
+    is_aborted: bool = False
+    change_seq: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class MessageBatchCreate(BaseModel):
+    """Several user inputs for one context, answered concurrently (POST /messages/batch)."""
+    inputs: list[str] = Field(min_length=1)
+    context: Optional[str] = "Onboarding"
+
+class MessageChanges(BaseModel):
+    changes: list[Message]
+    cursor: int  # pass back as `since` to continue
+    has_more: bool
+
 class MessageUpdate(BaseModel):
     content: str
+
+class MessageImport(BaseModel):
+    """
+    One line of a bulk import. `id` and `parent_id` are the source system's identifiers;
+    they are only used to pair assistant replies with user turns.
+    """
+    role: Literal["user", "assistant"]
+    content: str
+    context: Optional[str] = "Onboarding"
+    timestamp: Optional[datetime] = None
+    id: Optional[Union[int, str]] = None
+    parent_id: Optional[Union[int, str]] = None
+
+class ImportResult(BaseModel):
+    rows: int
+    skipped: int
+    errors: list[str]
+    seconds: float
+    rows_per_sec: float
@@ -1,10 +1,10 @@
-from .database import SessionLocal, engine, Base
+from .database import SessionLocal, get_engine, Base
 from .models.user import User
 from .models.message import Message
 from .auth import get_password_hash
 
 def seed():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
     db = SessionLocal()
     try:
         # test user
@@ -0,0 +1,38 @@
+# app/serialization.py
+
+from typing import Any, Iterable, Optional
+import csv
+import io
+import orjson
+from fastapi import Response
+
+from . import profiling
+
+# Pydantic renders UTC datetimes with a "Z" suffix; match it so both paths produce identical JSON
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=ORJSON_OPTIONS)
+
+
+def json_response(obj: Any, headers: Optional[dict] = None) -> Response:
+    """Return already-plain data as JSON, skipping response_model validation."""
+    with profiling.span("serialize"):
+        content = dumps(obj)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def dumps_ndjson(rows: Iterable[dict]) -> bytes:
+    """One JSON document per line, newline-terminated."""
+    return b"".join(dumps(row) + b"\n" for row in rows)
+
+
+def dumps_csv(rows: list[dict], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow({key: value.isoformat() if hasattr(value, "isoformat") else value for key, value in row.items()})
+    return buffer.getvalue().encode()
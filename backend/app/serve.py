@@ -0,0 +1,124 @@
+# app/serve.py
+"""
+Production server entrypoint:
+
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers N]
+
+- Workers: WEB_CONCURRENCY, else one per CPU available to the process. Each worker has its own DB
+  pool (DB_POOL_SIZE + DB_MAX_OVERFLOW connections), so size the database for workers x pool.
+- uvloop and httptools are used when installed, the stdlib loop and h11 otherwise.
+- The sync-endpoint threadpool is sized to THREADPOOL_SIZE, by default the DB pool size plus
+  overflow, so threads don't queue on the pool (set in the app lifespan, since it is per event loop).
+- On SIGTERM a worker stops accepting connections, lets in-flight requests (LLM generations
+  included) finish for up to SHUTDOWN_DRAIN_SECONDS, then waits for any generation still running
+  before closing the database. Set the platform's stop timeout above SHUTDOWN_DRAIN_SECONDS.
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Optional
+
+from .database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 0))  # 0: one worker per available CPU
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+# Longer than LLM_REQUEST_TIMEOUT, so a generation that started just before SIGTERM can finish
+SHUTDOWN_DRAIN_SECONDS = int(os.getenv("SHUTDOWN_DRAIN_SECONDS", 90))
+KEEP_ALIVE_SECONDS = int(os.getenv("KEEP_ALIVE_SECONDS", 5))
+
+
+def cpu_count() -> int:
+    try:
+        # Honours CPU affinity (taskset, container cpusets), unlike os.cpu_count()
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    return WEB_CONCURRENCY if WEB_CONCURRENCY > 0 else cpu_count()
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def size_threadpool(size: int = THREADPOOL_SIZE) -> None:
+    """Resize the threadpool sync endpoints and run_in_threadpool use; call from the running loop."""
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = size
+
+
+async def drain_generations(timeout: float = SHUTDOWN_DRAIN_SECONDS) -> bool:
+    """
+    Wait for LLM generations still running in this process. The server has already waited for open
+    requests; this covers calls it stopped waiting for, whose threads go on to write their reply.
+    """
+    from . import llm
+
+    if not llm.generations.count:
+        return True
+    logger.info("Waiting up to %ss for %s LLM generations to finish", timeout, llm.generations.count)
+    finished = await asyncio.to_thread(llm.generations.wait_idle, timeout)
+    if not finished:
+        logger.warning("Shutting down with %s LLM generations still running", llm.generations.count)
+    return finished
+
+
+def server_options(workers: Optional[int] = None) -> dict:
+    return {
+        "workers": workers or worker_count(),
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "lifespan": "on",
+        "proxy_headers": True,
+        # Trust X-Forwarded-For only from these proxies; set it to the load balancer's addresses
+        "forwarded_allow_ips": os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "timeout_keep_alive": KEEP_ALIVE_SECONDS,
+        "timeout_graceful_shutdown": SHUTDOWN_DRAIN_SECONDS,
+    }
+
+
+def multi_worker_warnings() -> list[str]:
+    """Process-local state that stops being shared once the API runs in several workers."""
+    from .database import DATABASE_REPLICA_URLS, REPLICA_STICKY_BACKEND
+    from .events import EVENT_BROKER
+    from .history import HISTORY_CACHE_BACKEND
+
+    warnings = []
+    if EVENT_BROKER != "redis":
+        warnings.append(f"EVENT_BROKER={EVENT_BROKER}: live events only reach sockets on the same worker")
+    if HISTORY_CACHE_BACKEND == "local":
+        warnings.append("HISTORY_CACHE_BACKEND=local: other workers build prompts from stale history after an edit")
+    if DATABASE_REPLICA_URLS and REPLICA_STICKY_BACKEND == "local":
+        warnings.append("REPLICA_STICKY_BACKEND=local: reads on another worker may miss the user's own writes")
+    return warnings
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the API with production server settings.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, help="default: WEB_CONCURRENCY or one per CPU")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    options = server_options(args.workers)
+    if options["workers"] > 1:
+        for warning in multi_worker_warnings():
+            logger.warning("Running %s workers with %s; use the redis backend", options["workers"], warning)
+    logger.info("Serving on %s:%s with %s", args.host, args.port, options)
+    uvicorn.run("app.main:app", host=args.host, port=args.port, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# app/sharding.py
+"""
+Hash-sharded message storage keyed by user_id.
+
+The directory database (DATABASE_URL) keeps `users` and `user_shards`. Everything else (messages and
+the per-user tables that hang off them) lives on the shard the user is pinned to. Shards are
+configured in order, and the order must never change; append new shards at the end:
+
+    SHARD_DATABASE_URLS="shard0=postgresql://...,shard1=postgresql://..."
+
+New users are placed with a consistent-hash ring, and the placement is pinned in `user_shards`, so
+adding a shard moves nobody until the rebalancer runs. The rebalancer moves one user at a time to
+their ring position. While a user is being moved, their requests get 503 with Retry-After.
+
+A request can outlive the placement it started with (an LLM call takes up to LLM_REQUEST_TIMEOUT),
+so every commit of a user's shard session re-reads the placement under a shared row lock and is
+rejected if the user moved or is moving. Flagging a move takes the row's exclusive lock, so it
+waits for commits that passed the check, and nothing reaches the old shard once copying starts.
+
+Message ids stay unique across shards because each shard's id sequence is interleaved: shard i
+hands out i+1, i+1+SHARD_ID_STRIDE, ... That keeps ids valid when a user's rows change shards.
+
+    python -m app.sharding create-schema
+    python -m app.sharding rebalance [--dry-run] [--limit N]
+"""
+import argparse
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import event, inspect, insert, select, delete, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import models
+from .database import Base, _create_engine, get_engine
+
+logger = logging.getLogger(__name__)
+
+SHARD_DATABASE_URLS = os.getenv("SHARD_DATABASE_URLS", "")
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", 128))
+SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", 1024))
+# Pause between flagging a move and copying, so requests already running can finish their reads.
+# Correctness doesn't depend on it: their writes are fenced by the placement check on commit.
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv("SHARD_MOVE_GRACE_SECONDS", 5))
+# How long a process trusts a cached placement; must stay below the move grace period
+SHARD_PLACEMENT_TTL = float(os.getenv("SHARD_PLACEMENT_TTL", 2))
+SHARD_COPY_BATCH_SIZE = 1000
+
+DIRECTORY_TABLES = {"users", "user_shards"}
+# Shard tables not owned by any one user (per-shard partial aggregates); they stay put when users move
+SHARD_LOCAL_TABLES = {"context_daily_stats"}
+
+
+class ShardMovingError(Exception):
+    """The user's data is being moved between shards; retry shortly."""
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    def __init__(self, nodes: list[str], vnodes: int = SHARD_VNODES):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key) -> str:
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[index]
+
+
+def shard_tables() -> list:
+    """Tables stored on every shard, parents before children."""
+    return [table for table in Base.metadata.sorted_tables if table.name not in DIRECTORY_TABLES]
+
+
+def user_tables() -> list:
+    """Shard tables whose rows belong to a single user and move with them."""
+    return [table for table in shard_tables() if table.name not in SHARD_LOCAL_TABLES]
+
+
+class ShardRouter:
+    def __init__(self, shards: dict[str, Engine], directory: Engine, vnodes: int = SHARD_VNODES):
+        self.engines = shards
+        self.names = list(shards)
+        self.directory = directory
+        self.ring = HashRing(self.names, vnodes)
+        self._placements: dict[int, tuple[str, float]] = {}
+
+    def session(self, shard: str, user_id: Optional[int] = None) -> Session:
+        """
+        Session whose directory tables go to the directory database and all other tables to `shard`.
+        With `user_id`, each commit first checks that the user still lives on `shard` (see _check_placement).
+        """
+        binds = {table: self.engines[shard] for table in shard_tables()}
+        binds.update({models.User: self.directory, models.UserShard: self.directory})
+        session = Session(binds=binds, autoflush=False)
+        if user_id is not None:
+            session.info["shard_pin"] = (self, user_id, shard)
+        return session
+
+    def lock_placement(self, user_id: int, shard: str) -> Session:
+        """
+        Share-lock the user's placement row and check it still points at `shard` and isn't moving.
+        Returns the directory session holding the lock; close it to release.
+        """
+        directory_db = Session(bind=self.directory)
+        placement = directory_db.query(models.UserShard).filter(
+            models.UserShard.user_id == user_id
+        ).with_for_update(read=True).first()
+        if placement is None or placement.moving or placement.shard != shard:
+            directory_db.close()
+            self._placements.pop(user_id, None)
+            raise ShardMovingError(f"User {user_id} is being moved to another shard.")
+        return directory_db
+
+    def shard_for_user(self, directory_db: Session, user_id: int) -> str:
+        cached = self._placements.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        placement = directory_db.get(models.UserShard, user_id)
+        if placement is None:
+            try:
+                # Savepoint: a concurrent first request from the same user may place them first
+                with directory_db.begin_nested():
+                    placement = models.UserShard(user_id=user_id, shard=self.ring.node_for(user_id), moving=False)
+                    directory_db.add(placement)
+            except IntegrityError:
+                placement = directory_db.get(models.UserShard, user_id)
+            directory_db.commit()
+        if placement.moving:
+            raise ShardMovingError(f"User {user_id} is being moved to another shard.")
+        # Every process re-reads the placement within the TTL, so all of them notice a move
+        # before the rebalancer's grace period ends and it starts copying
+        self._placements[user_id] = (placement.shard, time.monotonic() + SHARD_PLACEMENT_TTL)
+        return placement.shard
+
+    def create_schema(self, shard: str) -> None:
+        """Create the shard tables, leaving out foreign keys into the directory database."""
+        engine = self.engines[shard]
+        existing = set(inspect(engine).get_table_names())
+        with engine.begin() as connection:
+            for table in shard_tables():
+                if table.name in existing:
+                    continue
+                local_fks = [fk for fk in table.foreign_key_constraints if fk.referred_table.name not in DIRECTORY_TABLES]
+                connection.execute(CreateTable(table, include_foreign_key_constraints=local_fks))
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index))
+            if engine.dialect.name == "postgresql" and "messages" not in existing:
+                index = self.names.index(shard)
+                connection.execute(text(
+                    f"ALTER SEQUENCE messages_id_seq INCREMENT BY {SHARD_ID_STRIDE} "
+                    f"MINVALUE 1 RESTART WITH {index + 1}"
+                ))
+
+    def move_user(self, directory_db: Session, user_id: int, target: str,
+                  grace_seconds: float = SHARD_MOVE_GRACE_SECONDS) -> int:
+        """
+        Move one user's shard data to `target`. Returns the number of rows copied.
+        Steps: flag the user as moving, wait out in-flight requests, copy, repoint, delete the old copy.
+        """
+        placement = directory_db.get(models.UserShard, user_id)
+        source = placement.shard
+        if source == target:
+            return 0
+        # Blocks until commits holding the placement's shared lock are done; later ones see the flag
+        placement.moving = True
+        directory_db.commit()
+        self._placements.pop(user_id, None)
+        time.sleep(grace_seconds)
+
+        try:
+            copied = self._copy_user(user_id, source, target)
+        except Exception:
+            placement.moving = False
+            directory_db.commit()
+            raise
+
+        placement.shard = target
+        placement.moving = False
+        directory_db.commit()
+        self._delete_user(user_id, source)
+        logger.info("Moved user %s from %s to %s (%s rows)", user_id, source, target, copied)
+        return copied
+
+    def rebalance(self, directory_db: Session, limit: Optional[int] = None, dry_run: bool = False,
+                  progress: Callable[[str], None] = print) -> int:
+        """Move users whose pinned shard differs from their ring position, one at a time."""
+        moved = 0
+        placements = directory_db.query(models.UserShard).order_by(models.UserShard.user_id).all()
+        for placement in placements:
+            if limit is not None and moved >= limit:
+                break
+            source, target = placement.shard, self.ring.node_for(placement.user_id)
+            if source == target or placement.moving:
+                continue
+            if dry_run:
+                progress(f"user {placement.user_id}: {source} -> {target}")
+            else:
+                rows = self.move_user(directory_db, placement.user_id, target)
+                progress(f"user {placement.user_id}: {source} -> {target}, {rows} rows")
+            moved += 1
+        return moved
+
+    def _user_rows(self, table, user_id: int):
+        """Select a user's rows from a shard table, directly or through the messages they belong to."""
+        if "user_id" in table.c:
+            return select(table).where(table.c.user_id == user_id)
+        messages = models.Message.__table__
+        for fk in table.foreign_keys:
+            if fk.column.table is messages:
+                owned = select(messages.c.id).where(messages.c.user_id == user_id)
+                return select(table).where(fk.parent.in_(owned))
+        raise ValueError(f"Cannot tell which rows of {table.name} belong to a user.")
+
+    def _copy_user(self, user_id: int, source: str, target: str) -> int:
+        copied = 0
+        with self.engines[source].connect() as reader, self.engines[target].begin() as writer:
+            for table in user_tables():
+                query = self._user_rows(table, user_id)
+                if "id" in table.c:
+                    query = query.order_by(table.c.id)
+                result = reader.execution_options(stream_results=True, yield_per=SHARD_COPY_BATCH_SIZE).execute(query)
+                for batch in result.mappings().partitions(SHARD_COPY_BATCH_SIZE):
+                    writer.execute(insert(table), [dict(row) for row in batch])
+                    copied += len(batch)
+        return copied
+
+    def _delete_user(self, user_id: int, shard: str) -> None:
+        with self.engines[shard].begin() as connection:
+            # Children first; self-references inside messages are removed in the same statement
+            for table in reversed(user_tables()):
+                owned = self._user_rows(table, user_id).subquery()
+                key = table.primary_key.columns.values()
+                if len(key) == 1:
+                    connection.execute(delete(table).where(key[0].in_(select(owned.c[key[0].name]))))
+                else:
+                    connection.execute(delete(table).where(table.c.user_id == user_id))
+
+
+@event.listens_for(Session, "before_commit")
+def _check_placement(session: Session) -> None:
+    pin = session.info.get("shard_pin")
+    if pin is None:
+        return
+    router, user_id, shard = pin
+    # Held until the shard commit ends, so a move can't be flagged between the check and the commit
+    session.info["placement_lock"] = router.lock_placement(user_id, shard)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_placement(session: Session, transaction) -> None:
+    if transaction.parent is not None:
+        return
+    lock = session.info.pop("placement_lock", None)
+    if lock is not None:
+        lock.close()
+
+
+def parse_shard_urls(value: str) -> dict[str, str]:
+    shards = {}
+    for position, entry in enumerate(item.strip() for item in value.split(",") if item.strip()):
+        name, separator, url = entry.partition("=")
+        if not separator:
+            name, url = f"shard{position}", entry
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Optional[ShardRouter]:
+    """The configured ShardRouter, or None when sharding is off."""
+    global _router
+    if _router is None and SHARD_DATABASE_URLS:
+        with _router_lock:
+            if _router is None:
+                urls = parse_shard_urls(SHARD_DATABASE_URLS)
+                _router = ShardRouter({name: _create_engine(url) for name, url in urls.items()}, get_engine())
+    return _router
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage sharded message storage.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create-schema", help="Create shard tables on every shard")
+    rebalance = commands.add_parser("rebalance", help="Move users to their ring shard, one at a time")
+    rebalance.add_argument("--dry-run", action="store_true")
+    rebalance.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    router = get_router()
+    if router is None:
+        raise SystemExit("SHARD_DATABASE_URLS is not set.")
+    if args.command == "create-schema":
+        for name in router.names:
+            router.create_schema(name)
+            print(f"{name}: schema ready")
+        return
+    directory_db = Session(bind=router.directory)
+    try:
+        moved = router.rebalance(directory_db, limit=args.limit, dry_run=args.dry_run)
+        print(f"{moved} users {'to move' if args.dry_run else 'moved'}")
+    finally:
+        directory_db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# backend/benchmarks/bench_message_list.py
+"""
+CPU cost of serving one page of GET /messages/, ORM path vs lean path.
+
+    python -m benchmarks.bench_message_list
+
+The ORM path is what the endpoint used to do: load Message objects, validate them through
+the response_model with from_attributes, and encode with the stdlib json encoder.
+The lean path selects the response columns and encodes the rows with orjson.
+Uses an in-memory SQLite database, so the numbers are mostly Python overhead, which is the point.
+"""
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, Message
+from app.schemas.message import Message as MessageSchema
+from app.crud.message import get_messages, get_message_rows
+from app.serialization import dumps
+
+SIZES = (10, 100, 1000)
+REPEAT = 50
+
+message_list = TypeAdapter(list[MessageSchema])
+
+
+def orm_path(db, user_id, limit):
+    messages = get_messages(db, user_id, limit=limit)
+    validated = message_list.validate_python(messages, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def lean_path(db, user_id, limit):
+    return dumps(get_message_rows(db, user_id, limit=limit))
+
+
+def cpu_per_call(fn, db, user_id, limit):
+    fn(db, user_id, limit)  # warm up
+    start = time.process_time()
+    for _ in range(REPEAT):
+        fn(db, user_id, limit)
+        db.expunge_all()
+    return (time.process_time() - start) / REPEAT
+
+
+def main():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    db.execute(insert(Message), [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "lorem ipsum " * 20,
+         "user_id": user.id, "context": "Onboarding", "is_edited": False, "is_deleted": False}
+        for i in range(max(SIZES))
+    ])
+    db.commit()
+
+    print(f"{'messages':>8} {'orm ms':>10} {'lean ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        orm = cpu_per_call(orm_path, db, user.id, size) * 1000
+        lean = cpu_per_call(lean_path, db, user.id, size) * 1000
+        print(f"{size:>8} {orm:>10.3f} {lean:>10.3f} {orm / lean:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 # backend/tests/conftest.py
 
+import os
+# The OpenAI client is built lazily; a placeholder key lets mock_openai patch it without real secrets
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from app.database import Base, get_db
+from app import history
 from app.main import app
 from unittest.mock import MagicMock
 from app.models import User, Message  # Ensure all models are imported
@@ -67,6 +72,8 @@ def setup_and_teardown():
     # Setup: Drop all tables and recreate them
     Base.metadata.drop_all(bind=connection)
     Base.metadata.create_all(bind=connection)
+    # Ids restart with the tables, so cached history from earlier tests would belong to new users
+    history.cache.clear()
     yield
     # Teardown: Drop all tables
     Base.metadata.drop_all(bind=connection)
@@ -76,12 +83,31 @@ def mock_openai(mocker):
     """
     Fixture to mock the OpenAI API's ChatCompletion.create method.
     """
-    # Adjust the import path based on your actual code structure
-    mock = mocker.patch('app.crud.message.client.chat.completions.create')
+    # Patch the client behind the "openai" LLM backend
+    from app.llm import get_backend
+    mock = mocker.patch.object(get_backend("openai").client.chat.completions, 'create')
     
     # Create a mock response object with the 'choices' attribute
     mock_response = MagicMock()
     mock_response.choices = [MagicMock(message=MagicMock(content="Welcome to Artisan!"))]
+    mock_response.model = "gpt-4"
+    mock_response.usage = MagicMock(prompt_tokens=42, completion_tokens=7)
+
+    # Cancellable requests stream: content chunks, then a final usage-only chunk
+    def create(**kwargs):
+        if not kwargs.get("stream"):
+            return mock_response
+        content = mock_response.choices[0].message.content
+        chunks = [
+            MagicMock(model=mock_response.model, usage=None, choices=[MagicMock(delta=MagicMock(content=content))]),
+            MagicMock(model=mock_response.model, usage=mock_response.usage, choices=[]),
+        ]
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(chunks)
+        stream.__enter__.return_value = stream
+        return stream
+
+    mock.side_effect = create
     mock.return_value = mock_response
-    
+
     return mock
\ No newline at end of file
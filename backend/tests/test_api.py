@@ -1,5 +1,6 @@
 # backend/tests/test_api.py
 
+import json
 import pytest
 from fastapi import status
 # Add at the top of your test files
@@ -64,3 +65,338 @@ def test_create_and_get_messages(client, mock_openai):
 
     # Optional: Print the assistant's response for debugging
     print(f"Assistant response: {assistant_message['content']}")
+
+def test_get_messages_conditional(client, mock_openai):
+    headers = authenticate(client, "etaguser", "etagpassword")
+
+    client.post(
+        "/messages/",
+        json={"role": "user", "content": "Hello", "context": "Support"},
+        headers=headers
+    )
+    response = client.get("/messages/?context=Support", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    # Weak: compressed and identity bodies share it
+    assert etag.startswith('W/"')
+
+    # Unchanged conversation: no body
+    response = client.get("/messages/?context=Support", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    # A new message changes the validator
+    client.post(
+        "/messages/",
+        json={"role": "user", "content": "Another one", "context": "Support"},
+        headers=headers
+    )
+    response = client.get("/messages/?context=Support", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 4
+
+    # ?context= lists every context, so a change in any of them changes its validator
+    etag = client.get("/messages/?context=", headers=headers).headers["etag"]
+    client.post("/messages/", json={"role": "user", "content": "Hi", "context": "Marketing"}, headers=headers)
+    response = client.get("/messages/?context=", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+def test_message_changes_feed(client, mock_openai):
+    headers = authenticate(client, "syncuser", "syncpassword")
+
+    response = client.post(
+        "/messages/",
+        json={"role": "user", "content": "Hello", "context": "Onboarding"},
+        headers=headers
+    )
+    message_id = response.json()["id"]
+
+    response = client.get("/messages/changes?since=0", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    feed = response.json()
+    assert [m["role"] for m in feed["changes"]] == ["user", "assistant"]
+    assert feed["has_more"] is False
+    cursor = feed["cursor"]
+
+    # Nothing new since the cursor
+    response = client.get(f"/messages/changes?since={cursor}", headers=headers)
+    assert response.json()["changes"] == []
+
+    # Deleting the turn produces tombstones for both rows
+    client.delete(f"/messages/{message_id}", headers=headers)
+    response = client.get(f"/messages/changes?since={cursor}&limit=1", headers=headers)
+    feed = response.json()
+    assert len(feed["changes"]) == 1
+    assert feed["changes"][0]["is_deleted"] is True
+    assert feed["has_more"] is True
+
+def test_websocket_pushes_message_events(client, mock_openai):
+    headers = authenticate(client, "wsuser", "wspassword")
+    token = headers["Authorization"].split(" ", 1)[1]
+
+    with client.websocket_connect(f"/ws?token={token}") as websocket:
+        client.post(
+            "/messages/",
+            json={"role": "user", "content": "Hello", "context": "Onboarding"},
+            headers=headers
+        )
+        user_event = websocket.receive_json()
+        assistant_event = websocket.receive_json()
+
+    assert user_event["type"] == "message.created"
+    assert user_event["message"]["content"] == "Hello"
+    assert assistant_event["message"]["role"] == "assistant"
+    assert assistant_event["message"]["parent_id"] == user_event["message"]["id"]
+
+def test_health_reports_startup_phases(client):
+    response = client.get("/health")
+    assert response.status_code == status.HTTP_200_OK
+    assert "total" in response.json()["startup_ms"]
+
+def test_export_messages(client, mock_openai):
+    headers = authenticate(client, "exportuser", "exportpassword")
+    for context in ("Onboarding", "Support"):
+        client.post(
+            "/messages/",
+            json={"role": "user", "content": f"Hello {context}", "context": context},
+            headers=headers
+        )
+
+    response = client.get("/messages/export?context=Support", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [m["role"] for m in lines] == ["user", "assistant"]
+    assert lines[0]["content"] == "Hello Support"
+
+    response = client.get("/messages/export?format=csv", headers=headers)
+    rows = response.text.splitlines()
+    assert rows[0].startswith("role,content,context")
+    assert len(rows) == 5
+
+def test_import_messages(client):
+    headers = authenticate(client, "importuser", "importpassword")
+    lines = [
+        {"role": "user", "content": "Old question", "context": "Support", "timestamp": "2023-05-01T10:00:00", "id": "q1"},
+        {"role": "user", "content": "Second question", "context": "Support", "timestamp": "2023-05-01T10:01:00"},
+        {"role": "assistant", "content": "Second answer", "context": "Support", "timestamp": "2023-05-01T10:01:05"},
+        {"role": "assistant", "content": "First answer", "context": "Support", "timestamp": "2023-05-01T10:02:00", "parent_id": "q1"},
+        {"role": "system", "content": "not allowed"},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines)
+
+    response = client.post("/messages/import", content=body, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["rows"] == 4
+    assert result["skipped"] == 1
+
+    messages = client.get("/messages/?context=Support", headers=headers).json()
+    by_content = {m["content"]: m for m in messages}
+    assert by_content["First answer"]["parent_id"] == by_content["Old question"]["id"]
+    assert by_content["Second answer"]["parent_id"] == by_content["Second question"]["id"]
+    assert by_content["Old question"]["timestamp"].startswith("2023-05-01T10:00:00")
+
+def test_import_ids_are_reserved_under_the_write_lock(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import Session
+    from app.database import Base
+    from app.importer import _csv_field, reserve_message_ids
+    from app.models import Message, User
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}", connect_args={"timeout": 0.1})
+    Base.metadata.create_all(engine)
+    with Session(engine) as setup:
+        setup.add(User(id=1, username="importer", email="importer@example.com", hashed_password="x"))
+        setup.commit()
+
+    importing, chatting = Session(engine), Session(engine)
+    assert reserve_message_ids(importing, 2) == [1, 2]
+    chatting.add(Message(role="user", content="Hi", user_id=1))
+    with pytest.raises(OperationalError):
+        chatting.commit()  # waits for the import's transaction instead of taking id 1
+    chatting.rollback()
+    importing.close()
+    chatting.close()
+
+    # COPY reads only an unquoted empty field as NULL
+    assert [_csv_field(value) for value in (None, "\\N", "", 'say "hi"')] == ["", '"\\N"', '""', '"say ""hi"""']
+
+def test_analytics_aggregates(client, mock_openai, monkeypatch):
+    from app.routers import analytics
+    headers = authenticate(client, "statsuser", "statspassword")
+
+    response = client.post(
+        "/messages/",
+        json={"role": "user", "content": "Hello", "context": "Marketing"},
+        headers=headers
+    )
+    client.put(f"/messages/{response.json()['id']}", json={"content": "Hello there"}, headers=headers)
+
+    response = client.get("/analytics/", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    monkeypatch.setattr(analytics, "ANALYTICS_ADMINS", {"statsuser"})
+    response = client.get("/analytics/?context=Marketing", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    [row] = response.json()
+    assert (row["user_messages"], row["assistant_messages"], row["edits"]) == (2, 2, 1)
+    assert row["active_users"] == 1
+    assert row["edit_rate"] == 0.5
+    assert row["fallback_rate"] == 0.0
+
+    [mine] = client.get("/analytics/me", headers=headers).json()
+    assert mine["context"] == "Marketing"
+    assert mine["user_messages"] == 2
+
+def test_faq_fast_path_skips_llm(client, mock_openai, monkeypatch):
+    from app import intents
+    from app.routers import analytics
+    headers = authenticate(client, "faquser", "faqpassword")
+    intents.stats.reset()
+
+    response = client.post(
+        "/messages/",
+        json={"role": "user", "content": "What can Ava do?", "context": "Support"},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    mock_openai.assert_not_called()
+    messages = client.get("/messages/?context=Support", headers=headers).json()
+    assert messages[-1]["content"] == intents.get_index("Support").intents["about_ava"].answer
+
+    monkeypatch.setattr(analytics, "ANALYTICS_ADMINS", {"faquser"})
+    stats = client.get("/analytics/intents", headers=headers).json()
+    assert stats["hit_rates"] == [{"context": "Support", "kind": "fast_path", "lookups": 1, "hits": 1, "hit_rate": 1.0}]
+    assert stats["intents"] == {"about_ava": 1}
+
+def test_follow_up_keeps_product_knowledge_of_earlier_messages(client, mock_openai):
+    headers = authenticate(client, "followup", "followuppassword")
+    for content in ("Tell me about the Marketing Suite", "how much is it?"):
+        client.post("/messages/", json={"role": "user", "content": content, "context": "Marketing"}, headers=headers)
+
+    from app.crud.message import PRODUCT_SUMMARY
+    system_prompt = mock_openai.call_args.kwargs["messages"][0]["content"]
+    assert system_prompt.startswith(PRODUCT_SUMMARY)
+    assert "- Marketing suite:" in system_prompt
+
+def test_idempotency_key_replays_first_response(client, mock_openai):
+    headers = authenticate(client, "retryuser", "retrypassword")
+    body = {"role": "user", "content": "Hello", "context": "Onboarding"}
+
+    first = client.post("/messages/", json=body, headers={**headers, "Idempotency-Key": "k1"})
+    retry = client.post("/messages/", json=body, headers={**headers, "Idempotency-Key": "k1"})
+    assert first.status_code == retry.status_code == status.HTTP_200_OK
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert mock_openai.call_count == 1
+    assert len(client.get("/messages/?context=Onboarding", headers=headers).json()) == 2
+
+    reused = client.post("/messages/", json={**body, "content": "Hi"}, headers={**headers, "Idempotency-Key": "k1"})
+    assert reused.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    # A failed request frees its key for the retry
+    missing = client.put("/messages/9999", json={"content": "x"}, headers={**headers, "Idempotency-Key": "k2"})
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+    edited = client.put(f"/messages/{first.json()['id']}", json={"content": "x"}, headers={**headers, "Idempotency-Key": "k2"})
+    assert edited.status_code == status.HTTP_200_OK
+
+def test_expired_deadline_aborts_turn_without_reply(client, mock_openai):
+    headers = authenticate(client, "hastyuser", "hastypassword")
+    response = client.post(
+        "/messages/",
+        json={"role": "user", "content": "Hello", "context": "Support"},
+        headers={**headers, "X-Request-Timeout": "0"}
+    )
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    mock_openai.assert_not_called()
+
+    [change] = client.get("/messages/changes", headers=headers).json()["changes"]
+    assert change["role"] == "user"
+    assert change["is_aborted"] is True
+
+def test_batch_generates_concurrently_and_saves_pairs(client, db, mock_openai, monkeypatch):
+    import threading
+    import time
+    from app import batch
+    headers = authenticate(client, "batchuser", "batchpassword")
+
+    create = mock_openai.side_effect
+    lock = threading.Lock()
+    calls = {"active": 0, "peak": 0}
+    def slow_create(**kwargs):
+        with lock:
+            calls["active"] += 1
+            calls["peak"] = max(calls["peak"], calls["active"])
+        time.sleep(0.1)
+        with lock:
+            calls["active"] -= 1
+        return create(**kwargs)
+    mock_openai.side_effect = slow_create
+
+    inputs = [f"Draft email variant {i} for our spring campaign" for i in range(6)]
+    response = client.post("/messages/batch", json={"inputs": inputs, "context": "Marketing"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert 1 < calls["peak"] <= batch.BATCH_CONCURRENCY
+    results, saved = lines[:-1], lines[-1]
+    assert sorted(result["index"] for result in results) == list(range(6))
+    assert all(result["type"] == "result" and result["reply"] == "Welcome to Artisan!" for result in results)
+    assert saved["type"] == "saved"
+    assert [m["role"] for m in saved["messages"]] == ["user", "assistant"] * 6
+    assert [m["content"] for m in saved["messages"][::2]] == inputs
+    assert all(reply["parent_id"] == user["id"] for user, reply in zip(saved["messages"][::2], saved["messages"][1::2]))
+
+    stored = client.get("/messages/", params={"context": "Marketing", "limit": 20}, headers=headers).json()
+    assert [m["role"] for m in stored] == ["user", "assistant"] * 6
+    assert [m["id"] for m in stored] == [m["id"] for m in saved["messages"]]
+    from app.models import DailyUsage, MessageUsage
+    assert db.query(MessageUsage).count() == 6
+    assert db.query(DailyUsage).one().requests == 6
+
+    too_many = client.post("/messages/batch", json={"inputs": ["x"] * (batch.BATCH_MAX_INPUTS + 1)}, headers=headers)
+    assert too_many.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+def test_batches_are_limited_per_batch_and_per_process(monkeypatch):
+    import asyncio
+    import threading
+    import time
+    from app import batch, llm
+    monkeypatch.setattr(batch, "BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(batch, "BATCH_MAX_RUNNING", 1)
+
+    lock = threading.Lock()
+    active, peak, order = {}, {}, []
+    def generate_one(bind, user_input, context, user_id, calls):
+        with lock:
+            active[user_id] = active.get(user_id, 0) + 1
+            peak[user_id] = max(peak.get(user_id, 0), active[user_id])
+            order.append(user_id)
+        time.sleep(0.05)
+        with lock:
+            active[user_id] -= 1
+        return llm.Completion(content="ok", model="gpt-4")
+    monkeypatch.setattr(batch, "_generate_one", generate_one)
+
+    async def run_batches():
+        async def one(user_id):
+            return [result async for result in batch.generate(None, user_id, "Marketing", ["a", "b", "c", "d"])]
+        return await asyncio.gather(one(1), one(2))
+
+    assert [len(results) for results in asyncio.run(run_batches())] == [4, 4]
+    assert peak == {1: 2, 2: 2}
+    assert order == [1] * 4 + [2] * 4  # the second batch waited for the first
+
+def test_batch_reports_failed_save(client, mock_openai, monkeypatch):
+    from app import batch
+    headers = authenticate(client, "batchfail", "batchpassword")
+    def broken_save(*args, **kwargs):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(batch, "save", broken_save)
+
+    response = client.post("/messages/batch", json={"inputs": ["One", "Two"], "context": "Marketing"}, headers=headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["result", "result", "error"]
+    assert client.get("/messages/", params={"context": "Marketing"}, headers=headers).json() == []
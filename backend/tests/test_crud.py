@@ -49,3 +49,66 @@ def test_create_message(db: Session, mock_openai):
     # Optional: Print the assistant's response for debugging
     logger.info(f"Assistant response: {assistant_messages[0].content}")
 
+
+def test_message_rows_match_schema(db: Session, mock_openai):
+    from app.crud.message import get_messages, get_message_rows
+    from app.schemas.message import Message as MessageSchema
+
+    user = User(username="rowsuser", email="rows@example.com", hashed_password="hashedpassword")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    create_message(db, MessageCreate(role="user", content="Hello", context="Support"), user_id=user.id)
+
+    expected = [MessageSchema.model_validate(m).model_dump() for m in get_messages(db, user.id, context="Support")]
+    assert get_message_rows(db, user.id, context="Support") == expected
+
+def test_usage_is_recorded_and_budget_enforced(db: Session, mock_openai, monkeypatch):
+    from app.crud import usage
+    from app.models import MessageUsage
+
+    user = User(username="usageuser", email="usage@example.com", hashed_password="hashedpassword")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    message = create_message(db, MessageCreate(role="user", content="Hello", context="Onboarding"), user_id=user.id)
+    assistant = db.query(Message).filter(Message.parent_id == message.id).one()
+    recorded = db.query(MessageUsage).filter(MessageUsage.message_id == assistant.id).one()
+    assert (recorded.model, recorded.prompt_tokens, recorded.completion_tokens) == ("gpt-4", 42, 7)
+
+    daily = usage.get_daily_usage(db, user.id)
+    assert (daily.requests, daily.prompt_tokens, daily.completion_tokens) == (1, 42, 7)
+
+    # Budget spent: the next reply is a fallback and the LLM is not called
+    monkeypatch.setattr(usage, "USER_DAILY_TOKEN_BUDGET", 49)
+    monkeypatch.setattr(usage, "LLM_BUDGET_MODE", "fallback")
+    mock_openai.reset_mock()
+    message = create_message(db, MessageCreate(role="user", content="Hello again", context="Onboarding"), user_id=user.id)
+    assistant = db.query(Message).filter(Message.parent_id == message.id).one()
+    assert not mock_openai.called
+    assert db.query(MessageUsage).filter(MessageUsage.message_id == assistant.id).one().model == usage.FALLBACK_MODEL
+    assert usage.get_daily_usage(db, user.id).requests == 2
+
+
+def test_upsert_increment_creates_then_adds(db):
+    from datetime import date
+    from app.crud.counters import upsert_increment
+    from app.models import ContextDailyStats
+
+    key = {"day": date(2024, 1, 1), "context": "Support"}
+    upsert_increment(db, ContextDailyStats, key, user_messages=1, latency_ms_total=10.0)
+    upsert_increment(db, ContextDailyStats, key, user_messages=2, active_users=1)
+    db.commit()
+    row = db.query(ContextDailyStats).one()
+    assert (row.user_messages, row.active_users, row.latency_ms_total, row.edits) == (3, 1, 10.0, 0)
+
+def test_record_stats_counts_each_user_once_a_day(db):
+    from app.crud.analytics import record_stats
+    from app.models import ContextDailyStats
+
+    for user_id in (1, 1, 2):
+        record_stats(db, user_id, "Support", user_messages=1)
+        db.commit()
+    row = db.query(ContextDailyStats).one()
+    assert (row.user_messages, row.active_users) == (3, 2)
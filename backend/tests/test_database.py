@@ -9,3 +9,33 @@ def test_users_table_exists(db: Session):
     inspector = sqlalchemy.inspect(db.bind)
     tables = inspector.get_table_names()
     assert "users" in tables, "Users table should exist in the database"
+
+
+def test_reads_stick_to_primary_after_write(monkeypatch):
+    from app import database
+    monkeypatch.setattr(database, "DATABASE_REPLICA_URLS", ["sqlite://"])
+    monkeypatch.setattr(database, "_recent_writes", {})
+
+    assert not database.is_sticky(7)
+    database.mark_write(7)
+    assert database.is_sticky(7)
+    assert not database.is_sticky(8)
+
+
+def test_lagging_replica_is_skipped(monkeypatch):
+    import itertools
+    from sqlalchemy import create_engine
+    from app import database
+
+    healthy = database.Replica(create_engine("sqlite://"))
+    lagging = database.Replica(create_engine("sqlite://"))
+    monkeypatch.setattr(lagging, "_measure_lag", lambda: 60.0)
+    monkeypatch.setattr(database, "_replica_engines", [lagging, healthy])
+    monkeypatch.setattr(database, "_replica_cycle", itertools.cycle([lagging, healthy]))
+
+    assert database.choose_replica() is healthy.engine
+    assert database.choose_replica() is healthy.engine
+
+    monkeypatch.setattr(healthy, "_measure_lag", lambda: 60.0)
+    healthy.checked_at = 0.0
+    assert database.choose_replica() is None
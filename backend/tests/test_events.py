@@ -0,0 +1,19 @@
+# backend/tests/test_events.py
+
+import asyncio
+from app.events import LocalBroker, EVICTED
+
+
+def test_slow_consumer_is_evicted():
+    async def scenario():
+        broker = LocalBroker(queue_size=2)
+        subscription = broker.subscribe(user_id=1)
+        for i in range(3):
+            broker.publish(1, {"n": i})
+        # Deliveries are scheduled on the loop
+        await asyncio.sleep(0)
+        return await subscription.get(), broker._subscriptions
+
+    event, subscriptions = asyncio.run(scenario())
+    assert event is EVICTED
+    assert subscriptions == {}
@@ -0,0 +1,53 @@
+# backend/tests/test_history.py
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.history import HistoryCache
+
+
+def message(id, content="hi", role="user"):
+    return SimpleNamespace(id=id, role=role, content=content, timestamp=datetime(2024, 1, 1, 0, 0, id))
+
+
+def test_miss_loads_then_writes_keep_buffer_current():
+    cache = HistoryCache(depth=3)
+    loads = []
+
+    def load(depth):
+        loads.append(depth)
+        return [message(2), message(1)]  # newest first, like the database query
+
+    assert [r.id for r in cache.recent(1, "Support", 2, load)] == [2, 1]
+    cache.append(1, "Support", message(3))
+    cache.append(1, "Support", message(4))
+    assert [r.id for r in cache.recent(1, "Support", 3, load)] == [4, 3, 2]
+    assert loads == [3]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.invalidate(1, "Support")
+    cache.recent(1, "Support", 3, load)
+    assert loads == [3, 3]
+
+
+def test_write_during_load_discards_the_loaded_buffer():
+    cache = HistoryCache(depth=3)
+
+    def load(depth):
+        cache.append(1, None, message(2))  # lands between the query and the fill
+        return [message(1)]
+
+    cache.recent(1, None, 2, load)
+    calls = []
+    cache.recent(1, None, 2, lambda depth: calls.append(depth) or [message(2), message(1)])
+    assert calls == [3]
+
+
+def test_memory_cap_evicts_least_recently_used():
+    cache = HistoryCache(depth=2, max_bytes=1000)
+    for user_id in (1, 2, 3):
+        cache.recent(user_id, "Support", 1, lambda depth: [message(1, "x" * 200)])
+    cache.recent(1, "Support", 1, lambda depth: [])  # touch user 1 so user 2 is the oldest
+    cache.recent(4, "Support", 1, lambda depth: [message(1, "x" * 200)])
+    assert cache.size <= 1000
+    assert set(cache._entries) == {(1, "Support"), (3, "Support"), (4, "Support")}
@@ -0,0 +1,41 @@
+# backend/tests/test_idempotency.py
+
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app import idempotency
+from app.models import IdempotencyKey, User
+from app.schemas.message import MessageCreate
+
+
+def test_concurrent_duplicate_gets_409_then_the_stored_response(db):
+    user = User(username="waiter", email="waiter@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    body = MessageCreate(role="user", content="Hello", context="Support")
+    request_fingerprint = idempotency.fingerprint("POST", "/messages/", body)
+    now = idempotency._now()
+    db.add(IdempotencyKey(user_id=user_id, key="k", fingerprint=request_fingerprint,
+                          locked_at=now, expires_at=now + timedelta(hours=1)))
+    db.commit()
+
+    def handler():
+        raise AssertionError("duplicate must not run")
+
+    # The first request is still running: no waiting, the client retries later
+    with pytest.raises(HTTPException) as running:
+        idempotency.run_idempotent(db, user_id, "k", request_fingerprint, handler, response_model=None)
+    assert running.value.status_code == 409
+    assert running.value.headers["Retry-After"] == str(idempotency.IDEMPOTENCY_RETRY_AFTER_SECONDS)
+
+    db.query(IdempotencyKey).filter_by(user_id=user_id, key="k").update(
+        {"status_code": 200, "response": '{"id": 7}'}, synchronize_session=False
+    )
+    db.commit()
+    db.expunge_all()  # a retry is a new request with a fresh session
+    response = idempotency.run_idempotent(db, user_id, "k", request_fingerprint, handler, response_model=None)
+    assert response.body == b'{"id": 7}'
+    assert response.headers["Idempotent-Replayed"] == "true"
@@ -0,0 +1,48 @@
+# backend/tests/test_intents.py
+
+from app.intents import Intent, IntentIndex
+from app.intents.automaton import KeywordAutomaton
+
+
+def test_automaton_finds_overlapping_phrases_on_word_boundaries():
+    automaton = KeywordAutomaton([
+        (("reset", "password"), "reset"),
+        (("password",), "password"),
+        (("set", "up"), "setup"),
+    ])
+    assert automaton.find("please reset password now".split()) == [("reset", 2), ("password", 1)]
+    assert automaton.find("reset passwords".split()) == []
+    assert automaton.find("upset up".split()) == []
+
+
+def test_index_prefers_keywords_then_similarity():
+    index = IntentIndex([
+        Intent("warmup", "Turn on warmup.", keywords=("email warmup",), questions=("How do I warm up my mailbox?",)),
+        Intent("spam", "Run a placement test.", questions=("Why are my emails going to spam?",)),
+    ])
+    match = index.match("How do I set up email warmup?")
+    assert (match.intent.name, match.method) == ("warmup", "keyword")
+    assert match.score >= 0.9
+
+    match = index.match("my emails keep going to spam")
+    assert (match.intent.name, match.method) == ("spam", "similarity")
+    assert 0 < match.score <= 1
+
+    assert index.match("Hello") is None
+
+
+def test_keyword_inside_a_detailed_question_is_not_a_confident_match():
+    index = IntentIndex([
+        Intent(
+            "reset_password", "Click Forgot password.",
+            keywords=("change password", "forgot password"), questions=("How can I change my account password?",),
+        ),
+    ])
+    match = index.match("I want to change password")
+    assert match.method == "keyword" and match.score >= 0.9
+
+    match = index.match(
+        "after I change password the API tokens for my Zapier integration stopped working, do I need to regenerate them?"
+    )
+    assert match.method == "similarity"
+    assert match.score < 0.3
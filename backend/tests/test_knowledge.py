@@ -0,0 +1,66 @@
+# backend/tests/test_knowledge.py
+
+import numpy as np
+
+from app.knowledge import KnowledgeIndex, build_index, chunk_markdown, open_index
+
+KNOWLEDGE = """# Product
+
+## Email warmup
+Warmup ramps up a new mailbox's sending volume over two weeks. Turn it on under Settings > Mailboxes.
+
+## Pricing
+Annual plans come with two months free.
+"""
+
+
+def test_chunks_keep_section_and_whole_sentences():
+    chunks = chunk_markdown(KNOWLEDGE)
+    assert chunks[0] == ("Email warmup", "Warmup ramps up a new mailbox's sending volume over two weeks. Turn it on under Settings > Mailboxes.")
+    assert chunks[-1] == ("Pricing", "Annual plans come with two months free.")
+
+
+def test_search_returns_relevant_chunks_from_memory_mapped_index(tmp_path):
+    source = tmp_path / "products.md"
+    source.write_text(KNOWLEDGE)
+    index_dir = str(tmp_path / "index")
+
+    index = open_index(str(source), index_dir)
+    assert isinstance(index.weights, np.memmap)
+    [chunk] = index.search("how long does mailbox warmup take?", k=1)
+    assert chunk.section == "Email warmup"
+    assert index.search("hello there", k=2) == []
+
+    # Editing the source rebuilds the index on next open
+    source.write_text(KNOWLEDGE + "\n## Integrations\nArtisan syncs with HubSpot.\n")
+    index = open_index(str(source), index_dir)
+    assert index.search("hubspot", k=1)[0].section == "Integrations"
+
+
+def test_build_replaces_existing_index(tmp_path):
+    source = tmp_path / "products.md"
+    source.write_text(KNOWLEDGE)
+    build_index(str(source), str(tmp_path / "index"))
+    build_index(str(source), str(tmp_path / "index"))
+    assert len(KnowledgeIndex(str(tmp_path / "index")).chunks) == 2
+    # Each build is a new version behind the symlink; only the current and previous ones are kept
+    build_index(str(source), str(tmp_path / "index"))
+    assert (tmp_path / "index").is_symlink()
+    assert len([p for p in tmp_path.iterdir() if p.name.startswith(".index-") and p.is_dir()]) == 2
+
+
+def test_concurrent_opens_build_once(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.knowledge import index as knowledge_index
+
+    source = tmp_path / "products.md"
+    source.write_text(KNOWLEDGE)
+    (tmp_path / "index").mkdir()  # a directory left by an older layout is replaced
+    builds = []
+    build = knowledge_index.build_index
+    monkeypatch.setattr(knowledge_index, "build_index", lambda *args: builds.append(1) or build(*args))
+
+    with ThreadPoolExecutor(4) as pool:
+        indexes = list(pool.map(lambda _: open_index(str(source), str(tmp_path / "index")), range(4)))
+    assert len(builds) == 1
+    assert all(len(index.chunks) == 2 for index in indexes)
@@ -0,0 +1,65 @@
+# backend/tests/test_llm.py
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.llm import CancelToken, Cancelled, FakeBackend, OpenAIBackend, Route, RouteRule, Router
+
+
+def test_router_first_match_wins():
+    fast = Route(model="small", max_tokens=100)
+    local = Route(backend="local", model="local-model")
+    default = Route(model="large")
+    router = Router([
+        RouteRule(fast, action_type="*"),
+        RouteRule(local, context="Support", max_prompt_chars=1000),
+        RouteRule(default),
+    ])
+
+    assert router.select("Onboarding", action_type="create_lead") is fast
+    assert router.select("Support", prompt_chars=500) is local
+    assert router.select("Support", prompt_chars=5000) is default
+    assert router.select("Marketing") is default
+
+
+def test_fake_backend_is_deterministic():
+    backend = FakeBackend()
+    messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+    first = backend.complete(messages, model="m", max_tokens=10, temperature=0)
+    second = backend.complete(messages, model="m", max_tokens=10, temperature=0)
+    assert first == second
+    assert "Hi" in first.content
+
+
+def test_cancel_token_deadline_runs_callbacks():
+    token = CancelToken(timeout=0)
+    closed = []
+    token.on_cancel(lambda: closed.append(True))
+    assert token.cancelled and token.reason == "deadline"
+    assert closed == [True]
+    with pytest.raises(Cancelled):
+        token.raise_if_cancelled()
+
+
+def test_openai_backend_stops_streaming_when_cancelled():
+    backend = OpenAIBackend("test", api_key="key")
+    backend._client = MagicMock()
+    token = CancelToken()
+    chunk = MagicMock(model="gpt-4", usage=None, choices=[MagicMock(delta=MagicMock(content="partial"))])
+
+    def chunks():
+        yield chunk
+        token.cancel("disconnected")
+        yield chunk
+
+    stream = MagicMock()
+    stream.__iter__.return_value = chunks()
+    stream.__enter__.return_value = stream
+    backend._client.chat.completions.create.return_value = stream
+
+    with pytest.raises(Cancelled) as error:
+        backend.complete([{"role": "user", "content": "Hi"}], model="gpt-4", max_tokens=10, temperature=0, cancel=token)
+    assert error.value.reason == "disconnected"
+    stream.close.assert_called()
+    assert backend._client.chat.completions.create.call_args.kwargs["stream"] is True
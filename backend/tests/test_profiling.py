@@ -0,0 +1,70 @@
+# backend/tests/test_profiling.py
+
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import profiling
+from tests.conftest import TestingSessionLocal
+
+
+def make_app(tmp_path, **options):
+    app = FastAPI()
+
+    @app.get("/work")
+    def work():
+        db = TestingSessionLocal()
+        try:
+            with profiling.span("prompt"):
+                db.execute(text("SELECT 1")).scalar()
+                time.sleep(0.03)
+        finally:
+            db.close()
+        return {"ok": True}
+
+    store = profiling.ProfileStore(str(tmp_path), max_files=2)
+    profiling.install(app, profile_store=store, **options)
+    return app, store
+
+
+def test_authorized_header_profiles_request_with_spans_and_samples(tmp_path):
+    app, store = make_app(tmp_path, token="secret")
+    client = TestClient(app)
+
+    assert "x-profile-id" not in client.get("/work").headers
+    assert "x-profile-id" not in client.get("/work", headers={"X-Profile": "wrong"}).headers
+    response = client.get("/work", headers={"X-Profile": "secret"})
+
+    profile = store.load(response.headers["x-profile-id"])
+    assert (profile["method"], profile["path"], profile["status"]) == ("GET", "/work", 200)
+    assert {"endpoint", "prompt", "db"} <= set(profile["span_totals"])
+    assert any(span["detail"] == "SELECT 1" for span in profile["spans"] if span["name"] == "db")
+    assert profile["span_totals"]["prompt"]["duration_ms"] >= 30
+    assert any("work (test_profiling.py" in stack for stack in profile["samples"])
+    assert store.list_ids() == [profile["id"]]
+
+
+def test_sampling_rate_and_bounded_ring(tmp_path):
+    app, store = make_app(tmp_path, sample_rate=1.0)
+    client = TestClient(app)
+    ids = [client.get("/work").headers["x-profile-id"] for _ in range(3)]
+
+    assert store.list_ids() == sorted(ids, reverse=True)[:2]
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        name for profile_id in store.list_ids() for name in (f"{profile_id}.json", f"{profile_id}.summary.json")
+    )
+    summary = store.summary(store.list_ids()[0])
+    assert summary["path"] == "/work" and "samples" not in summary
+    assert store.load("../etc/passwd") is None
+
+
+def test_span_is_a_no_op_outside_profiled_requests():
+    assert profiling.span("llm") is profiling.span("db", "SELECT 1")
+
+
+def test_profile_routes_are_absent_when_profiling_is_off(client):
+    assert not profiling.PROFILING
+    assert client.get("/profiles/").status_code == 404
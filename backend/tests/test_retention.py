@@ -0,0 +1,102 @@
+# backend/tests/test_retention.py
+
+from datetime import datetime, timedelta, timezone
+
+from app import retention
+from app.models import Message, MessageArchive, MessageUsage, User
+
+OLD = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def add(db, user, id, parent_id=None, **flags):
+    if flags.get("is_deleted") or flags.get("is_edited"):
+        flags.setdefault("superseded_at", OLD)
+    db.add(Message(id=id, role="user" if parent_id is None else "assistant", content=f"m{id}", user_id=user.id,
+                   context="Support", parent_id=parent_id, timestamp=OLD, **flags))
+
+
+def test_purge_removes_superseded_rows_in_batches_and_keeps_referenced(db):
+    user = User(username="retained", email="retained@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    add(db, user, 1, is_deleted=True)
+    add(db, user, 2, parent_id=1, is_deleted=True)
+    add(db, user, 3, is_edited=True)
+    add(db, user, 4, parent_id=3)  # live reply still points at 3
+    add(db, user, 5)
+    db.add(MessageUsage(message_id=2, model="gpt-4"))
+    db.commit()
+
+    pauses = []
+    throttle = retention.Throttle(batch_size=1, max_batch_size=1, min_batch_size=1, sleep=pauses.append)
+    stats = retention.purge(db, cutoff=OLD + timedelta(days=1), mode="archive", throttle=throttle)
+
+    assert sorted(m.id for m in db.query(Message)) == [3, 4, 5]
+    assert sorted(a.id for a in db.query(MessageArchive)) == [1, 2]
+    assert db.query(MessageUsage).count() == 0
+    assert (stats.purged, stats.kept_referenced, stats.batches, stats.finished) == (2, 1, 2, True)
+    assert len(pauses) == 2
+
+
+def test_throttle_adapts_batch_size_to_latency():
+    throttle = retention.Throttle(batch_size=100, max_batch_size=200, min_batch_size=10, target_ms=100,
+                                  sleep_ratio=0.5, sleep=lambda seconds: None)
+    assert throttle.after_batch(0.4) == 0.2
+    assert throttle.batch_size == 50
+    throttle.after_batch(0.01)
+    assert throttle.batch_size == 62
+
+
+def test_expired_idempotency_keys_are_purged_for_every_user(db):
+    from app.models import IdempotencyKey
+    now = datetime.utcnow()
+    for user_id, name in ((1, "quiet"), (2, "active")):
+        db.add(User(id=user_id, username=name, email=f"{name}@example.com", hashed_password="x"))
+    db.commit()
+    for user_id, key, expires in ((1, "a", now - timedelta(days=2)), (1, "b", now - timedelta(hours=1)),
+                                  (2, "c", now - timedelta(minutes=5)), (2, "d", now + timedelta(hours=1))):
+        db.add(IdempotencyKey(user_id=user_id, key=key, fingerprint="f", locked_at=now, expires_at=expires))
+    db.commit()
+
+    throttle = retention.Throttle(batch_size=2, max_batch_size=2, min_batch_size=2, sleep=lambda seconds: None)
+    assert retention.purge_idempotency_keys(db, throttle=throttle) == 3
+    assert [key.key for key in db.query(IdempotencyKey)] == ["d"]
+
+
+def test_retention_counts_from_when_a_message_was_superseded(db):
+    user = User(username="tombstones", email="tombstones@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    add(db, user, 1, is_deleted=True, superseded_at=datetime.now(timezone.utc) - timedelta(days=1))
+    add(db, user, 2, is_edited=True)
+    db.commit()
+
+    stats = retention.purge(db, cutoff=datetime.now(timezone.utc) - timedelta(days=30))
+    assert [m.id for m in db.query(Message)] == [1]
+    assert stats.purged == 1
+
+
+def test_stop_waits_for_the_batch_in_progress(monkeypatch):
+    import asyncio
+    import threading
+    import time
+
+    started, finished = threading.Event(), []
+
+    def run(stop):
+        started.set()
+        while not stop.is_set():
+            time.sleep(0.01)
+        time.sleep(0.05)  # the batch in progress
+        finished.append(True)
+
+    monkeypatch.setattr(retention, "run", run)
+
+    async def start_and_stop():
+        task = retention.RetentionTask(interval_hours=1e-6)
+        await task.start()
+        await asyncio.to_thread(started.wait, 5)
+        await task.stop()
+        return list(finished)
+
+    assert asyncio.run(start_and_stop()) == [True]
@@ -0,0 +1,67 @@
+# backend/tests/test_serve.py
+
+import asyncio
+import threading
+import time
+
+import anyio.to_thread
+
+from app import llm, serve
+
+
+def test_server_options_size_workers_from_cpus(monkeypatch):
+    monkeypatch.setattr(serve, "WEB_CONCURRENCY", 0)
+    monkeypatch.setattr(serve, "cpu_count", lambda: 6)
+    options = serve.server_options()
+    assert options["workers"] == 6
+    assert options["loop"] in ("uvloop", "asyncio")
+    assert options["http"] in ("httptools", "h11")
+    assert options["timeout_graceful_shutdown"] == serve.SHUTDOWN_DRAIN_SECONDS
+    assert serve.server_options(workers=2)["workers"] == 2
+    assert options["forwarded_allow_ips"] == "127.0.0.1"
+
+
+def test_multi_worker_warnings_name_process_local_backends(monkeypatch):
+    from app import database, events, history
+
+    monkeypatch.setattr(events, "EVENT_BROKER", "redis")
+    monkeypatch.setattr(history, "HISTORY_CACHE_BACKEND", "local")
+    monkeypatch.setattr(database, "DATABASE_REPLICA_URLS", ["postgresql://replica/db"])
+    monkeypatch.setattr(database, "REPLICA_STICKY_BACKEND", "local")
+    warnings = serve.multi_worker_warnings()
+    assert [warning.split("=")[0] for warning in warnings] == ["HISTORY_CACHE_BACKEND", "REPLICA_STICKY_BACKEND"]
+
+    monkeypatch.setattr(history, "HISTORY_CACHE_BACKEND", "redis")
+    monkeypatch.setattr(database, "REPLICA_STICKY_BACKEND", "redis")
+    assert serve.multi_worker_warnings() == []
+
+
+def test_size_threadpool_sets_the_loop_limiter():
+    async def resize():
+        serve.size_threadpool(7)
+        return anyio.to_thread.current_default_thread_limiter().total_tokens
+
+    assert anyio.run(resize) == 7
+
+
+def test_drain_waits_for_running_generations():
+    started = threading.Event()
+
+    def generate():
+        with llm.generations.track():
+            started.set()
+            time.sleep(0.1)
+
+    worker = threading.Thread(target=generate)
+    worker.start()
+    started.wait()
+    assert llm.generations.count == 1
+    assert asyncio.run(serve.drain_generations(timeout=5)) is True
+    assert llm.generations.count == 0
+    worker.join()
+
+
+def test_wait_idle_times_out():
+    with llm.generations.track():
+        assert llm.generations.wait_idle(timeout=0.05) is False
+    assert llm.generations.wait_idle(timeout=0) is True
@@ -0,0 +1,81 @@
+# backend/tests/test_sharding.py
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.models import User, Message, UserShard, ConversationVersion
+from app.sharding import HashRing, ShardRouter
+
+
+def test_hash_ring_is_stable_when_a_node_is_added():
+    before = HashRing(["shard0", "shard1"])
+    after = HashRing(["shard0", "shard1", "shard2"])
+    keys = range(2000)
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    # Only keys taken over by the new node move, roughly a third of them
+    assert all(after.node_for(key) == "shard2" for key in moved)
+    assert 400 < len(moved) < 1000
+
+
+def test_move_user_between_shards(tmp_path):
+    directory = create_engine(f"sqlite:///{tmp_path}/directory.db")
+    Base.metadata.create_all(directory, tables=[User.__table__, UserShard.__table__])
+    shards = {name: create_engine(f"sqlite:///{tmp_path}/{name}.db") for name in ("a", "b")}
+    router = ShardRouter(shards, directory)
+    for name in shards:
+        router.create_schema(name)
+
+    directory_db = Session(bind=directory)
+    user = User(username="sharded", email="sharded@example.com", hashed_password="x")
+    directory_db.add(user)
+    directory_db.add(UserShard(user_id=1, shard="a"))
+    directory_db.commit()
+    assert router.shard_for_user(directory_db, user.id) == "a"
+
+    db = router.session("a")
+    question = Message(role="user", content="Hi", user_id=user.id, context="Support")
+    db.add(question)
+    db.flush()
+    db.add(Message(role="assistant", content="Hello", user_id=user.id, context="Support", parent_id=question.id))
+    db.add(ConversationVersion(user_id=user.id, context="Support", version=2))
+    db.commit()
+    # The directory table resolves to the directory database from a shard session
+    assert db.query(User).filter(User.id == user.id).one().username == "sharded"
+    db.close()
+
+    assert router.move_user(directory_db, user.id, "b", grace_seconds=0) == 3
+    assert directory_db.get(UserShard, user.id).shard == "b"
+    with router.session("a") as old, router.session("b") as new:
+        assert old.query(func.count(Message.id)).scalar() == 0
+        moved = new.query(Message).order_by(Message.id).all()
+        assert [m.content for m in moved] == ["Hi", "Hello"]
+        assert moved[1].parent_id == moved[0].id
+
+
+def test_commit_is_rejected_once_the_user_has_moved(tmp_path):
+    import pytest
+    from app.sharding import ShardMovingError
+
+    directory = create_engine(f"sqlite:///{tmp_path}/directory.db")
+    Base.metadata.create_all(directory, tables=[User.__table__, UserShard.__table__])
+    shards = {name: create_engine(f"sqlite:///{tmp_path}/{name}.db") for name in ("a", "b")}
+    router = ShardRouter(shards, directory)
+    for name in shards:
+        router.create_schema(name)
+    directory_db = Session(bind=directory)
+    directory_db.add(User(username="mover", email="mover@example.com", hashed_password="x"))
+    directory_db.commit()
+    shard = router.shard_for_user(directory_db, 1)
+    assert directory_db.get(UserShard, 1).shard == shard
+
+    # A request that started before the move commits its reply afterwards
+    db = router.session(shard, user_id=1)
+    db.add(Message(role="user", content="Hi", user_id=1, context="Support"))
+    db.commit()
+    db.add(Message(role="assistant", content="Late reply", user_id=1, context="Support"))
+    router.move_user(directory_db, 1, "b" if shard == "a" else "a", grace_seconds=0)
+    with pytest.raises(ShardMovingError):
+        db.commit()
+    db.close()
+    with router.session(shard) as old:
+        assert old.query(func.count(Message.id)).scalar() == 0